@@ -0,0 +1,265 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+
+# ---------- ADMISSION CONTROL FOR THE LOCAL OLLAMA SERVER ----------
+
+# A single local model server thrashes when every session's request is sent to
+# it at once, and the queueing then happens inside it where we can't see it.
+# Requests wait here instead:
+#
+#   - at most max_in_flight units are sent to the server at a time
+#   - waiting requests are queued per session and admitted round-robin, so one
+#     chatty session can't starve the others
+#   - micro-batching (batch_window > 0): short prompts (<= batch_max_chars) that
+#     arrive within batch_window of each other are admitted together, up to
+#     batch_size per unit, so they share the server's parallel decode slots
+#     (OLLAMA_NUM_PARALLEL should be >= batch_size). Ollama's chat API takes one
+#     conversation per request, so a unit is still several HTTP requests.
+#   - queue depth and in-flight units are exported on /metrics, wait time as the
+#     admission_wait stage
+#
+# The session a request belongs to comes from the current_session context var
+# (set per turn by app.run_turn).
+#
+# config keys used (all optional):
+#
+#   "ollama_admission_enabled": True,
+#   "ollama_max_in_flight": 2,
+#   "ollama_max_queue": 64,
+#   "ollama_queue_timeout": 60.0,
+#   "ollama_batch_window": 0.0,          # seconds, 0 = no micro-batching
+#   "ollama_batch_max_chars": 400,
+#   "ollama_batch_size": 4,
+
+current_session: ContextVar[str] = ContextVar("current_session", default="")
+
+
+class AdmissionRejected(RuntimeError):
+    pass
+
+
+class _Unit:
+    __slots__ = ("members",)
+
+    def __init__(self):
+        self.members = 0
+
+
+class _Ticket:
+    __slots__ = ("session_id", "short", "future", "enqueued_at", "unit")
+
+    def __init__(self, session_id: str, short: bool, future: "asyncio.Future[None]"):
+        self.session_id = session_id
+        self.short = short
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.unit: Optional[_Unit] = None
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        name: str = "ollama",
+        max_in_flight: int = 2,
+        max_queue: int = 64,
+        queue_timeout: Optional[float] = 60.0,
+        batch_window: float = 0.0,
+        batch_max_chars: int = 400,
+        batch_size: int = 4,
+    ):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.batch_window = batch_window
+        self.batch_max_chars = batch_max_chars
+        self.batch_size = batch_size
+        # session_id -> its waiting tickets; the order of the keys is the round-robin order
+        self._queues: "OrderedDict[str, Deque[_Ticket]]" = OrderedDict()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.queued = 0
+        # live short tickets among the queued ones
+        self.queued_short = 0
+        self.units_in_flight = 0
+        self.requests_in_flight = 0
+        self.admitted = 0
+        self.batched = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_queue_seen = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "AdmissionController":
+        return cls(
+            max_in_flight=config.get("ollama_max_in_flight", 2),
+            max_queue=config.get("ollama_max_queue", 64),
+            queue_timeout=config.get("ollama_queue_timeout", 60.0),
+            batch_window=config.get("ollama_batch_window", 0.0),
+            batch_max_chars=config.get("ollama_batch_max_chars", 400),
+            batch_size=config.get("ollama_batch_size", 4),
+        )
+
+    @asynccontextmanager
+    async def slot(self, prompt_chars: int = 0, session_id: Optional[str] = None) -> AsyncIterator[None]:
+        """
+        Wait for the controller to admit this request, hold the slot while it runs.
+        Raises AdmissionRejected if the queue is full or the wait times out.
+        """
+        from metrics import metrics
+
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(f"{self.name} is overloaded ({self.queued} requests waiting)")
+
+        session_id = session_id if session_id is not None else current_session.get()
+        short = self.batch_window > 0 and prompt_chars <= self.batch_max_chars
+        ticket = _Ticket(session_id, short, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(session_id, deque()).append(ticket)
+        self.queued += 1
+        self.queued_short += short
+        self.max_queue_seen = max(self.max_queue_seen, self.queued)
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(ticket)
+            self.timed_out += 1
+            raise AdmissionRejected(f"Timed out waiting for {self.name} after {self.queue_timeout}s")
+        except asyncio.CancelledError:
+            self._abandon(ticket)
+            raise
+
+        metrics.observe("admission_wait", time.monotonic() - ticket.enqueued_at, self.name)
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def _abandon(self, ticket: _Ticket) -> None:
+        if ticket.unit is not None:
+            # admitted just as we gave up: hand the slot back
+            self._release(ticket)
+            return
+        ticket.future.cancel()
+        # the ticket itself is skipped lazily by _dispatch
+        self.queued -= 1
+        self.queued_short -= ticket.short
+
+    def _release(self, ticket: _Ticket) -> None:
+        unit = ticket.unit
+        ticket.unit = None
+        if unit is None:
+            return
+        self.requests_in_flight -= 1
+        unit.members -= 1
+        if unit.members == 0:
+            self.units_in_flight -= 1
+            self._dispatch()
+
+    def _pop_next(self, short: Optional[bool] = None) -> Optional[_Ticket]:
+        """
+        Next live ticket in round-robin session order (optionally only short or
+        only long prompts; a session is skipped if the ticket at its head is not
+        of that kind).
+        """
+        for session_id in list(self._queues):
+            queue = self._queues[session_id]
+            while queue and queue[0].future.done():
+                queue.popleft()  # abandoned
+            if not queue:
+                del self._queues[session_id]
+                continue
+            if short is not None and queue[0].short != short:
+                continue
+            ticket = queue.popleft()
+            # this session goes to the back of the line
+            if queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            self.queued -= 1
+            self.queued_short -= ticket.short
+            return ticket
+        return None
+
+    def _hold(self, ticket: _Ticket) -> None:
+        # back to the front of the line, its session first in the round-robin order
+        self._queues.setdefault(ticket.session_id, deque()).appendleft(ticket)
+        self._queues.move_to_end(ticket.session_id, last=False)
+        self.queued += 1
+        self.queued_short += 1
+
+    def _admit(self, ticket: _Ticket, unit: _Unit) -> None:
+        ticket.unit = unit
+        unit.members += 1
+        self.requests_in_flight += 1
+        self.admitted += 1
+        ticket.future.set_result(None)
+
+    def _dispatch(self) -> None:
+        # once short prompts are held for the batch window, only long ones go past them
+        holding = False
+        while self.units_in_flight < self.max_in_flight:
+            ticket = self._pop_next(False if holding else None)
+            if ticket is None:
+                return
+
+            unit = _Unit()
+            if ticket.short:
+                waited = time.monotonic() - ticket.enqueued_at
+                if waited < self.batch_window and self.queued_short + 1 < self.batch_size:
+                    # wait a little for more short prompts to share the unit
+                    self._hold(ticket)
+                    self._schedule(self.batch_window - waited)
+                    holding = True
+                    continue
+                self._admit(ticket, unit)
+                while unit.members < self.batch_size:
+                    companion = self._pop_next(short=True)
+                    if companion is None:
+                        break
+                    self._admit(companion, unit)
+                    self.batched += 1
+            else:
+                self._admit(ticket, unit)
+            self.units_in_flight += 1
+
+    def _schedule(self, delay: float) -> None:
+        if self._timer is not None:
+            return
+
+        def fire() -> None:
+            self._timer = None
+            self._dispatch()
+
+        self._timer = asyncio.get_running_loop().call_later(max(delay, 0.0), fire)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.queued,
+            "max_queued": self.max_queue_seen,
+            "sessions_waiting": len(self._queues),
+            "units_in_flight": self.units_in_flight,
+            "requests_in_flight": self.requests_in_flight,
+            "admitted": self.admitted,
+            "batched": self.batched,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    def prometheus_lines(self) -> List[str]:
+        label = f'backend="{self.name}"'
+        return [
+            "# TYPE companion_admission_queue_depth gauge",
+            f"companion_admission_queue_depth{{{label}}} {self.queued}",
+            "# TYPE companion_admission_in_flight gauge",
+            f"companion_admission_in_flight{{{label}}} {self.requests_in_flight}",
+            "# TYPE companion_admission_rejected_total counter",
+            f"companion_admission_rejected_total{{{label}}} {self.rejected + self.timed_out}",
+        ]
@@ -1,16 +1,75 @@
-import json
+import asyncio
+import functools
+import time
 from uuid import uuid4
-from typing import Dict, Any
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from contextlib import asynccontextmanager
+from fastapi import Body, FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 import uvicorn
 
+from admission import current_session
+from audio import AudioBuffer, AudioFormat, AudioTooLarge, encode_for_upstream
+from audio_codec import available_codecs, new_decoder
 from connection_manager import ConnectionManager
 from config import config
-from llm_utils import chat_simple
+from live_session import LiveAudioPipe, LiveSession, LiveSessionManager
+from metrics import metrics
+from heartbeat import Heartbeats
+from history import HistoryStore
+from llm_utils import (
+    CallTimer,
+    call_hooks,
+    chat_messages,
+    chat_simple,
+    connect_live,
+    get_admission,
+    get_prompt_cache,
+    get_registry,
+    get_response_cache,
+    get_router,
+    stream_messages,
+    warm_up,
+)
+from protocol import OUTPUT_MODES, Codec, ProtocolError, negotiate
+from ratelimit import RateLimiter, Usage, current_usage
+from recorder import TrafficRecorder
+from resume import ResumeStore, resume_request
+from session import Job, Session
+from session_router import create_router
+from suggestions import SUGGESTION_SYSTEM_PROMPT, SuggestionEngine
+from utils import coalesce_deltas
+from vad import VadGate, trim_in_place
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await manager.start()
+    await warm_up(config)
+    metrics.start_profiler()
+    if prompt_cache is not None:
+        prompt_cache.start()
+    if recorder is not None:
+        recorder.start()
+    if heartbeats is not None:
+        heartbeats.start()
+    try:
+        yield
+    finally:
+        for task in list(background_tasks):
+            task.cancel()
+        if heartbeats is not None:
+            heartbeats.stop()
+        if prompt_cache is not None:
+            await prompt_cache.stop()
+        metrics.stop_profiler()
+        await manager.stop()
+        if recorder is not None:
+            await asyncio.to_thread(recorder.stop)
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow your frontend origin(s)
 app.add_middleware(
@@ -21,110 +80,979 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-manager = ConnectionManager()
+metrics.configure(config)
+
+# Sessions are owned by the worker holding the socket; the router reaches the others
+manager = ConnectionManager(
+    create_router(config),
+    send_queue_size=config.get("send_queue_size", 256),
+    slow_consumer_policy=config.get("slow_consumer_policy", "close"),
+    replay_max_frames=config.get("replay_max_frames", 512) if config.get("resume_enabled", True) else 0,
+    replay_max_bytes=config.get("replay_max_bytes", 1_000_000),
+)
+
+
+def end_session(session_id: str, session: Session) -> None:
+    manager.disconnect(session_id)
+    session.close()
+
+
+# Sessions whose socket dropped wait resume_grace seconds for their client to come back
+resumer = ResumeStore.from_config(config, end_session) if config.get("resume_enabled", True) else None
+if resumer is not None:
+    manager.disconnect_hooks.append(resumer.forget)
+
+# One persistent Gemini Live connection per /ws session, closed on disconnect
+live_sessions = LiveSessionManager(
+    lambda system_prompt, modalities: connect_live(
+        config, system_prompt=system_prompt, response_modalities=modalities,
+    ),
+    turn_timeout=config.get("live_turn_timeout", 60.0),
+)
+manager.disconnect_hooks.append(live_sessions.discard)
+
+# Per-session conversation memory for the non-live backends
+history = HistoryStore.from_config(config)
+manager.disconnect_hooks.append(history.discard)
+
+
+
+# Opt-in capture of sessions (frames in and out, upstream calls) for offline replay
+recorder = TrafficRecorder.from_config(config) if config.get("record_enabled", False) else None
+if recorder is not None:
+    manager.send_hooks.append(recorder.outbound)
+    call_hooks.append(recorder.call)
+
+# Request, byte and upstream token budgets per session, per client address and overall
+limiter = RateLimiter.from_config(config) if config.get("rate_limit_enabled", True) else None
+if limiter is not None:
+    manager.disconnect_hooks.append(limiter.close)
+
+# Server-driven heartbeats and idle reaping, on one timer for all connections
+heartbeats = (
+    Heartbeats.from_config(config, manager)
+    if config.get("heartbeat_interval", 0) or config.get("idle_timeout", 0) else None
+)
+if heartbeats is not None:
+    manager.disconnect_hooks.append(heartbeats.forget)
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    # Wait for the first message to create session_id
-    session_id = str(uuid4())
 
+async def suggestion_chat(session_id: str, messages: List[Dict[str, str]]) -> str:
+    current_session.set(session_id)
+    usage = Usage()
+    current_usage.set(usage)
     try:
-        await manager.connect(websocket, session_id)
+        return await chat_messages(
+            backend=config.get("suggestion_backend", "gemini"),
+            config=config,
+            messages=messages,
+        )
+    finally:
+        if limiter is not None:
+            limiter.record_usage(session_id, usage)
+
+
+# Proactive `suggestion` events from the companion's `context` events
+suggestions = (
+    SuggestionEngine.from_config(config, suggestion_chat, manager.send_json)
+    if config.get("suggestions_enabled", True) else None
+)
+if suggestions is not None:
+    manager.disconnect_hooks.append(suggestions.discard)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Summarize the conversation below in a few sentences, keeping names, facts "
+    "and open questions. Reply with the summary only."
+)
+
+SYSTEM_PROMPT = config.get("system_prompt", "You are a helpful assistant.")
+LIVE_SYSTEM_PROMPT = config.get("live_system_prompt", "You are a helpful audio assistant.")
+
+# The fixed system prompts are cached upstream once instead of being resent every turn
+prompt_cache = get_prompt_cache(config)
+if prompt_cache is not None:
+    for prompt in (SYSTEM_PROMPT, LIVE_SYSTEM_PROMPT, SUMMARY_SYSTEM_PROMPT, SUGGESTION_SYSTEM_PROMPT):
+        prompt_cache.register(prompt)
+
+# What clients send unless they declare otherwise, and what the model takes natively
+DEFAULT_AUDIO_FORMAT = AudioFormat(**config.get("audio_input_format", {}))
+UPSTREAM_AUDIO_FORMAT = AudioFormat("pcm_s16le", config.get("audio_upstream_rate", 16000), 1)
+# What native-audio models answer in
+OUTPUT_AUDIO_FORMAT = AudioFormat("pcm_s16le", config.get("audio_output_rate", 24000), 1)
+
+
+def use_live_sessions(backend: str) -> bool:
+    return backend == "gemini-live" and config.get("live_sessions", True)
+
+
+async def send_stream(
+    session_id: str,
+    message_id: str,
+    deltas: AsyncIterator[str],
+    extra: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Send text chunks as coalesced `response_delta` frames, then `response_end`
+    (with `extra` fields). Returns the full text.
+    """
+    chunks = []
+    deltas = coalesce_deltas(
+        deltas,
+        min_chars=config.get("stream_min_chars", 32),
+        max_delay=config.get("stream_max_delay", 0.05),
+    )
+    try:
+        async for delta in deltas:
+            chunks.append(delta)
+            await manager.send_json(session_id, {
+                "type": "response_delta",
+                "text": delta,
+                "session_id": session_id,
+                "message_id": message_id,
+            })
+    finally:
+        # releases the upstream stream now, even when the turn is cancelled mid-send
+        await deltas.aclose()
+
+    text = "".join(chunks)
+    await manager.send_json(session_id, {
+        "type": "response_end",
+        "text": text,
+        "session_id": session_id,
+        "message_id": message_id,
+        **(extra or {}),
+    })
+    return text
+
+
+# Fire-and-forget work (history summaries). The event loop only keeps weak
+# references to tasks, so they are held here until they finish.
+background_tasks: Set["asyncio.Task[None]"] = set()
+
+
+def run_in_background(coro: Awaitable[None]) -> None:
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_background_done)
+
+
+def _background_done(task: "asyncio.Task[None]") -> None:
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Error in background task: {task.exception()!r}")
+
 
-        # Let the client know the session_id
+async def summarize_history(session_id: str, backend: str) -> None:
+    """
+    Fold the turns that fell out of the session's history into its rolling summary.
+    """
+    summary, turns = history.take_for_summary(session_id)
+    if not turns:
+        return
+    transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    if summary:
+        transcript = f"Earlier summary: {summary}\n\n{transcript}"
+    try:
+        new_summary = await chat_simple(
+            backend=backend,
+            config=config,
+            user_text=transcript,
+            system_prompt=SUMMARY_SYSTEM_PROMPT,
+        )
+    except Exception as e:
+        print(f"Error summarizing history for {session_id}: {e}")
+        return
+    history.set_summary(session_id, new_summary.strip())
+
+
+async def respond(
+    session_id: str,
+    message_id: str,
+    stream: bool,
+    backend: str,
+    user_text: str,
+    system_prompt: Optional[str] = None,
+    **chat_kwargs: Any,
+) -> None:
+    """
+    Run one chat turn and send the answer to the client, either as a single
+    `response` frame or as coalesced `response_delta` frames + `response_end`.
+    The prompt carries the session's recent history (within the token budget);
+    its size, and the system-prompt tokens sent inline / served from a cache,
+    are reported as `prompt` on the final frame.
+    """
+    use_history = config.get("history_enabled", True)
+    if use_history:
+        messages, prompt_stats = history.build_messages(session_id, system_prompt, user_text)
+    else:
+        messages = [{"role": "user", "content": user_text}]
+        if system_prompt:
+            messages.insert(0, {"role": "system", "content": system_prompt})
+        prompt_stats = {}
+    extra = {"prompt": prompt_stats}
+
+    if not stream:
+        response = await chat_messages(backend=backend, config=config, messages=messages, **chat_kwargs)
+        prompt_stats.update(prefix_stats())
         await manager.send_json(session_id, {
-            "type": "session_started",
+            "type": "response",
+            "text": response,
             "session_id": session_id,
+            "message_id": message_id,
+            **extra,
         })
+    else:
+        deltas = stream_messages(backend=backend, config=config, messages=messages, **chat_kwargs)
+        response = await send_stream(session_id, message_id, with_prefix_stats(deltas, prompt_stats), extra)
+
+    if use_history:
+        # audio itself isn't kept, only a marker that the user spoke
+        history.add(session_id, "user", "(voice message)" if chat_kwargs.get("audio_data") else user_text)
+        history.add(session_id, "assistant", response)
+        if history.needs_summary(session_id):
+            run_in_background(summarize_history(session_id, backend))
+
+
+def prefix_stats() -> Dict[str, int]:
+    """
+    System-prompt tokens the current turn has sent inline / referenced from a cache,
+    and the input tokens the upstream reported as served from its cache.
+    """
+    usage = current_usage.get()
+    if usage is None:
+        return {}
+    return {
+        "prefix_tokens_sent": usage.prefix_sent,
+        "prefix_tokens_cached": usage.prefix_cached,
+        "cached_tokens": usage.cached_tokens,
+    }
+
+
+async def with_prefix_stats(deltas: AsyncIterator[str], prompt_stats: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    Pass deltas through, then add prefix_stats() to prompt_stats (before response_end goes out).
+    """
+    async for delta in deltas:
+        yield delta
+    prompt_stats.update(prefix_stats())
+
+
+def live_modalities(output_mode: str) -> Optional[List[str]]:
+    """
+    Response modalities for a session's Live connection (None = the configured ones).
+    """
+    # native-audio models speak; the text then comes from the output transcription
+    return ["AUDIO"] if output_mode in ("audio", "both") else None
+
+
+class AudioOut:
+    """
+    Model audio for one reply, forwarded to the client as numbered chunks:
+    audio_start (JSON), the chunks (binary frames), audio_end (JSON).
+    """
+
+    __slots__ = ("session_id", "message_id", "stream_id", "seq", "bytes", "started", "first_audio")
+
+    _next_stream_id = 0
+
+    def __init__(self, session_id: str, message_id: str):
+        self.session_id = session_id
+        self.message_id = message_id
+        AudioOut._next_stream_id = (AudioOut._next_stream_id + 1) % 65536
+        self.stream_id = AudioOut._next_stream_id
+        self.seq = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.first_audio: Optional[float] = None
+
+    async def send(self, chunk: bytes) -> None:
+        if self.first_audio is None:
+            self.first_audio = time.perf_counter() - self.started
+            metrics.observe("first_audio", self.first_audio, "gemini-live")
+            await manager.send_json(self.session_id, {
+                "type": "audio_start",
+                "session_id": self.session_id,
+                "message_id": self.message_id,
+                "stream_id": self.stream_id,
+                "format": OUTPUT_AUDIO_FORMAT.to_dict(),
+                "time_to_first_audio_ms": round(self.first_audio * 1000, 1),
+            })
+        manager.send_audio(self.session_id, self.stream_id, self.seq, chunk)
+        self.seq += 1
+        self.bytes += len(chunk)
+
+    async def finish(self, transcript: str) -> None:
+        if self.first_audio is None:
+            return
+        await manager.send_json(self.session_id, {
+            "type": "audio_end",
+            "session_id": self.session_id,
+            "message_id": self.message_id,
+            "stream_id": self.stream_id,
+            "chunks": self.seq,
+            "bytes": self.bytes,
+            "transcript": transcript,
+        })
+
+
+async def respond_live(
+    session_id: str,
+    message_id: str,
+    stream: bool,
+    user_text: Optional[str] = None,
+    audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/pcm;rate=16000",
+    output_mode: str = "text",
+    live: Optional[LiveSession] = None,
+    **_: Any,
+) -> None:
+    """
+    One turn on the session's persistent Gemini Live connection.
+    Audio that was already piped in during ingest only needs its reply read back,
+    from the connection it went into (`live`).
+    Depending on output_mode the reply goes out as text frames, audio chunks, or both.
+    """
+    if live is None:
+        live = await live_sessions.get(session_id, LIVE_SYSTEM_PROMPT, live_modalities(output_mode))
+    elif live.closed:
+        # closed (or replaced) since the utterance went in: its reply is lost
+        raise RuntimeError("The live connection closed before the reply to this utterance")
+    audio_out = AudioOut(session_id, message_id) if output_mode in ("audio", "both") else None
+    transcript: List[str] = []
+    # the turn as an upstream call, for the call hooks (e.g. the traffic recorder)
+    timer = None
+    if call_hooks:
+        timer = CallTimer("gemini-live", None, [{"role": "user", "content": user_text or ""}], audio_data)
+    try:
+        if audio_data:
+            await live.send_audio(audio_data, audio_mime_type)
+            await live.end_audio()
+        if user_text:
+            await live.send_text(user_text)
+
+        async def texts() -> AsyncIterator[str]:
+            # audio chunks are forwarded as they arrive, text goes on to the caller
+            async for event in live.receive_turn():
+                if timer is not None and (event.text or event.audio):
+                    timer.chunk(event.text or "")
+                if event.audio and audio_out is not None:
+                    await audio_out.send(event.audio)
+                if event.text:
+                    transcript.append(event.text)
+                    yield event.text
+
+        if output_mode == "audio":
+            async for _ in texts():
+                pass
+        elif stream:
+            await send_stream(session_id, message_id, texts())
+        else:
+            response = "".join([text async for text in texts()])
+            await manager.send_json(session_id, {
+                "type": "response",
+                "text": response,
+                "session_id": session_id,
+                "message_id": message_id,
+            })
+
+        if audio_out is not None:
+            await audio_out.finish("".join(transcript))
+        if timer is not None:
+            timer.done()
+    except BaseException as e:
+        # cancelled or failed mid-turn: the connection's state is unknown, start fresh next time
+        live_sessions.discard(session_id)
+        if timer is not None:
+            timer.done(e)
+        raise
+
+
+async def run_turn(
+    session_id: str,
+    message_id: str,
+    stream: bool,
+    output_mode: str = "text",
+    **chat_kwargs: Any,
+) -> None:
+    """
+    Worker-side body of a job: one chat turn, with backend errors reported to the client.
+    output_mode only applies to live sessions; the other backends answer in text.
+    """
+    start = time.perf_counter()
+    # lets the ollama admission queue be fair per session
+    current_session.set(session_id)
+    # the backends report the tokens they used into it
+    usage = Usage()
+    current_usage.set(usage)
+    try:
+        if use_live_sessions(chat_kwargs.get("backend", "")):
+            await respond_live(session_id, message_id, stream, output_mode=output_mode, **chat_kwargs)
+        else:
+            await respond(session_id, message_id, stream, **chat_kwargs)
+    except Exception as e:
+        await manager.send_json(session_id, {
+            "type": "error",
+            "message": str(e),
+            "session_id": session_id,
+            "message_id": message_id,
+        })
+    finally:
+        if limiter is not None:
+            limiter.record_usage(session_id, usage)
+        metrics.turn_finished(start, {
+            "backend": chat_kwargs.get("backend", ""),
+            "session_id": session_id,
+            "message_id": message_id,
+        })
+
+
+def vad_params() -> Optional[Dict[str, Any]]:
+    """
+    Keyword arguments for vad.trim_in_place / vad.VadGate, or None if VAD is off.
+    """
+    if not config.get("vad_enabled", True):
+        return None
+    return {
+        "frame_ms": config.get("vad_frame_ms", 20),
+        "energy_db": config.get("vad_energy_db", -45.0),
+        "padding_ms": config.get("vad_padding_ms", 200),
+        "max_pause_ms": config.get("vad_max_pause_ms"),
+    }
+
+
+async def send_no_speech(session_id: str, stats: Dict[str, Any]) -> None:
+    await manager.send_json(session_id, {
+        "type": "status",
+        "status": "no_speech",
+        "session_id": session_id,
+        **stats,
+    })
+
+
+async def submit_buffered_audio(session: Session, stats: Dict[str, Any]) -> None:
+    """
+    Finish the utterance held in session.audio: trim silence in place, convert it
+    into what the audio backend takes (one copy: raw PCM at the native rate for
+    live sessions, WAV for generate_content) and queue it as a turn.
+    """
+    audio = session.audio
+    fmt = session.audio_format.decoded
+    params = vad_params()
+    if params and fmt.is_pcm:
+        stats["vad_removed_bytes"] = trim_in_place(audio, fmt.sample_rate, fmt.channels, **params)
 
+    audio_data = audio.finish()
+    if not audio_data:
+        await send_no_speech(session.session_id, stats)
+        return
+
+    container = "pcm" if use_live_sessions("gemini-live") else "wav"
+    payload, mime_type = encode_for_upstream(audio_data, fmt, UPSTREAM_AUDIO_FORMAT.sample_rate, container)
+    stats["upstream_bytes"] = len(payload)
+    await submit_audio(session, payload, mime_type, stats)
+
+
+async def submit_audio(
+    session: Session,
+    audio_data: Optional[bytes],
+    audio_mime_type: Optional[str],
+    stats: Dict[str, Any],
+    live: Optional[LiveSession] = None,
+) -> None:
+    """
+    Queue a finished utterance as a gemini-live turn
+    (audio_data is None when it was already piped into the live session `live`).
+    """
+    session_id = session.session_id
+    message_id = str(uuid4())
+
+    await manager.send_json(session_id, {
+        "type": "status", 
+        "status": "processing_audio",
+        "session_id": session_id,
+        "message_id": message_id,
+        **stats,
+    })
+
+    # Use gemini-live for audio
+    chat_kwargs: Dict[str, Any] = {
+        "backend": "gemini-live",
+        "audio_data": audio_data,
+        "audio_mime_type": audio_mime_type,
+        "system_prompt": LIVE_SYSTEM_PROMPT,
+    }
+    if live is not None:
+        chat_kwargs["live"] = live
+    if not use_live_sessions("gemini-live"):
+        chat_kwargs["user_text"] = "Please respond to this audio."
+
+    job = Job(message_id, functools.partial(
+        run_turn,
+        session_id,
+        message_id,
+        config.get("stream_responses", False),
+        output_mode=session.output_mode,
+        **chat_kwargs
+    ))
+    await session.submit(job)
+
+
+async def within_limits(session: Session, requests: int = 0, nbytes: int = 0) -> bool:
+    """
+    Charge a request and/or bytes against the rate limits. When they refuse it,
+    the client gets a `rate_limited` frame and the caller drops the input.
+    """
+    if limiter is None:
+        return True
+    costs = [("bytes", nbytes)] if nbytes else []
+    if requests:
+        # a new request also waits out any upstream token debt
+        costs += [("requests", requests), ("tokens", 0)]
+    limited = limiter.check(session.session_id, costs)
+    if limited is None:
+        return True
+    frame = limited.to_dict()
+    frame["session_id"] = session.session_id
+    await manager.send_json(session.session_id, frame)
+    return False
+
+
+async def send_error(session_id: str, code: str, error: Exception) -> None:
+    await manager.send_json(session_id, {
+        "type": "error",
+        "code": code,
+        "message": str(error),
+        "session_id": session_id,
+    })
+
+
+@app.get("/stats")
+async def stats() -> Dict[str, Any]:
+    cache = get_response_cache(config)
+    router = get_router(config)
+    admission = get_admission(config)
+    return {
+        "sessions": len(manager.active_sessions),
+        "outbound": manager.stats(),
+        "router": manager.router.stats(),
+        "backend_pool": get_registry(config).stats(),
+        "history": history.stats(),
+        "response_cache": cache.stats() if cache is not None else None,
+        "backend_router": router.stats() if router is not None else None,
+        "ollama_admission": admission.stats() if admission is not None else None,
+        "suggestions": suggestions.stats() if suggestions is not None else None,
+        "rate_limits": limiter.stats() if limiter is not None else None,
+        "resume": resumer.stats() if resumer is not None else None,
+        "prompt_cache": prompt_cache.stats() if prompt_cache is not None else None,
+        "recorder": recorder.stats() if recorder is not None else None,
+        "heartbeats": heartbeats.stats() if heartbeats is not None else None,
+    }
+
+
+@app.get("/usage")
+async def usage_report(session_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Per-session accounting (requests, bytes, upstream tokens) of this worker's sessions.
+    """
+    if limiter is None:
+        raise HTTPException(status_code=404, detail="Rate limiting is disabled")
+    return limiter.usage(session_id)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> str:
+    """
+    Prometheus text format; empty unless "metrics_enabled" is set.
+    """
+    return metrics.render()
+
+
+if config.get("session_push_enabled", False):
+    @app.post("/sessions/{session_id}/events")
+    async def push_event(session_id: str, event: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
+        """
+        Out-of-band event (e.g. a proactive `suggestion`) for a session,
+        delivered by whichever worker owns its socket.
+        """
+        if not await manager.send_json(session_id, event):
+            raise HTTPException(status_code=404, detail="Unknown session")
+        return {"delivered": True, "session_id": session_id}
+
+
+# ---------- /ws MESSAGE HANDLERS ----------
+
+# One coroutine per native message type (see protocol.py for the dialects and
+# the validators that run before these).
+
+Handler = Callable[[Session, Dict[str, Any]], Awaitable[None]]
+
+
+def new_audio_decoder(fmt: AudioFormat):
+    # chunk codecs are decoded per utterance; PCM and whole files need nothing
+    return new_decoder(fmt.encoding, fmt.sample_rate, fmt.channels) if fmt.is_codec else None
+
+
+def session_audio(session: Session) -> AudioBuffer:
+    if session.audio is None:
+        session.audio = AudioBuffer(config.get("audio_max_bytes", 48000 * 60), config.get("audio_initial_bytes", 0))
+    return session.audio
+
+
+async def set_audio_format(session: Session, data: Dict[str, Any]) -> bool:
+    try:
+        session.audio_format = AudioFormat.from_message(data, session.audio_format)
+    except ValueError as e:
+        await send_error(session.session_id, "bad_audio_format", e)
+        return False
+    return True
+
+
+async def on_ping(session: Session, data: Dict[str, Any]) -> None:
+    await manager.send_json(session.session_id, {
+        "type": "pong",
+        "session_id": session.session_id,
+    })
+
+
+async def on_cancel(session: Session, data: Dict[str, Any]) -> None:
+    await session.cancel(data.get("message_id"))
+
+
+async def on_audio_format(session: Session, data: Dict[str, Any]) -> None:
+    if await set_audio_format(session, data):
+        await manager.send_json(session.session_id, {
+            "type": "audio_format",
+            "session_id": session.session_id,
+            "format": session.audio_format.to_dict(),
+            "upstream": UPSTREAM_AUDIO_FORMAT.to_dict(),
+        })
+
+
+async def on_audio_start(session: Session, data: Dict[str, Any]) -> None:
+    if "encoding" in data and not await set_audio_format(session, data):
+        return
+    audio = session_audio(session)
+    session.audio_pipe = None
+    session.audio_decoder = new_audio_decoder(session.audio_format)
+    if not await within_limits(session, requests=1):
+        # the utterance is ignored up to its audio_end
+        audio.start(store=False)
+        audio.abort()
+        return
+    if use_live_sessions("gemini-live") and not session.busy:
+        # Pipe chunks straight into the live session instead of buffering them.
+        # Only while no turn is queued or running: its reply is still being read
+        # from the connection (and a replace/cancel would close it), so an
+        # utterance that starts then is buffered and goes up with its own turn.
+        try:
+            live = await live_sessions.get(
+                session.session_id, LIVE_SYSTEM_PROMPT, live_modalities(session.output_mode),
+            )
+        except Exception as e:
+            print(f"Live session unavailable, buffering audio: {e}")
+        else:
+            fmt = session.audio_format.decoded
+            params = vad_params()
+            gate = VadGate(fmt.sample_rate, fmt.channels, **params) if params else None
+            session.audio_pipe = LiveAudioPipe(live, fmt, UPSTREAM_AUDIO_FORMAT.sample_rate, gate)
+    audio.start(store=session.audio_pipe is None)
+
+
+async def on_audio_end(session: Session, data: Dict[str, Any]) -> None:
+    audio = session.audio
+    if audio is None or not audio.active:
+        return
+    stats = audio.stats()
+    pipe, session.audio_pipe = session.audio_pipe, None
+    if audio.dropped:
+        audio.finish()
+    elif pipe is not None:
+        audio.finish()
+        try:
+            spoke = await pipe.finish()
+        except Exception as e:
+            live_sessions.discard(session.session_id)
+            await send_error(session.session_id, "live_error", e)
+            return
+        stats["upstream_bytes"] = pipe.sent_bytes
+        if pipe.gate:
+            stats["vad_removed_bytes"] = pipe.removed
+        if spoke:
+            await submit_audio(session, None, None, stats, live=pipe.live)
+        else:
+            await send_no_speech(session.session_id, stats)
+    else:
+        await submit_buffered_audio(session, stats)
+
+
+async def receive_audio(session: Session, chunk: bytes) -> None:
+    """
+    A chunk of an audio_start ... audio_end utterance, or (legacy) a whole clip.
+    """
+    session_id = session.session_id
+    audio = session_audio(session)
+    legacy = not audio.active
+    if legacy:
+        # Legacy: the whole clip in one binary frame
+        if not await within_limits(session, requests=1, nbytes=len(chunk)):
+            return
+        audio.start()
+        session.audio_decoder = new_audio_decoder(session.audio_format)
+    elif not audio.dropped and not await within_limits(session, nbytes=len(chunk)):
+        audio.abort()
+        return
+
+    try:
+        if session.audio_decoder is not None and not audio.dropped:
+            # bounded by what is left of audio_max_bytes, so a forged header can't blow up memory
+            chunk = session.audio_decoder.decode(chunk, audio.max_bytes - audio.size)
+    except Exception as e:
+        audio.abort()
+        await send_error(session_id, "bad_audio", ValueError(f"Undecodable {session.audio_format.encoding} chunk: {e}"))
+        if legacy:
+            audio.finish()
+        # the rest of the utterance is ignored up to its audio_end
+        return
+
+    try:
+        audio.append(chunk)
+        if session.audio_pipe is not None and not audio.dropped:
+            await session.audio_pipe.feed(chunk)
+    except AudioTooLarge as e:
+        await send_error(session_id, "audio_too_large", e)
+    except Exception as e:
+        audio.abort()
+        live_sessions.discard(session_id)
+        await send_error(session_id, "live_error", e)
+
+    if legacy:
+        stats = audio.stats()
+        if audio.dropped:
+            audio.finish()
+        else:
+            await submit_buffered_audio(session, stats)
+
+
+async def on_audio_chunk(session: Session, data: Dict[str, Any]) -> None:
+    await receive_audio(session, data["audio"])
+
+
+async def on_user_message(session: Session, data: Dict[str, Any]) -> None:
+    text = data["text"].strip()
+    if not text or not await within_limits(session, requests=1, nbytes=len(text.encode("utf-8"))):
+        return
+
+    session_id = session.session_id
+    backend = data.get("backend", "gemini")
+    stream = data.get("stream", config.get("stream_responses", False))
+    message_id = str(uuid4())
+
+    # send a 'thinking' status to client
+    await manager.send_json(session_id, {
+        "type": "status",
+        "status": "thinking",
+        "session_id": session_id,
+        "message_id": message_id
+    })
+
+    job = Job(message_id, functools.partial(
+        run_turn,
+        session_id,
+        message_id,
+        stream,
+        output_mode=session.output_mode,
+        backend=backend,
+        user_text=text,
+        system_prompt=SYSTEM_PROMPT,
+    ))
+    await session.submit(job, data.get("on_busy"))
+
+
+async def on_output_mode(session: Session, data: Dict[str, Any]) -> None:
+    mode = data["mode"]
+    if mode not in OUTPUT_MODES:
+        await send_error(session.session_id, "bad_output_mode", ValueError(
+            f"Unsupported output mode: {mode} (use one of {OUTPUT_MODES})"
+        ))
+        return
+    session.output_mode = mode
+    await manager.send_json(session.session_id, {
+        "type": "output_mode",
+        "session_id": session.session_id,
+        "mode": mode,
+        "audio": OUTPUT_AUDIO_FORMAT.to_dict(),
+    })
+
+
+async def on_ack(session: Session, data: Dict[str, Any]) -> None:
+    # the client has every frame up to seq; the replay buffer can let them go
+    manager.ack(session.session_id, data["seq"])
+
+
+async def on_context(session: Session, data: Dict[str, Any]) -> None:
+    # what the user is doing, for proactive suggestions
+    if suggestions is not None:
+        suggestions.update(session.session_id, data["data"])
+
+
+HANDLERS: Dict[str, Handler] = {
+    "ping": on_ping,
+    "cancel": on_cancel,
+    "audio_format": on_audio_format,
+    "audio_start": on_audio_start,
+    "audio_chunk": on_audio_chunk,
+    "audio_end": on_audio_end,
+    "user_message": on_user_message,
+    "context": on_context,
+    "output_mode": on_output_mode,
+    "ack": on_ack,
+}
+
+# keep the connection alive without counting as user activity (see heartbeat.py)
+KEEPALIVE_TYPES = frozenset(("ping", "ack"))
+
+
+async def resume_session(
+    websocket: WebSocket,
+    codec: Codec,
+    subprotocol: Optional[str],
+) -> Tuple[Optional[Session], Optional[str]]:
+    """
+    Reattach a parked session if the client asks for one it may resume.
+    Returns it, or None and why not.
+    """
+    request = resume_request(websocket.scope)
+    if request is None or resumer is None:
+        return None, None
+    session_id, token, last_seq = request
+    if not resumer.can_resume(session_id, token):
+        return None, "unknown or expired session"
+    if manager.codec(session_id).name != codec.name:
+        return None, f"the session speaks {manager.codec(session_id).name}"
+    session = resumer.claim(session_id)
+    try:
+        await manager.resume(websocket, session_id, last_seq, subprotocol)
+    except Exception:
+        end_session(session_id, session)
+        raise
+    return session, None
+
+
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    codec, subprotocol = negotiate(websocket.scope, config.get("protocol_default", "app.v1"))
+    resumed, resume_error = await resume_session(websocket, codec, subprotocol)
+    if resumed is not None:
+        session = resumed
+        session_id = session.session_id
+    else:
+        session_id = str(uuid4())
+        session = Session(
+            session_id,
+            send=lambda data: manager.send_json(session_id, data),
+            max_queue=config.get("session_queue_size", 8),
+            busy_policy=config.get("busy_policy", "queue"),
+        )
+        session.audio_format = DEFAULT_AUDIO_FORMAT
+        session.output_mode = config.get("output_mode", "text")
+    # a normal close ends the session; anything else parks it for a resume
+    closed_normally = False
+    if recorder is not None:
+        recorder.opened(session_id, codec.name, resumed is not None)
+
+    try:
+        if resumed is None:
+            await manager.connect(websocket, session_id, codec, subprotocol)
+            if limiter is not None:
+                # the peer address as the server sees it (X-Forwarded-For is not trusted)
+                limiter.open(session_id, websocket.client.host if websocket.client else "")
+
+            # Let the client know the session_id, the protocol it got, and the audio format the model takes natively
+            started = {
+                "type": "session_started",
+                "session_id": session_id,
+                "protocol": codec.to_dict(),
+                "audio": UPSTREAM_AUDIO_FORMAT.to_dict(),
+                # compressed encodings the client may send audio in
+                "audio_codecs": available_codecs(),
+            }
+            if resumer is not None:
+                started["resume_token"] = resumer.issue(session_id)
+            if resume_error is not None:
+                started["resume_error"] = resume_error
+            await manager.send_json(session_id, started)
+
+        outbox = manager.outbox(session_id)
+        if heartbeats is not None:
+            heartbeats.watch(session_id)
+
+        # Receive loop: never awaits the LLM, turns go through session.run()
         while True:
             message = await websocket.receive()
-            
-            if "text" in message:
-                try:
-                    data = json.loads(message["text"])
-                except json.JSONDecodeError:
+            if message["type"] == "websocket.disconnect":
+                closed_normally = message.get("code") == 1000
+                break
+            outbox.last_seen = time.monotonic()
+
+            frame = message.get("text")
+            if frame is None:
+                frame = message.get("bytes")
+                if frame is None:
                     continue
-                
-                msg_type = data.get("type")
-                
-                if msg_type == "ping":
-                    await manager.send_json(session_id, {
-                        "type": "pong",
-                        "session_id": session_id,
-                    })
+                if not codec.binary:
+                    # JSON connections send audio chunks as raw binary frames
+                    outbox.last_active = outbox.last_seen
+                    if recorder is not None:
+                        recorder.inbound_audio(session_id, len(frame))
+                    await receive_audio(session, frame)
                     continue
 
-                if msg_type == "user_message":
-                    text = data.get("text", "").strip()
-                    if not text:
-                        continue
-                    
-                    backend = data.get("backend", "gemini")
-                    
-                    # send a 'thinking' status to client
-                    await manager.send_json(session_id, {
-                        "type": "status",
-                        "status": "thinking",
-                        "session_id": session_id,
-                        "message_id": str(uuid4())
-                    })
-
-                    try:
-                        response = await chat_simple(
-                            backend=backend,
-                            config=config,
-                            user_text=text,
-                            system_prompt="You are a helpful assistant."
-                        )
-                        await manager.send_json(session_id, {
-                            "type": "response", 
-                            "text": response,
-                            "session_id": session_id
-                        })
-                    except Exception as e:
-                         await manager.send_json(session_id, {
-                            "type": "error", 
-                            "message": str(e),
-                            "session_id": session_id
-                        })
-            
-            elif "bytes" in message:
-                # Handle Audio
-                audio_data = message["bytes"]
-                
-                await manager.send_json(session_id, {
-                    "type": "status", 
-                    "status": "processing_audio",
-                    "session_id": session_id
-                })
-
-                try:
-                    # Use gemini-live for audio
-                    response = await chat_simple(
-                        backend="gemini-live",
-                        config=config,
-                        user_text="Please respond to this audio.",
-                        audio_data=audio_data,
-                        system_prompt="You are a helpful audio assistant."
-                    )
-                    await manager.send_json(session_id, {
-                        "type": "response", 
-                        "text": response,
-                        "session_id": session_id
-                    })
-                except Exception as e:
-                     await manager.send_json(session_id, {
-                        "type": "error", 
-                        "message": str(e),
-                        "session_id": session_id
-                    })
-
-    except WebSocketDisconnect:
-        manager.disconnect(session_id)
+            try:
+                with metrics.span("decode"):
+                    data, validate = codec.decode(frame)
+            except ProtocolError:
+                continue
+            if validate is None:
+                # not a message type we handle (e.g. heartbeat replies)
+                continue
+            problem = validate(data)
+            if problem is not None:
+                await send_error(session_id, "bad_message", ProtocolError(f"{data['type']}: {problem}"))
+                continue
+
+            if data["type"] not in KEEPALIVE_TYPES:
+                outbox.last_active = outbox.last_seen
+            if recorder is not None:
+                recorder.inbound(session_id, data)
+            await HANDLERS[data["type"]](session, data)
+
+    except WebSocketDisconnect as e:
+        closed_normally = e.code == 1000
     except Exception as e:
         print(f"Error: {e}")
-        manager.disconnect(session_id)
+    finally:
+        if recorder is not None:
+            recorder.closed(session_id, closed_normally)
+        if resumer is not None and not closed_normally and manager.detach(session_id):
+            resumer.park(session_id, session)
+        else:
+            end_session(session_id, session)
+
+def ws_server_options() -> Dict[str, Any]:
+    """
+    uvicorn settings for /ws that follow the config (also for benchmarks that run the server).
+    """
+    return {
+        # the heartbeats replace uvicorn's keepalive pings (a timer per socket)
+        "ws_ping_interval": None if heartbeats is not None and heartbeats.interval else 20.0,
+        # zlib state costs ~45 KB per connection, for frames that are mostly small
+        "ws_per_message_deflate": config.get("ws_per_message_deflate", False),
+    }
+
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    workers = config.get("workers", 1)
+    if workers > 1 and config.get("session_router", "memory") == "memory":
+        print("Warning: several workers with the in-memory session router; "
+              "events can't reach sessions owned by other workers")
+    uvicorn.run("app:app", host="0.0.0.0", port=8000, workers=workers, **ws_server_options())
\ No newline at end of file
@@ -0,0 +1,333 @@
+import struct
+import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from audio_codec import CODECS, OPUS_RATES
+
+
+# ---------- CHUNKED AUDIO INGEST ----------
+
+# Clients stream an utterance over /ws as:
+#
+#   {"type": "audio_start"}     -> server opens the session's AudioBuffer
+#   <binary frame> ...          -> each chunk is appended as it arrives
+#   {"type": "audio_end"}       -> the utterance becomes one gemini-live turn
+#
+# The buffer is preallocated once per session and reused for every utterance,
+# so ingest is one copy per chunk and no re-joining of frame lists. When the
+# session has a Gemini Live connection, chunks are piped into it instead and
+# the buffer only counts them (start(store=False)).
+
+
+class AudioTooLarge(ValueError):
+    pass
+
+
+class AudioBuffer:
+    __slots__ = (
+        "_buf",
+        "max_bytes",
+        "size",
+        "chunks",
+        "store",
+        "dropped",
+        "started_at",
+        "ingest_time",
+    )
+
+    def __init__(self, max_bytes: int, initial_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self._buf = bytearray(min(initial_bytes or max_bytes, max_bytes))
+        self.size = 0
+        self.chunks = 0
+        self.store = True
+        self.dropped = False
+        self.started_at: Optional[float] = None
+        self.ingest_time = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.started_at is not None
+
+    def start(self, store: bool = True) -> None:
+        """
+        Begin an utterance. With store=False the chunks are only counted
+        (they are being piped straight into a live session).
+        """
+        self.size = 0
+        self.chunks = 0
+        self.store = store
+        self.dropped = False
+        self.ingest_time = 0.0
+        self.started_at = time.perf_counter()
+
+    def append(self, chunk: bytes) -> None:
+        """
+        Copy one chunk into the buffer. Raises AudioTooLarge once the
+        utterance goes past max_bytes (the rest of it is then ignored).
+        """
+        if self.dropped:
+            return
+
+        t0 = time.perf_counter()
+        end = self.size + len(chunk)
+        if end > self.max_bytes:
+            self.dropped = True
+            raise AudioTooLarge(f"Audio exceeds the {self.max_bytes} byte limit")
+
+        if not self.store:
+            self.size = end
+            self.chunks += 1
+            return
+
+        if end > len(self._buf):
+            # grow geometrically, never past the cap (into a new bytearray, so
+            # views handed out by finish() stay valid)
+            grown = bytearray(min(max(end, 2 * len(self._buf)), self.max_bytes))
+            grown[:self.size] = memoryview(self._buf)[:self.size]
+            self._buf = grown
+
+        self._buf[self.size:end] = chunk
+        self.size = end
+        self.chunks += 1
+        self.ingest_time += time.perf_counter() - t0
+
+    def abort(self) -> None:
+        """
+        Ignore the rest of the current utterance (it will not become a turn).
+        """
+        self.dropped = True
+
+    def view(self) -> memoryview:
+        return memoryview(self._buf)[:self.size]
+
+    def finish(self) -> memoryview:
+        """
+        End the utterance and return a view of its bytes. The view is only
+        valid until the next start(): callers convert it (one copy) right away.
+        """
+        self.started_at = None
+        return self.view() if self.store else memoryview(b"")
+
+    def stats(self) -> Dict[str, float]:
+        upload = time.perf_counter() - self.started_at if self.started_at else 0.0
+        return {
+            "bytes": self.size,
+            "chunks": self.chunks,
+            "upload_ms": round(upload * 1000, 2),
+            "ingest_ms": round(self.ingest_time * 1000, 3),
+        }
+
+
+# ---------- AUDIO FORMAT NEGOTIATION ----------
+
+# The server advertises the upstream model's native input format in
+# `session_started`; clients declare what they actually send with an
+# `audio_format` message (or the same fields on `audio_start`):
+#
+#   {"type": "audio_format", "encoding": "pcm_s16le", "sample_rate": 24000, "channels": 1}
+#
+# Raw PCM is resampled / downmixed to the native format before it goes upstream.
+# Compressed containers (webm, ogg, ...) are passed through with their real mime type.
+# Chunk codecs (audio_codec.CODECS: "rice", "opus") are decoded to PCM on arrival,
+# and from then on the utterance is handled in its `decoded` format.
+
+PCM_ENCODINGS = ("pcm_s16le", "pcm")
+CONTAINER_MIME_TYPES = {
+    "wav": "audio/wav",
+    "webm": "audio/webm",
+    "ogg": "audio/ogg",
+    "flac": "audio/flac",
+    "mp3": "audio/mpeg",
+}
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class AudioFormat:
+    __slots__ = ("encoding", "sample_rate", "channels")
+
+    def __init__(self, encoding: str = "pcm_s16le", sample_rate: int = 16000, channels: int = 1):
+        self.encoding = encoding
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    @classmethod
+    def from_message(cls, data: Dict[str, Any], default: "AudioFormat") -> "AudioFormat":
+        """
+        Build the format a client declared, falling back to `default` for missing fields.
+        Raises ValueError for encodings we can't forward.
+        """
+        encoding = str(data.get("encoding", default.encoding)).lower()
+        if encoding not in PCM_ENCODINGS and encoding not in CONTAINER_MIME_TYPES and encoding not in CODECS:
+            raise ValueError(f"Unsupported audio encoding: {encoding}")
+
+        sample_rate = int(data.get("sample_rate", default.sample_rate))
+        channels = int(data.get("channels", default.channels))
+        if not 8000 <= sample_rate <= 192000 or not 1 <= channels <= 8:
+            raise ValueError(f"Unsupported audio format: {sample_rate} Hz, {channels} channel(s)")
+        if encoding == "opus" and sample_rate not in OPUS_RATES:
+            raise ValueError(f"Opus takes {OPUS_RATES} Hz, not {sample_rate}")
+
+        return cls("pcm_s16le" if encoding == "pcm" else encoding, sample_rate, channels)
+
+    @property
+    def is_pcm(self) -> bool:
+        return self.encoding in PCM_ENCODINGS
+
+    @property
+    def is_codec(self) -> bool:
+        return self.encoding in CODECS
+
+    @property
+    def decoded(self) -> "AudioFormat":
+        """
+        What the server holds after decoding (PCM for chunk codecs, else the format itself).
+        """
+        return AudioFormat("pcm_s16le", self.sample_rate, self.channels) if self.is_codec else self
+
+    @property
+    def mime_type(self) -> str:
+        if self.is_pcm:
+            return f"audio/pcm;rate={self.sample_rate}"
+        return CONTAINER_MIME_TYPES[self.encoding]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "encoding": self.encoding,
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+        }
+
+
+WAV_HEADER_SIZE = 44
+
+
+def write_wav_header(out: Union[bytearray, memoryview], num_bytes: int, sample_rate: int, channels: int = 1) -> None:
+    """
+    Write a 16-bit PCM RIFF/WAVE header into the first 44 bytes of `out`.
+    """
+    block_align = channels * 2
+    struct.pack_into(
+        "<4sI4s4sIHHIIHH4sI",
+        out,
+        0,
+        b"RIFF", 36 + num_bytes, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, 16,
+        b"data", num_bytes,
+    )
+
+
+class PcmResampler:
+    """
+    Downmix interleaved int16 PCM to mono and resample it with linear interpolation.
+
+    Stateful so that a stream can be fed chunk by chunk without clicks at the chunk
+    boundaries: the last input sample and the fractional read position carry over,
+    and so do the bytes of a chunk that end mid-frame (an odd byte, or part of a
+    stereo frame), which are put in front of the next chunk.
+    Input is read in place (np.frombuffer on the caller's buffer) unless a partial
+    frame has to be joined to it.
+    """
+
+    __slots__ = ("src_rate", "dst_rate", "channels", "_step", "_pos", "_last", "_partial")
+
+    def __init__(self, src_rate: int, dst_rate: int, channels: int = 1):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.channels = channels
+        self._step = src_rate / dst_rate
+        self._pos = 0.0
+        self._last: Optional[float] = None
+        self._partial = b""
+
+    def output_length(self, num_bytes: int) -> int:
+        """
+        Number of output samples process() will produce for a chunk of num_bytes.
+        """
+        frames = (len(self._partial) + num_bytes) // (2 * self.channels)
+        if self.src_rate == self.dst_rate:
+            return frames
+        span = frames - 1 + (self._last is not None)
+        if span < self._pos:
+            return 0
+        return int((span - self._pos) // self._step) + 1
+
+    def process(self, pcm: BytesLike, out: Optional[memoryview] = None) -> np.ndarray:
+        """
+        Resample one chunk. If `out` is given, the int16 result is written straight
+        into it (it must hold output_length(len(pcm)) samples).
+        """
+        n_out = self.output_length(len(pcm))
+        if self._partial:
+            pcm = self._partial + bytes(pcm)
+        frame_bytes = 2 * self.channels
+        frames = len(pcm) // frame_bytes
+        self._partial = bytes(memoryview(pcm)[frames * frame_bytes:])
+        samples = np.frombuffer(pcm, dtype="<i2", count=frames * self.channels)
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+
+        if not len(samples) and self._last is None:
+            # less than one frame so far (kept for the next chunk), nothing to interpolate
+            return np.frombuffer(out, dtype="<i2", count=0) if out is not None else np.empty(0, dtype="<i2")
+
+        if self.src_rate == self.dst_rate:
+            resampled = samples
+        else:
+            if self._last is not None:
+                samples = np.concatenate(([self._last], samples))
+            positions = self._pos + np.arange(n_out, dtype=np.float64) * self._step
+            resampled = np.interp(positions, np.arange(len(samples)), samples)
+            if len(samples):
+                # carry over: next read position, relative to this chunk's last sample
+                self._pos = self._pos + n_out * self._step - (len(samples) - 1)
+                self._last = float(samples[-1])
+
+        target = np.frombuffer(out, dtype="<i2", count=n_out) if out is not None else np.empty(n_out, dtype="<i2")
+        if resampled.dtype.kind == "f":
+            resampled = np.clip(np.rint(resampled), -32768, 32767)
+        target[:] = resampled
+        return target
+
+
+def encode_for_upstream(
+    data: BytesLike,
+    src: AudioFormat,
+    dst_rate: int,
+    container: str = "pcm",
+    resampler: Optional[PcmResampler] = None,
+) -> Tuple[BytesLike, str]:
+    """
+    Turn one utterance (or chunk) into the payload sent upstream, with exactly one copy:
+
+    - compressed input is passed through with its real mime type
+    - PCM is downmixed/resampled to dst_rate when needed, and optionally
+      wrapped in a WAV header (container="wav", for generate_content which
+      does not take headerless PCM)
+    - pass the stream's `resampler` when encoding consecutive chunks (it also
+      carries a chunk's trailing odd byte over to the next one)
+
+    Returns (payload, mime_type).
+    """
+    if not src.is_pcm:
+        return bytes(data), src.mime_type
+
+    header = WAV_HEADER_SIZE if container == "wav" else 0
+    if src.sample_rate == dst_rate and src.channels == 1 and resampler is None:
+        n_out = len(data) // 2
+        out = bytearray(header + n_out * 2)
+        memoryview(out)[header:] = memoryview(data)[:n_out * 2]
+    else:
+        resampler = resampler or PcmResampler(src.sample_rate, dst_rate, src.channels)
+        n_out = resampler.output_length(len(data))
+        out = bytearray(header + n_out * 2)
+        resampler.process(data, out=memoryview(out)[header:])
+
+    if header:
+        write_wav_header(out, n_out * 2, dst_rate)
+        return out, "audio/wav"
+
+    return out, f"audio/pcm;rate={dst_rate}"
@@ -0,0 +1,280 @@
+import struct
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+try:
+    import opuslib
+except ImportError:
+    opuslib = None
+
+
+# ---------- COMPRESSED AUDIO UPLINK ----------
+
+# Raw int16 PCM costs 32 KB/s at 16 kHz. Clients can send the utterance
+# compressed instead, one independently framed payload per binary frame, and
+# the server decodes it back to PCM before the usual path (VAD, resampling,
+# live pipe / WAV):
+#
+#   - "rice"  lossless, numpy only (always available): per chunk, the fixed
+#             polynomial predictor (order 0-2) with the smallest residual, as
+#             in FLAC, then Rice codes with a parameter per 256-sample
+#             partition. The unary parts and the remainders are two separate
+#             bit streams, so both directions are vectorized.
+#   - "opus"  lossy speech codec, 20 ms frames at the encoder's bitrate (needs
+#             opuslib and libopus, on both ends). A chunk is a run of
+#             [uint16 length][packet]; the encoder carries partial frames over
+#             to the next chunk and pads the last one on flush().
+#
+# The server lists what it can decode in session_started ("audio_codecs"); the
+# client declares its pick like any other encoding (audio_format / audio_start
+# with "encoding": "rice"). Encoders and decoders are per utterance; an opus
+# one holds state, so chunks of one utterance are encoded and decoded in order.
+#
+# The upstream models don't take these framings (Gemini Live wants PCM, and
+# generate_content wants whole files), so the server always decodes them.
+# Whole compressed files (webm, ogg, flac, ...) are still passed through as is
+# (see audio.encode_for_upstream).
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+PARTITION = 256
+# unary parts are kept under 2 ** QUOTIENT_BITS bits by raising k where needed
+QUOTIENT_BITS = 6
+# version, channels, order (RAW = stored as is), frames
+RICE_HEADER = struct.Struct("<BBBI")
+RICE_VERSION = 1
+RAW = 255
+
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+OPUS_LENGTH = struct.Struct("<H")
+
+
+# ----- rice -----
+
+def _rice_encode(pcm: BytesLike, channels: int) -> bytes:
+    frames = len(pcm) // (2 * channels)
+    x = np.frombuffer(pcm, dtype="<i2", count=frames * channels).astype(np.int64)
+    # one row per channel
+    x = x.reshape(-1, channels).T
+
+    best: Optional[Tuple[int, int, np.ndarray]] = None
+    for order in range(3):
+        residual = np.diff(x, n=order, prepend=np.zeros((channels, order), dtype=np.int64)) if order else x
+        cost = int(np.abs(residual).sum())
+        if best is None or cost < best[0]:
+            best = (cost, order, residual)
+    _, order, residual = best
+    residual = residual.ravel()
+
+    # zigzag: 0, -1, 1, -2, ... -> 0, 1, 2, 3, ...
+    u = ((residual << 1) ^ (residual >> 63)).astype(np.uint64)
+
+    n = len(u)
+    parts = -(-n // PARTITION) if n else 0
+    padded = np.zeros(parts * PARTITION, dtype=np.uint64)
+    padded[:n] = u
+    blocks = padded.reshape(parts, PARTITION)
+    # k ~ log2 of the mean, but at least enough to bound the unary parts
+    mean = blocks.mean(axis=1)
+    k = np.floor(np.log2(np.maximum(mean, 1.0))).astype(np.int64)
+    k_min = np.ceil(np.log2(blocks.max(axis=1).astype(np.float64) + 1.0)).astype(np.int64) - QUOTIENT_BITS
+    k = np.clip(np.maximum(k, k_min), 0, 24)
+    widths = np.repeat(k, PARTITION)[:n]
+
+    q = (u >> widths.astype(np.uint64)).astype(np.int64)
+    rem = u & ((np.uint64(1) << widths.astype(np.uint64)) - np.uint64(1))
+
+    # unary stream: q zeros then a one, per sample
+    stops = np.cumsum(q + 1) - 1
+    unary = np.zeros(int(stops[-1]) + 1 if n else 0, dtype=np.uint8)
+    unary[stops] = 1
+
+    # remainder stream: `width` bits per sample, most significant first
+    starts = np.cumsum(widths) - widths
+    remainder = np.zeros(int(widths.sum()), dtype=np.uint8)
+    for bit in range(int(k.max()) if parts else 0):
+        has = widths > bit
+        shift = (widths[has] - 1 - bit).astype(np.uint64)
+        remainder[starts[has] + bit] = ((rem[has] >> shift) & np.uint64(1)).astype(np.uint8)
+
+    unary_bytes = np.packbits(unary).tobytes()
+    body = b"".join((
+        k.astype(np.uint8).tobytes(),
+        struct.pack("<I", len(unary_bytes)),
+        unary_bytes,
+        np.packbits(remainder).tobytes(),
+    ))
+    if len(body) >= frames * channels * 2:
+        return RICE_HEADER.pack(RICE_VERSION, channels, RAW, frames) + bytes(pcm[:frames * channels * 2])
+    return RICE_HEADER.pack(RICE_VERSION, channels, order, frames) + body
+
+
+def _rice_decode(data: BytesLike, max_bytes: Optional[int] = None) -> bytes:
+    view = memoryview(data)
+    if len(view) < RICE_HEADER.size:
+        raise ValueError("Truncated rice chunk header")
+    version, channels, order, frames = RICE_HEADER.unpack_from(view)
+    if version != RICE_VERSION:
+        raise ValueError(f"Unsupported rice chunk version: {version}")
+    if not channels or (order > 2 and order != RAW):
+        raise ValueError(f"Bad rice chunk header: {channels} channel(s), order {order}")
+    offset = RICE_HEADER.size
+    n = frames * channels
+    # the header is checked against the chunk before anything is sized from it
+    if max_bytes is not None and n * 2 > max_bytes:
+        raise ValueError(f"Rice chunk decodes to {n * 2} bytes, only {max_bytes} allowed")
+    if order == RAW:
+        if len(view) - offset != n * 2:
+            raise ValueError(f"Rice chunk holds {len(view) - offset} bytes, its header says {n * 2}")
+        return bytes(view[offset:])
+
+    parts = -(-n // PARTITION)
+    if len(view) < offset + parts + 4:
+        raise ValueError(f"Truncated rice chunk: {n} samples need {parts} partitions")
+    k = np.frombuffer(view, dtype=np.uint8, count=parts, offset=offset).astype(np.int64)
+    offset += parts
+    (unary_len,) = struct.unpack_from("<I", view, offset)
+    offset += 4
+    if unary_len * 8 < n or offset + unary_len > len(view):
+        raise ValueError(f"Bad rice chunk: {unary_len} unary bytes for {n} samples")
+    widths = np.repeat(k, PARTITION)[:n]
+    if int(widths.sum()) > (len(view) - offset - unary_len) * 8:
+        raise ValueError("Truncated rice chunk remainders")
+    unary = np.unpackbits(np.frombuffer(view, dtype=np.uint8, count=unary_len, offset=offset))
+    offset += unary_len
+    remainder = np.unpackbits(np.frombuffer(view, dtype=np.uint8, offset=offset))
+
+    stops = np.flatnonzero(unary)[:n]
+    if len(stops) < n:
+        raise ValueError(f"Bad rice chunk: {len(stops)} unary codes for {n} samples")
+    q = np.diff(stops, prepend=-1) - 1
+    starts = np.cumsum(widths) - widths
+    rem = np.zeros(n, dtype=np.int64)
+    for bit in range(int(k.max()) if parts else 0):
+        has = widths > bit
+        rem[has] |= remainder[starts[has] + bit].astype(np.int64) << (widths[has] - 1 - bit)
+
+    u = (q << widths) | rem
+    residual = (u >> 1) ^ -(u & 1)
+    x = residual.reshape(channels, frames)
+    for _ in range(order):
+        x = np.cumsum(x, axis=1)
+    return x.T.astype("<i2").tobytes()
+
+
+class RiceEncoder:
+    __slots__ = ("channels",)
+
+    def __init__(self, sample_rate: int, channels: int = 1):
+        self.channels = channels
+
+    def encode(self, pcm: BytesLike) -> bytes:
+        return _rice_encode(pcm, self.channels)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class RiceDecoder:
+    __slots__ = ()
+
+    def __init__(self, sample_rate: int, channels: int = 1):
+        pass
+
+    def decode(self, chunk: BytesLike, max_bytes: Optional[int] = None) -> bytes:
+        """
+        Raises ValueError for a chunk that is malformed or (with max_bytes)
+        would decode to more than max_bytes, before allocating its output.
+        """
+        return _rice_decode(chunk, max_bytes)
+
+
+# ----- opus -----
+
+class OpusEncoder:
+    __slots__ = ("_encoder", "frame_size", "_frame_bytes", "_pending")
+
+    def __init__(self, sample_rate: int, channels: int = 1, bitrate: int = 24000):
+        if sample_rate not in OPUS_RATES:
+            raise ValueError(f"Opus takes {OPUS_RATES} Hz, not {sample_rate}")
+        self._encoder = opuslib.Encoder(sample_rate, channels, "voip")
+        self._encoder.bitrate = bitrate
+        self.frame_size = sample_rate // 50
+        self._frame_bytes = self.frame_size * channels * 2
+        self._pending = bytearray()
+
+    def encode(self, pcm: BytesLike) -> bytes:
+        self._pending += pcm
+        out = bytearray()
+        usable = len(self._pending) - len(self._pending) % self._frame_bytes
+        view = memoryview(self._pending)
+        for start in range(0, usable, self._frame_bytes):
+            packet = self._encoder.encode(bytes(view[start:start + self._frame_bytes]), self.frame_size)
+            out += OPUS_LENGTH.pack(len(packet))
+            out += packet
+        view.release()
+        del self._pending[:usable]
+        return bytes(out)
+
+    def flush(self) -> bytes:
+        """
+        Pad and encode what is left of the last frame.
+        """
+        if not self._pending:
+            return b""
+        self._pending += bytes(self._frame_bytes - len(self._pending))
+        return self.encode(b"")
+
+
+class OpusDecoder:
+    __slots__ = ("_decoder", "frame_size", "_frame_bytes")
+
+    def __init__(self, sample_rate: int, channels: int = 1):
+        if sample_rate not in OPUS_RATES:
+            raise ValueError(f"Opus takes {OPUS_RATES} Hz, not {sample_rate}")
+        self._decoder = opuslib.Decoder(sample_rate, channels)
+        self.frame_size = sample_rate // 50
+        self._frame_bytes = self.frame_size * channels * 2
+
+    def decode(self, chunk: BytesLike, max_bytes: Optional[int] = None) -> bytes:
+        """
+        Raises ValueError (with max_bytes) once the chunk would decode to more than max_bytes.
+        """
+        view = memoryview(chunk)
+        out = bytearray()
+        offset = 0
+        while offset + OPUS_LENGTH.size <= len(view):
+            if max_bytes is not None and len(out) + self._frame_bytes > max_bytes:
+                raise ValueError(f"Opus chunk decodes to more than the {max_bytes} bytes allowed")
+            (length,) = OPUS_LENGTH.unpack_from(view, offset)
+            offset += OPUS_LENGTH.size
+            out += self._decoder.decode(bytes(view[offset:offset + length]), self.frame_size)
+            offset += length
+        return bytes(out)
+
+
+# ----- registry -----
+
+CODECS: Dict[str, Tuple[type, type]] = {"rice": (RiceEncoder, RiceDecoder)}
+if opuslib is not None:
+    CODECS["opus"] = (OpusEncoder, OpusDecoder)
+
+
+def available_codecs() -> List[str]:
+    """
+    Codecs this process can encode and decode, best compression first.
+    """
+    return sorted(CODECS, key=lambda name: name != "opus")
+
+
+def new_encoder(name: str, sample_rate: int, channels: int = 1, bitrate: int = 24000):
+    encoder_cls, _ = CODECS[name]
+    if encoder_cls is OpusEncoder:
+        return encoder_cls(sample_rate, channels, bitrate)
+    return encoder_cls(sample_rate, channels)
+
+
+def new_decoder(name: str, sample_rate: int, channels: int = 1):
+    _, decoder_cls = CODECS[name]
+    return decoder_cls(sample_rate, channels)
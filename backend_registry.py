@@ -0,0 +1,278 @@
+import asyncio
+import importlib
+import sys
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from types import ModuleType
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+
+# ---------- LAZY BACKEND IMPORTS ----------
+
+# The backend SDKs take seconds and tens of MB to import, and most deployments use
+# one or two backends. Nothing imports them at module load: BACKEND_MODULES says
+# which modules each backend needs and load_module() imports them on first use
+# (or at startup for "warmup_backends", see llm_utils.warm_up).
+
+BACKEND_MODULES: Dict[str, Tuple[str, ...]] = {
+    "gemini": ("langchain_core.messages", "langchain_google_genai"),
+    "ollama": ("langchain_core.messages", "langchain_community.chat_models.ollama"),
+    "gemini-live": ("google.genai", "google.genai.types"),
+}
+
+# module -> seconds its (first) import took
+_import_seconds: Dict[str, float] = {}
+
+
+def load_module(name: str) -> ModuleType:
+    """
+    importlib.import_module, timed the first time (a dict lookup after that).
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _import_seconds[name] = time.perf_counter() - start
+    return module
+
+
+def load_backend(backend: str) -> None:
+    for name in BACKEND_MODULES.get(backend, ()):
+        load_module(name)
+
+
+def import_stats() -> Dict[str, float]:
+    """
+    Milliseconds each lazily imported module took (including what it pulled in).
+    """
+    return {name: round(seconds * 1000, 1) for name, seconds in _import_seconds.items()}
+
+
+# ---------- BACKEND CLIENT REGISTRY ----------
+
+# Building a ChatGoogleGenerativeAI / ChatOllama / genai.Client is not free:
+# pydantic validation, a fresh HTTP client, a fresh connection pool (and TLS
+# handshake on the first request). The registry keeps one long-lived client per
+# (backend, model, kwargs) so every turn reuses the same keep-alive pool.
+#
+# Calls hold a lease on the client for as long as they use it (lease(), for a
+# request, a stream or a whole Live connection). Eviction only ever closes a
+# client nobody holds: idle eviction skips leased clients, and a leased client
+# pushed out of the LRU is retired instead, then closed when its last lease ends.
+#
+# config keys used (all optional):
+#
+#   "backend_pool_idle_ttl": 300,          # seconds before an unused client is dropped
+#   "backend_pool_max_clients": 32,        # hard cap on cached clients (LRU)
+#   "backend_max_concurrency": {           # in-flight upstream calls per backend
+#       "gemini": 16, "ollama": 2, "gemini-live": 8,
+#   }
+
+
+ClientKey = Tuple[str, Optional[str], Hashable]
+
+
+def _freeze(value: Any) -> Hashable:
+    """
+    Turn kwargs (which may contain dicts / lists) into something hashable
+    so they can be part of a cache key.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+class _PooledClient:
+    __slots__ = ("client", "last_used", "leases", "retired")
+
+    def __init__(self, client: Any, last_used: float):
+        self.client = client
+        self.last_used = last_used
+        # calls and streams using the client right now
+        self.leases = 0
+        # out of the cache, to be closed when the last lease ends
+        self.retired = False
+
+
+class BackendRegistry:
+    def __init__(
+        self,
+        idle_ttl: float = 300.0,
+        max_clients: int = 32,
+        max_concurrency: Optional[Dict[str, int]] = None,
+    ):
+        self.idle_ttl = idle_ttl
+        self.max_clients = max_clients
+        self.max_concurrency: Dict[str, int] = dict(max_concurrency or {})
+        # OrderedDict in least-recently-used order, so eviction only looks at the front
+        self._clients: "OrderedDict[ClientKey, _PooledClient]" = OrderedDict()
+        # evicted while leased, closed by the last release
+        self._retired: List[_PooledClient] = []
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "BackendRegistry":
+        return cls(
+            idle_ttl=config.get("backend_pool_idle_ttl", 300.0),
+            max_clients=config.get("backend_pool_max_clients", 32),
+            max_concurrency=config.get("backend_max_concurrency"),
+        )
+
+    def get(
+        self,
+        backend: str,
+        model: Optional[str],
+        factory: Callable[..., Any],
+        **kwargs: Any,
+    ) -> Any:
+        """
+        Return the cached client for (backend, model, kwargs), building it with
+        factory(**kwargs) on first use. Without a lease the client may be closed
+        by a later eviction: calls that use it use lease() instead.
+        """
+        return self._entry(backend, model, factory, kwargs).client
+
+    @contextmanager
+    def lease(
+        self,
+        backend: str,
+        model: Optional[str],
+        factory: Callable[..., Any],
+        **kwargs: Any,
+    ) -> Iterator[Any]:
+        """
+        Same as get(), and the client is not closed before the block ends.
+        """
+        entry = self._entry(backend, model, factory, kwargs)
+        entry.leases += 1
+        try:
+            yield entry.client
+        finally:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            if entry.retired and not entry.leases:
+                self._retired.remove(entry)
+                self._close(entry.client)
+
+    def _entry(
+        self,
+        backend: str,
+        model: Optional[str],
+        factory: Callable[..., Any],
+        kwargs: Dict[str, Any],
+    ) -> _PooledClient:
+        now = time.monotonic()
+        self.evict_idle(now)
+
+        key: ClientKey = (backend, model, _freeze(kwargs))
+        entry = self._clients.get(key)
+        if entry is not None:
+            entry.last_used = now
+            self._clients.move_to_end(key)
+            self.reused += 1
+            return entry
+
+        entry = self._clients[key] = _PooledClient(factory(**kwargs), now)
+        self.created += 1
+
+        while len(self._clients) > self.max_clients:
+            _, old = self._clients.popitem(last=False)
+            self._evict(old)
+            self.evicted += 1
+
+        return entry
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """
+        Drop clients that have not been used for idle_ttl seconds (a leased
+        client is in use). Returns how many were evicted.
+        """
+        now = time.monotonic() if now is None else now
+        count = 0
+        while self._clients:
+            key, entry = next(iter(self._clients.items()))
+            if now - entry.last_used < self.idle_ttl:
+                break
+            if entry.leases:
+                # e.g. a Live connection open for longer than idle_ttl
+                entry.last_used = now
+                self._clients.move_to_end(key)
+                continue
+            del self._clients[key]
+            self._close(entry.client)
+            count += 1
+        self.evicted += count
+        return count
+
+    def _evict(self, entry: _PooledClient) -> None:
+        if entry.leases:
+            entry.retired = True
+            self._retired.append(entry)
+        else:
+            self._close(entry.client)
+
+    @asynccontextmanager
+    async def limit(self, backend: str) -> AsyncIterator[None]:
+        """
+        Cap the number of in-flight upstream calls for a backend.
+        Backends without a configured limit are not throttled.
+        """
+        max_in_flight = self.max_concurrency.get(backend)
+        if not max_in_flight:
+            yield
+            return
+
+        sem = self._limits.get(backend)
+        if sem is None:
+            sem = self._limits[backend] = asyncio.Semaphore(max_in_flight)
+
+        async with sem:
+            yield
+
+    def clear(self) -> None:
+        # shutdown: leased or not
+        for entry in [*self._clients.values(), *self._retired]:
+            entry.retired = False
+            self._close(entry.client)
+        self._clients.clear()
+        self._retired.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._clients),
+            "leased": sum(entry.leases > 0 for entry in self._clients.values()),
+            "retired": len(self._retired),
+            "created": self.created,
+            "reused": self.reused,
+            "evicted": self.evicted,
+            "imports_ms": import_stats(),
+        }
+
+    @staticmethod
+    def _close(client: Any) -> None:
+        # genai.Client / httpx clients expose close()/aclose();
+        # LangChain chat models just get garbage collected
+        for name in ("close", "aclose"):
+            close = getattr(client, name, None)
+            if not callable(close):
+                continue
+            try:
+                result = close()
+            except Exception:
+                continue
+            if asyncio.iscoroutine(result):
+                try:
+                    asyncio.get_running_loop().create_task(result)
+                except RuntimeError:
+                    result.close()
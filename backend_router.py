@@ -0,0 +1,297 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence
+
+
+# ---------- BACKEND ROUTING: FALLBACK, HEDGING, CIRCUIT BREAKERS ----------
+
+# Sits between chat_messages and the backends. For each request:
+#
+#   - candidates: the requested backend first, then the other backends ordered by
+#     their latency estimate (audio requests only go to audio-capable backends).
+#     With mode "fastest" the requested backend gets no head start.
+#   - backends whose circuit breaker is open are skipped
+#   - hedging: if the first call hasn't answered after hedge_delay seconds, the
+#     next candidate is called too; the first answer wins and the other is cancelled
+#   - fallback: a failed call moves on to the next candidate right away
+#
+# Per backend we keep an EWMA of latency and of the error rate. The breaker opens
+# after failure_threshold consecutive failures, lets one probe through after
+# cooldown seconds (half open), and closes again when a probe succeeds.
+#
+# Streams aren't hedged, and can only fall back until their first chunk arrives.
+#
+# config keys used (all optional):
+#
+#   "router_enabled": False,
+#   "router_backends": ["gemini", "ollama", "gemini-live"],
+#   "router_audio_backends": ["gemini-live"],
+#   "router_mode": "prefer",              # "prefer" | "fastest"
+#   "router_hedge_delay": None,           # seconds, None = no hedging
+#   "router_failure_threshold": 3,
+#   "router_cooldown": 30.0,
+#   "router_ewma_alpha": 0.2,
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+ROUTER_MODES = ("prefer", "fastest")
+
+CallFn = Callable[[str], Awaitable[str]]
+StreamFn = Callable[[str], AsyncIterator[str]]
+
+
+class NoBackendAvailable(RuntimeError):
+    pass
+
+
+class BackendHealth:
+    __slots__ = (
+        "latency",
+        "error_rate",
+        "failures",
+        "state",
+        "opened_at",
+        "probing",
+        "requests",
+        "errors",
+    )
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.failures = 0  # consecutive
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.requests = 0
+        self.errors = 0
+
+
+class BackendRouter:
+    def __init__(
+        self,
+        backends: Sequence[str] = ("gemini", "ollama", "gemini-live"),
+        audio_backends: Sequence[str] = ("gemini-live",),
+        mode: str = "prefer",
+        hedge_delay: Optional[float] = None,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        ewma_alpha: float = 0.2,
+    ):
+        if mode not in ROUTER_MODES:
+            raise ValueError(f"Unsupported router_mode: {mode} (use one of {ROUTER_MODES})")
+        self.backends = list(backends)
+        self.audio_backends = set(audio_backends)
+        self.mode = mode
+        self.hedge_delay = hedge_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.alpha = ewma_alpha
+        self._health: Dict[str, BackendHealth] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "BackendRouter":
+        return cls(
+            backends=config.get("router_backends", ("gemini", "ollama", "gemini-live")),
+            audio_backends=config.get("router_audio_backends", ("gemini-live",)),
+            mode=config.get("router_mode", "prefer"),
+            hedge_delay=config.get("router_hedge_delay"),
+            failure_threshold=config.get("router_failure_threshold", 3),
+            cooldown=config.get("router_cooldown", 30.0),
+            ewma_alpha=config.get("router_ewma_alpha", 0.2),
+        )
+
+    def health(self, backend: str) -> BackendHealth:
+        health = self._health.get(backend)
+        if health is None:
+            health = self._health[backend] = BackendHealth()
+        return health
+
+    # ----- circuit breaker -----
+
+    def _available(self, backend: str, now: float) -> bool:
+        health = self.health(backend)
+        if health.state == CLOSED:
+            return True
+        if health.state == OPEN and now - health.opened_at >= self.cooldown:
+            health.state = HALF_OPEN
+            health.probing = False
+        # half open: exactly one probe at a time
+        return health.state == HALF_OPEN and not health.probing
+
+    def record_success(self, backend: str, latency: float) -> None:
+        health = self.health(backend)
+        health.latency = latency if health.latency is None else (
+            self.alpha * latency + (1 - self.alpha) * health.latency
+        )
+        health.error_rate *= 1 - self.alpha
+        health.failures = 0
+        health.probing = False
+        if health.state != CLOSED:
+            print(f"Backend {backend} recovered, closing its circuit breaker")
+        health.state = CLOSED
+
+    def record_failure(self, backend: str, error: BaseException) -> None:
+        health = self.health(backend)
+        health.errors += 1
+        health.error_rate = self.alpha + (1 - self.alpha) * health.error_rate
+        health.failures += 1
+        health.probing = False
+        if health.state == HALF_OPEN or (health.state == CLOSED and health.failures >= self.failure_threshold):
+            print(f"Backend {backend} failing ({error!r}), opening its circuit breaker")
+            health.state = OPEN
+            health.opened_at = time.monotonic()
+
+    # ----- selection -----
+
+    def candidates(self, requested: str, audio: bool = False) -> List[str]:
+        """
+        Backends to try for a request, in order, skipping open breakers.
+        """
+        now = time.monotonic()
+        others = [b for b in self.backends if b != requested and (not audio or b in self.audio_backends)]
+        # unknown latency sorts last among the others
+        others.sort(key=lambda b: (self.health(b).latency is None, self.health(b).latency or 0.0))
+
+        if self.mode == "fastest" and self.health(requested).latency is not None:
+            ordered = sorted(
+                [requested] + others,
+                key=lambda b: (self.health(b).latency is None, self.health(b).latency or 0.0),
+            )
+        else:
+            ordered = [requested] + others
+        return [b for b in ordered if self._available(b, now)]
+
+    def _begin(self, backend: str) -> float:
+        health = self.health(backend)
+        health.requests += 1
+        if health.state == HALF_OPEN:
+            health.probing = True
+        return time.perf_counter()
+
+    # ----- calls -----
+
+    async def chat(self, requested: str, call: CallFn, audio: bool = False) -> str:
+        """
+        Answer with call(backend) for the best candidate, hedging and falling back as configured.
+        """
+        queue = self.candidates(requested, audio)
+        if not queue:
+            raise NoBackendAvailable(f"No backend available for {requested} (circuit breakers open)")
+
+        pending: Dict["asyncio.Task[str]", str] = {}
+        started: Dict[str, float] = {}
+        first = queue[0]
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def launch() -> None:
+            backend = queue.pop(0)
+            started[backend] = self._begin(backend)
+            pending[asyncio.ensure_future(call(backend))] = backend
+
+        launch()
+        try:
+            while pending:
+                hedge = queue and self.hedge_delay is not None
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_delay if hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # slow answer: race the next candidate against it
+                    self.hedges += 1
+                    hedged = True
+                    launch()
+                    continue
+
+                for task in done:
+                    backend = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        self.record_success(backend, time.perf_counter() - started[backend])
+                        if hedged and backend != first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    self.record_failure(backend, error)
+                    last_error = error
+
+                if not pending and queue:
+                    self.fallbacks += 1
+                    launch()
+        finally:
+            for task, backend in pending.items():
+                task.cancel()
+                # a cancelled probe doesn't count either way
+                self.health(backend).probing = False
+
+        raise last_error
+
+    async def stream(self, requested: str, open_stream: StreamFn, audio: bool = False) -> AsyncIterator[str]:
+        """
+        Stream from the best candidate. Falls back while no chunk has been yielded yet.
+        """
+        queue = self.candidates(requested, audio)
+        if not queue:
+            raise NoBackendAvailable(f"No backend available for {requested} (circuit breakers open)")
+
+        last_error: Optional[BaseException] = None
+        for i, backend in enumerate(queue):
+            if i:
+                self.fallbacks += 1
+            start = self._begin(backend)
+            stream = open_stream(backend)
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                self.record_success(backend, time.perf_counter() - start)
+                return
+            except asyncio.CancelledError:
+                self.health(backend).probing = False
+                await stream.aclose()
+                raise
+            except Exception as e:
+                self.record_failure(backend, e)
+                last_error = e
+                await stream.aclose()
+                continue
+
+            # committed to this backend: latency is time to first chunk
+            self.record_success(backend, time.perf_counter() - start)
+            try:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+            except (GeneratorExit, asyncio.CancelledError):
+                raise
+            except Exception as e:
+                self.record_failure(backend, e)
+                raise
+            finally:
+                await stream.aclose()
+            return
+
+        raise last_error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "backends": {
+                backend: {
+                    "state": health.state,
+                    "latency_ms": round(health.latency * 1000, 1) if health.latency is not None else None,
+                    "error_rate": round(health.error_rate, 3),
+                    "requests": health.requests,
+                    "errors": health.errors,
+                }
+                for backend, health in self._health.items()
+            },
+        }
@@ -0,0 +1,119 @@
+"""
+Ollama admission control against a stub server whose per-request latency grows with the number
+of requests it is decoding at once (like a single local GPU). One "heavy" session fires a burst of
+long prompts while several light sessions send one short prompt each, repeatedly:
+
+    python benchmarks/bench_admission.py --light 8 --heavy-burst 16 --rounds 5
+    python benchmarks/bench_admission.py --batch-window 0.02      # micro-batch the short prompts
+
+Reports latency of the light sessions' turns with no admission control, with a fair queue, and
+with micro-batching on top.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_utils  # noqa: E402
+from admission import current_session  # noqa: E402
+from llm_utils import chat_messages, register_backend, unregister_backend  # noqa: E402
+
+
+class StubOllama:
+    """
+    Service time = base + per_char * prompt chars, times a slowdown for every other request
+    in flight beyond `parallel` (the server's parallel slots).
+    """
+
+    def __init__(self, base: float, per_char: float, parallel: int, contention: float):
+        self.base = base
+        self.per_char = per_char
+        self.parallel = parallel
+        self.contention = contention
+        self.in_flight = 0
+        self.peak = 0
+
+    async def chat(self, messages, **kwargs) -> str:
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            chars = sum(len(m["content"]) for m in messages)
+            overload = max(0, self.in_flight - self.parallel)
+            await asyncio.sleep((self.base + self.per_char * chars) * (1 + self.contention * overload))
+            return "ok"
+        finally:
+            self.in_flight -= 1
+
+
+async def run(label: str, args, admission: dict) -> None:
+    stub = StubOllama(args.base_ms / 1000, args.per_char_ms / 1000, args.parallel, args.contention)
+    register_backend("ollama", stub.chat)
+    llm_utils._admission = None
+    config = {"backend_max_concurrency": {}, **admission}
+
+    light_ms = []
+    heavy_ms = []
+
+    async def turn(session_id: str, prompt: str, out: list) -> None:
+        current_session.set(session_id)
+        start = time.perf_counter()
+        await chat_messages("ollama", config, [{"role": "user", "content": prompt}])
+        out.append((time.perf_counter() - start) * 1000)
+
+    async def heavy() -> None:
+        for _ in range(args.rounds):
+            await asyncio.gather(*(turn("heavy", "x" * 2000, heavy_ms) for _ in range(args.heavy_burst)))
+
+    async def light(i: int) -> None:
+        for _ in range(args.rounds):
+            await asyncio.sleep(0.01)
+            await turn(f"light-{i}", "what time is it?", light_ms)
+
+    start = time.perf_counter()
+    await asyncio.gather(heavy(), *(light(i) for i in range(args.light)))
+    elapsed = time.perf_counter() - start
+
+    ms = np.asarray(light_ms)
+    stats = llm_utils._admission.stats() if llm_utils._admission is not None else {}
+    print(
+        f"{label:16} light p50 {np.percentile(ms, 50):7.1f} ms  p95 {np.percentile(ms, 95):7.1f} ms  "
+        f"p99 {np.percentile(ms, 99):7.1f} ms  heavy p50 {np.percentile(heavy_ms, 50):7.1f} ms  "
+        f"total {elapsed:5.2f} s  server peak {stub.peak}  "
+        f"batched {stats.get('batched', 0)}  max queued {stats.get('max_queued', 0)}"
+    )
+    unregister_backend("ollama")
+
+
+async def main(args) -> None:
+    fair = {
+        "ollama_admission_enabled": True,
+        "ollama_max_in_flight": args.parallel,
+        "ollama_max_queue": 1024,
+    }
+    await run("no admission", args, {"ollama_admission_enabled": False})
+    await run("fair queue", args, fair)
+    await run("+ micro-batch", args, dict(
+        fair,
+        ollama_batch_window=args.batch_window,
+        ollama_batch_size=args.batch_size,
+    ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--light", type=int, default=8, help="sessions sending short prompts")
+    parser.add_argument("--heavy-burst", type=int, default=16, help="long prompts the heavy session sends at once")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--base-ms", type=float, default=20.0)
+    parser.add_argument("--per-char-ms", type=float, default=0.02)
+    parser.add_argument("--parallel", type=int, default=2, help="server parallel slots")
+    parser.add_argument("--contention", type=float, default=0.5, help="slowdown per request beyond --parallel")
+    parser.add_argument("--batch-window", type=float, default=0.02)
+    parser.add_argument("--batch-size", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
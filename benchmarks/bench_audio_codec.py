@@ -0,0 +1,72 @@
+"""
+Uplink audio codecs: bytes per second of speech on the wire and encode / decode CPU time per
+second of audio, chunk by chunk as cli_client sends them (synthetic speech-like PCM from
+bench_vad, or a 16-bit mono WAV file):
+
+    python benchmarks/bench_audio_codec.py --seconds 30 --rate 16000
+    python benchmarks/bench_audio_codec.py --wav speech.wav
+"""
+
+import argparse
+import os
+import sys
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_codec import available_codecs, new_decoder, new_encoder  # noqa: E402
+from bench_vad import synthetic_utterance  # noqa: E402
+
+
+def load(args):
+    if not args.wav:
+        return synthetic_utterance(args.seconds, args.rate), args.rate
+    with wave.open(args.wav, "rb") as f:
+        if f.getsampwidth() != 2 or f.getnchannels() != 1:
+            raise SystemExit("--wav must be 16-bit mono")
+        return f.readframes(f.getnframes()), f.getframerate()
+
+
+def main(args) -> None:
+    pcm, rate = load(args)
+    seconds = len(pcm) / 2 / rate
+    chunk = args.chunk * 2
+    chunks = [pcm[i:i + chunk] for i in range(0, len(pcm), chunk)]
+    print(f"{seconds:.1f} s of audio at {rate} Hz in {len(chunks)} chunks of {args.chunk} samples")
+    print(f"{'pcm':6} {len(pcm) / seconds / 1024:7.1f} KiB/s  ratio 1.000")
+
+    for name in available_codecs():
+        encode_cpu = decode_cpu = 0.0
+        wire = 0
+        for _ in range(args.repeat):
+            encoder = new_encoder(name, rate, 1, args.bitrate)
+            start = time.process_time()
+            payloads = [encoder.encode(c) for c in chunks]
+            payloads.append(encoder.flush())
+            encode_cpu += time.process_time() - start
+
+            decoder = new_decoder(name, rate, 1)
+            start = time.process_time()
+            decoded = b"".join(decoder.decode(p) for p in payloads if p)
+            decode_cpu += time.process_time() - start
+            wire = sum(len(p) for p in payloads)
+
+        lossless = decoded == pcm
+        print(
+            f"{name:6} {wire / seconds / 1024:7.1f} KiB/s  ratio {wire / len(pcm):5.3f}  "
+            f"encode {encode_cpu / args.repeat / seconds * 1000:6.2f} ms/s  "
+            f"decode {decode_cpu / args.repeat / seconds * 1000:6.2f} ms/s  "
+            f"{'lossless' if lossless else 'lossy'}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--rate", type=int, default=16000)
+    parser.add_argument("--wav", help="16-bit mono WAV to use instead of synthetic speech")
+    parser.add_argument("--chunk", type=int, default=1024, help="samples per chunk (cli_client's CHUNK)")
+    parser.add_argument("--bitrate", type=int, default=24000, help="opus bitrate")
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
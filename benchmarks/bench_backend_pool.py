@@ -0,0 +1,120 @@
+"""
+Per-turn latency: a fresh backend client per message vs. the pooled BackendRegistry.
+
+Runs a local keep-alive HTTP stub so no API key or network is needed:
+
+    python benchmarks/bench_backend_pool.py --turns 500 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend_registry import BackendRegistry  # noqa: E402
+
+RESPONSE_BODY = b'{"candidates":[{"content":{"parts":[{"text":"ok"}]}}]}'
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, delay: float) -> None:
+    # Minimal HTTP/1.1 keep-alive server: read headers + body, answer, repeat
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            if length:
+                await reader.readexactly(length)
+            if delay:
+                await asyncio.sleep(delay)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                b"Content-Length: %d\r\n\r\n%s" % (len(RESPONSE_BODY), RESPONSE_BODY)
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def _run(label, turn, turns, concurrency):
+    samples = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            start = time.perf_counter()
+            await turn()
+            samples.append((time.perf_counter() - start) * 1000)
+
+    wall = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(turns)))
+    wall = time.perf_counter() - wall
+
+    print(
+        f"{label:<22} p50={statistics.median(samples):7.2f}ms "
+        f"p99={_percentile(samples, 99):7.2f}ms  turns/s={turns / wall:8.1f}"
+    )
+
+
+async def main(args) -> None:
+    server = await asyncio.start_server(lambda r, w: _handle(r, w, args.delay), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/v1/models/stub:generateContent"
+    payload = {"contents": [{"role": "user", "parts": [{"text": "hello"}]}]}
+
+    async def per_turn_client():
+        # What chat_messages used to do: build the client, use it once, throw it away
+        async with httpx.AsyncClient() as client:
+            await client.post(url, json=payload)
+
+    registry = BackendRegistry(max_concurrency={"stub": args.concurrency})
+
+    async def pooled_client():
+        client = registry.get("stub", "stub-model", httpx.AsyncClient, timeout=30.0)
+        async with registry.limit("stub"):
+            await client.post(url, json=payload)
+
+    print(f"stub server on :{port}, {args.turns} turns, concurrency {args.concurrency}")
+    await _run("before (per turn)", per_turn_client, args.turns, args.concurrency)
+    await _run("after (pooled)", pooled_client, args.turns, args.concurrency)
+    print("registry:", registry.stats())
+
+    # Model construction cost on its own (no network): create_llm vs get_llm
+    try:
+        from llm_utils import create_llm, get_llm
+    except ImportError:
+        print("llm_utils backends not importable, skipping model construction timing")
+    else:
+        cfg = {"gemini_api_key": "bench-key"}
+        for label, build in (("create_llm (per turn)", create_llm), ("get_llm (pooled)", get_llm)):
+            start = time.perf_counter()
+            for _ in range(200):
+                build(backend="gemini", config=cfg)
+            print(f"{label:<22} {(time.perf_counter() - start) / 200 * 1000:7.3f}ms per turn")
+
+    registry.clear()
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=0.0, help="stub server think time (s)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,129 @@
+"""
+Fan-out of one event to many sockets: the old path (await ws.send_json per session, one after
+another) vs. ConnectionManager.broadcast (encode once, per-connection queues and writers).
+
+Runs in-process against stand-in sockets (optionally with a per-send delay); a few of them are
+slow consumers that never keep up:
+
+    python benchmarks/bench_broadcast.py --sockets 10000 --events 20 --slow 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from connection_manager import ConnectionManager, encode_json  # noqa: E402
+
+EVENT = {
+    "type": "suggestion",
+    "data": {"app_name": "Numbers", "message": "Try using Command+Option+N to create a new sheet."},
+}
+
+
+class FakeSocket:
+    """
+    Stands in for a starlette WebSocket; every send takes `delay` seconds.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.received = 0
+        self.done = asyncio.Event()
+        self.expect = 0
+
+    async def accept(self, subprotocol=None) -> None:
+        pass
+
+    async def close(self, code: int = 1000) -> None:
+        self.done.set()
+
+    async def _send(self) -> None:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        else:
+            await asyncio.sleep(0)
+        self.received += 1
+        if self.received >= self.expect:
+            self.done.set()
+
+    async def send_json(self, data) -> None:
+        # what starlette does: encode per call, then send
+        json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        await self._send()
+
+    async def send_text(self, text: str) -> None:
+        await self._send()
+
+
+def _sockets(n: int, slow: int, delay: float, slow_delay: float, expect: int):
+    sockets = [FakeSocket(slow_delay if i < slow else delay) for i in range(n)]
+    for ws in sockets:
+        ws.expect = expect
+    return sockets
+
+
+async def bench_sequential(args) -> float:
+    sockets = _sockets(args.sockets, args.slow, args.delay, args.slow_delay, args.events)
+    start = time.perf_counter()
+    for _ in range(args.events):
+        for ws in sockets:
+            await ws.send_json(EVENT)
+    return time.perf_counter() - start
+
+
+async def bench_broadcast(args):
+    manager = ConnectionManager(send_queue_size=args.queue_size, slow_consumer_policy=args.policy)
+    sockets = _sockets(args.sockets, args.slow, args.delay, args.slow_delay, args.events)
+    for i, ws in enumerate(sockets):
+        await manager.connect(ws, f"s{i}")
+
+    start = time.perf_counter()
+    for _ in range(args.events):
+        await manager.broadcast(EVENT)
+        await asyncio.sleep(0)
+    queued = time.perf_counter() - start
+    # every healthy socket has all events (slow ones were closed or are dropping)
+    await asyncio.gather(*(ws.done.wait() for ws in sockets[args.slow:]))
+    delivered = time.perf_counter() - start
+
+    stats = manager.stats()
+    for i in range(len(sockets)):
+        manager.disconnect(f"s{i}")
+    return queued, delivered, stats
+
+
+def main(args) -> None:
+    encode = time.perf_counter()
+    for _ in range(args.sockets):
+        encode_json(EVENT)
+    encode = time.perf_counter() - encode
+    print(f"encode_json x {args.sockets}: {encode * 1000:.1f} ms (broadcast does it once per event)")
+
+    total = args.sockets * args.events
+    if not args.skip_sequential:
+        elapsed = asyncio.run(bench_sequential(args))
+        print(f"sequential send_json   {elapsed:8.3f} s  {total / elapsed:10.0f} frames/s")
+
+    queued, delivered, stats = asyncio.run(bench_broadcast(args))
+    print(
+        f"broadcast              {delivered:8.3f} s  {total / delivered:10.0f} frames/s  "
+        f"(all queued after {queued * 1000:.1f} ms)  {stats}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds per send on a healthy socket")
+    parser.add_argument("--slow", type=int, default=10, help="number of slow consumers")
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="seconds per send on a slow socket")
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--policy", choices=("close", "drop"), default="close")
+    parser.add_argument("--skip-sequential", action="store_true")
+    main(parser.parse_args())
@@ -0,0 +1,216 @@
+"""
+Memory per idle /ws connection, and how fast the server reaps peers that stopped answering.
+
+Starts the server in a subprocess (fake backend, no upstream), opens N WebSocket connections
+that only answer the server's heartbeats, waits, and reports the server's RSS per connection.
+Then (with --silent) a share of the clients stop answering, and the run reports how many of
+them the heartbeats closed and how long it took:
+
+    python benchmarks/bench_idle_connections.py --clients 10000 --idle 10
+    python benchmarks/bench_idle_connections.py --clients 2000 --silent 0.5 --heartbeat-interval 2 --heartbeat-timeout 2
+
+Each side needs a file descriptor per connection (ulimit -n); connections are spread over
+several loopback source addresses so the client doesn't run out of ephemeral ports.
+The clients all run in this one process: with many thousand connections and timeouts of a
+few seconds it can answer heartbeats late, and answering clients get closed too. Keep the
+timeouts realistic (--heartbeat-interval 15 --heartbeat-timeout 15) for large runs.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import time
+from typing import Any, Dict, List
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORTS_PER_ADDRESS = 20000
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not start on port {port}")
+
+
+def _rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _raise_fd_limit() -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def serve(port: int, overrides: Dict[str, Any]) -> None:
+    _raise_fd_limit()
+    import uvicorn
+
+    from config import config
+
+    config.update(overrides)
+    from app import app, ws_server_options
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", backlog=4096, **ws_server_options())
+
+
+class IdleClient:
+    """
+    One mostly idle companion: answers heartbeats (unless silenced) and nothing else.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.ws = None
+        self.silent = False
+        self.closed_at = None
+        self.heartbeats = 0
+
+    async def run(self, url: str) -> None:
+        # 127.0.0.1, 127.0.0.2, ... so each source address stays within its ephemeral ports
+        local = f"127.0.0.{1 + self.index // PORTS_PER_ADDRESS}"
+        self.ws = await websockets.connect(url, open_timeout=120, ping_interval=None, local_addr=(local, 0))
+        try:
+            async for message in self.ws:
+                if self.silent:
+                    # stops answering, as if the peer had vanished, until the server closes
+                    await self.ws.wait_closed()
+                    break
+                data = json.loads(message)
+                if data.get("type") == "heartbeat":
+                    self.heartbeats += 1
+                    await self.ws.send(json.dumps({"type": "heartbeat"}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        self.closed_at = time.perf_counter()
+
+
+async def open_all(url: str, n: int, batch: int) -> List[IdleClient]:
+    clients = [IdleClient(i) for i in range(n)]
+    tasks = []
+    for start in range(0, n, batch):
+        group = clients[start:start + batch]
+        tasks += [asyncio.create_task(c.run(url)) for c in group]
+        while sum(c.ws is not None for c in group) < len(group):
+            if any(t.done() and t.exception() for t in tasks[start:]):
+                raise next(t.exception() for t in tasks[start:] if t.done() and t.exception())
+            await asyncio.sleep(0.01)
+    return clients
+
+
+async def client_main(args, url: str, server_pid: int) -> Dict[str, Any]:
+    # a few connections first, so the baseline includes the server's first-connection costs
+    warm = await open_all(url, 10, 10)
+    for c in warm:
+        await c.ws.close()
+    await asyncio.sleep(1.0)
+    rss_before = _rss_mb(server_pid)
+
+    start = time.perf_counter()
+    clients = await open_all(url, args.clients, args.batch)
+    connect_s = time.perf_counter() - start
+    await asyncio.sleep(args.idle)
+    rss_idle = _rss_mb(server_pid)
+    result: Dict[str, Any] = {
+        "clients": args.clients,
+        "connect_s": round(connect_s, 2),
+        "server_rss_mb": {"before": round(rss_before, 1), "idle": round(rss_idle, 1)},
+        "rss_per_connection_kb": round((rss_idle - rss_before) * 1024 / args.clients, 2),
+        "heartbeats_answered": sum(c.heartbeats for c in clients),
+    }
+
+    if args.silent:
+        silenced = clients[:int(len(clients) * args.silent)]
+        t_silent = time.perf_counter()
+        for c in silenced:
+            c.silent = True
+        deadline = t_silent + args.heartbeat_interval + args.heartbeat_timeout + args.heartbeat_tick * 2 + 15
+        while time.perf_counter() < deadline and any(c.closed_at is None for c in silenced):
+            await asyncio.sleep(0.1)
+        reaped = [c.closed_at - t_silent for c in silenced if c.closed_at is not None]
+        alive = clients[len(silenced):]
+        result["silent"] = {
+            "clients": len(silenced),
+            "reaped": len(reaped),
+            "reaped_after_s": round(max(reaped), 2) if reaped else None,
+            "answering_closed": sum(c.closed_at is not None for c in alive),
+            "server_rss_mb": round(_rss_mb(server_pid), 1),
+        }
+
+    for c in clients:
+        if c.closed_at is None:
+            await c.ws.close()
+    return result
+
+
+def main(args) -> None:
+    _raise_fd_limit()
+    port = _free_port()
+    overrides = {
+        "rate_limit_enabled": False,
+        "suggestions_enabled": False,
+        "heartbeat_interval": args.heartbeat_interval,
+        "heartbeat_timeout": args.heartbeat_timeout,
+        "heartbeat_tick": args.heartbeat_tick,
+        "idle_timeout": 0,
+    }
+    server = multiprocessing.Process(target=serve, args=(port, overrides), daemon=True)
+    server.start()
+    try:
+        _wait_for_port(port)
+        result = asyncio.run(client_main(args, f"ws://127.0.0.1:{port}/ws", server.pid))
+    finally:
+        server.terminate()
+        server.join()
+
+    print(f"{result['clients']} idle connections in {result['connect_s']} s: server RSS "
+          f"{result['server_rss_mb']['before']} -> {result['server_rss_mb']['idle']} MB, "
+          f"{result['rss_per_connection_kb']} KB per connection "
+          f"({result['heartbeats_answered']} heartbeats answered)")
+    if "silent" in result:
+        silent = result["silent"]
+        print(f"{silent['clients']} went silent: {silent['reaped']} reaped within {silent['reaped_after_s']} s, "
+              f"{silent['answering_closed']} answering ones closed too, "
+              f"server RSS {silent['server_rss_mb']} MB")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=200, help="connections opened at once")
+    parser.add_argument("--idle", type=float, default=5.0, help="seconds to sit idle before measuring")
+    parser.add_argument("--silent", type=float, default=0.0, help="share of clients that then stop answering")
+    parser.add_argument("--heartbeat-interval", type=float, default=2.0)
+    parser.add_argument("--heartbeat-timeout", type=float, default=2.0)
+    parser.add_argument("--heartbeat-tick", type=float, default=0.5)
+    parser.add_argument("--json", help="also write the results here")
+    main(parser.parse_args())
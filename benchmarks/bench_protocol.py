@@ -0,0 +1,99 @@
+"""
+Per-message cost of the /ws protocol layer: decode + validate + dispatch of inbound frames
+(old if/elif chain over json.loads vs. Codec + handler table), and encode of outbound frames
+for each protocol and encoding:
+
+    python benchmarks/bench_protocol.py --messages 200000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocol import ENCODINGS, PROTOCOLS, Codec  # noqa: E402
+
+INBOUND = [
+    {"type": "ping"},
+    {"type": "context", "data": {"app_name": "Numbers", "window_title": "Budget", "action": "typed in B4"}},
+    {"type": "user_message", "text": "How do I freeze the top row?", "stream": True},
+    {"type": "cancel", "message_id": "0776e497-a95e-4c01-83dd-261d701bc980"},
+    {"type": "audio_end"},
+]
+
+OUTBOUND = [
+    {"type": "pong", "session_id": "d8f3de71-9ef6-4b8d-9c9b-76070ca68086"},
+    {"type": "status", "status": "thinking", "session_id": "d8f3de71", "message_id": "0776e497"},
+    {"type": "response_delta", "text": "To freeze the top row, select it and ", "session_id": "d8f3de71",
+     "message_id": "0776e497"},
+    {"type": "response", "text": "To sum a column, use the SUM function." * 4, "session_id": "d8f3de71",
+     "message_id": "0776e497"},
+]
+
+ORDER = ["ping", "cancel", "audio_format", "audio_start", "audio_end", "user_message", "context"]
+
+
+def old_dispatch(text: str) -> int:
+    # what the receive loop did before: json.loads, then an if chain on the type
+    data = json.loads(text)
+    msg_type = data.get("type")
+    if msg_type == "ping":
+        return 0
+    if msg_type == "cancel":
+        return 1
+    if msg_type == "audio_format" or (msg_type == "audio_start" and "encoding" in data):
+        return 2
+    if msg_type == "audio_start":
+        return 3
+    if msg_type == "audio_end":
+        return 4
+    if msg_type == "user_message":
+        return 5 if data.get("text", "").strip() else -1
+    if msg_type == "context":
+        return 6
+    return -1
+
+
+def timed(label: str, fn, frames, n: int) -> None:
+    count = len(frames)
+    start = time.perf_counter()
+    for i in range(n):
+        fn(frames[i % count])
+    elapsed = time.perf_counter() - start
+    print(f"{label:40} {elapsed / n * 1e9:8.0f} ns/msg")
+
+
+def main(args) -> None:
+    handlers = {name: (lambda data, i=i: i) for i, name in enumerate(ORDER)}
+
+    print("inbound (decode + validate + dispatch)")
+    timed("json if-chain (before)", old_dispatch, [json.dumps(m) for m in INBOUND], args.messages)
+    for encoding in ENCODINGS:
+        codec = Codec("app.v1", encoding)
+        frames = [codec.encode(m) for m in INBOUND]
+
+        def new_dispatch(frame, codec=codec):
+            data, validate = codec.decode(frame)
+            if validate is None or validate(data) is not None:
+                return -1
+            return handlers[data["type"]](data)
+
+        timed(f"Codec app.v1+{encoding}", new_dispatch, frames, args.messages)
+
+    print("outbound (translate + encode)")
+    timed("json.dumps (starlette send_json)", lambda m: json.dumps(m, separators=(",", ":"), ensure_ascii=False),
+          OUTBOUND, args.messages)
+    for protocol in PROTOCOLS:
+        for encoding in ENCODINGS:
+            codec = Codec(protocol, encoding)
+            sizes = sum(len(codec.encode(m)) for m in OUTBOUND) / len(OUTBOUND)
+            timed(f"Codec {codec.name} ({sizes:.0f} B avg)", codec.encode, OUTBOUND, args.messages)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200000)
+    main(parser.parse_args())
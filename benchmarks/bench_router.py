@@ -0,0 +1,114 @@
+"""
+BackendRouter against local stub backends: a primary with a long latency tail, random failures
+and an outage in the middle of the run, and a steadier secondary. Compares calling the primary
+directly, routing with fallback + circuit breaker, and routing with hedged requests on top:
+
+    python benchmarks/bench_router.py --requests 2000 --concurrency 20 --hedge-delay 0.15
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend_router import BackendRouter  # noqa: E402
+
+
+class StubBackend:
+    """
+    Latency ~ lognormal(median, sigma); fails with `failure_rate`, and always while `down`.
+    """
+
+    def __init__(self, name: str, median: float, sigma: float, failure_rate: float, seed: int):
+        self.name = name
+        self.median = median
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+        self.down = False
+        self.calls = 0
+        self.cancelled = 0
+        self._rng = random.Random(seed)
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        try:
+            if self.down:
+                await asyncio.sleep(0.01)
+                raise ConnectionError(f"{self.name} is down")
+            await asyncio.sleep(self.median * self._rng.lognormvariate(0, self.sigma))
+            if self._rng.random() < self.failure_rate:
+                raise RuntimeError(f"{self.name}: 429 rate limited")
+            return f"answer from {self.name}"
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+async def run(label: str, args, router_kwargs=None) -> None:
+    backends = {
+        "primary": StubBackend("primary", args.primary_ms / 1000, 0.8, args.failure_rate, 1),
+        "secondary": StubBackend("secondary", args.secondary_ms / 1000, 0.3, 0.0, 2),
+    }
+    router = BackendRouter(backends=list(backends), audio_backends=(), **router_kwargs) if router_kwargs else None
+
+    latencies = []
+    errors = 0
+    done = 0
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def one() -> None:
+        nonlocal errors, done
+        async with sem:
+            # outage during the middle third of the run
+            backends["primary"].down = args.requests // 3 <= done < 2 * args.requests // 3
+            start = time.perf_counter()
+            try:
+                if router is None:
+                    await backends["primary"]()
+                else:
+                    await router.chat("primary", lambda name: backends[name]())
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+            done += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    ms = np.asarray(latencies) * 1000
+    calls = " ".join(f"{b.name}={b.calls} (cancelled {b.cancelled})" for b in backends.values())
+    print(
+        f"{label:18} errors {errors / args.requests:6.1%}  p50 {np.percentile(ms, 50):7.1f} ms  "
+        f"p95 {np.percentile(ms, 95):7.1f} ms  p99 {np.percentile(ms, 99):7.1f} ms  "
+        f"{args.requests / elapsed:6.0f} req/s  calls: {calls}"
+    )
+    if router is not None:
+        stats = router.stats()
+        print(f"{'':18} hedges {stats['hedges']} (won {stats['hedge_wins']}), fallbacks {stats['fallbacks']}, "
+              f"primary breaker {stats['backends']['primary']['state']}")
+
+
+async def main(args) -> None:
+    breaker = {"failure_threshold": 3, "cooldown": args.cooldown}
+    await run("direct", args)
+    await run("fallback+breaker", args, breaker)
+    await run("+ hedging", args, dict(breaker, hedge_delay=args.hedge_delay))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--primary-ms", type=float, default=60.0, help="median primary latency")
+    parser.add_argument("--secondary-ms", type=float, default=120.0, help="median secondary latency")
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--hedge-delay", type=float, default=0.15)
+    parser.add_argument("--cooldown", type=float, default=0.5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,81 @@
+"""
+Server startup cost per backend configuration: each configuration runs in a fresh interpreter
+that imports app (as a uvicorn worker does) and runs the startup warm-up, then reports the time
+each step took and the resident memory afterwards.
+
+    python benchmarks/bench_startup.py --repeat 3
+    python benchmarks/bench_startup.py --configs none,ollama,gemini,all,eager
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (WARMUP_BACKENDS, also import every SDK up front like the old llm_utils did)
+CONFIGS = {
+    "none": ("", False),
+    "ollama": ("ollama", False),
+    "gemini": ("gemini", False),
+    "gemini-live": ("gemini-live", False),
+    "all": ("gemini,ollama,gemini-live", False),
+    "eager": ("", True),
+}
+
+CHILD = r"""
+import asyncio, json, sys, time
+start = time.perf_counter()
+if EAGER:
+    from backend_registry import BACKEND_MODULES, load_backend
+    for backend in BACKEND_MODULES:
+        load_backend(backend)
+import app
+imported = time.perf_counter()
+asyncio.run(app.warm_up(app.config))
+warm = time.perf_counter()
+rss = 0
+with open("/proc/self/status") as f:
+    for line in f:
+        if line.startswith("VmRSS:"):
+            rss = int(line.split()[1]) * 1024
+print(json.dumps({"import": imported - start, "warm_up": warm - imported, "rss": rss}))
+"""
+
+
+def run(name: str) -> dict:
+    backends, eager = CONFIGS[name]
+    env = dict(os.environ, WARMUP_BACKENDS=backends)
+    env.setdefault("GEMINI_API_KEY", "bench-placeholder")
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", CHILD.replace("EAGER", str(eager))],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(args) -> None:
+    results = {}
+    for name in args.configs.split(","):
+        runs = [run(name) for _ in range(args.repeat)]
+        results[name] = {key: float(np.median([r[key] for r in runs])) for key in runs[0]}
+        r = results[name]
+        print(
+            f"{name:12} import app {r['import'] * 1000:7.0f} ms  warm-up {r['warm_up'] * 1000:7.0f} ms  "
+            f"ready {(r['import'] + r['warm_up']) * 1000:7.0f} ms  RSS {r['rss'] / 2**20:6.1f} MB"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", default=",".join(CONFIGS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="also write the medians to this file")
+    main(parser.parse_args())
@@ -0,0 +1,80 @@
+"""
+VAD throughput on synthetic push-to-talk PCM (leading/trailing silence around speech-like bursts).
+
+    python benchmarks/bench_vad.py --seconds 60 --rate 16000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio import AudioBuffer  # noqa: E402
+from vad import VadGate, trim_in_place  # noqa: E402
+
+
+def synthetic_utterance(seconds: float, rate: int, seed: int = 0) -> bytes:
+    """
+    ~25% leading silence, speech-like bursts with short pauses, ~25% trailing silence.
+    Silence is low-level noise (-60 dBFS), speech is a modulated harmonic tone plus noise.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * rate)
+    out = rng.normal(0, 30, n)
+
+    t = np.arange(n) / rate
+    voice = np.zeros(n)
+    for k in (1, 2, 3):
+        voice += np.sin(2 * np.pi * 140 * k * t) / k
+    envelope = (np.sin(2 * np.pi * 2.5 * t) > -0.3).astype(float)  # syllables with gaps
+    speech = slice(n // 4, 3 * n // 4)
+    out[speech] += 6000 * voice[speech] * envelope[speech] + rng.normal(0, 300, speech.stop - speech.start)
+
+    return np.clip(out, -32768, 32767).astype("<i2").tobytes()
+
+
+def main(args) -> None:
+    pcm = synthetic_utterance(args.seconds, args.rate)
+    buf = AudioBuffer(len(pcm))
+    audio_seconds = args.seconds * args.repeat
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        buf.start()
+        buf.append(pcm)
+        removed = trim_in_place(buf, args.rate, max_pause_ms=args.max_pause_ms)
+    elapsed = time.perf_counter() - start
+    print(
+        f"trim_in_place  {len(pcm) / 1024:8.1f} KiB -> {buf.size / 1024:8.1f} KiB "
+        f"(removed {removed / len(pcm):5.1%})  {elapsed / args.repeat * 1000:7.2f} ms/utterance  "
+        f"{audio_seconds / elapsed:8.0f}x real time"
+    )
+
+    chunk = args.chunk_ms * args.rate // 1000 * 2
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        gate = VadGate(args.rate, max_pause_ms=args.max_pause_ms)
+        sent = 0
+        for i in range(0, len(pcm), chunk):
+            sent += sum(len(c) for c in gate.feed(pcm[i:i + chunk]))
+        sent += sum(len(c) for c in gate.finish())
+    elapsed = time.perf_counter() - start
+    print(
+        f"VadGate ({args.chunk_ms} ms) {len(pcm) / 1024:6.1f} KiB -> {sent / 1024:8.1f} KiB "
+        f"(removed {gate.removed / len(pcm):5.1%})  {elapsed / args.repeat * 1000:7.2f} ms/utterance  "
+        f"{audio_seconds / elapsed:8.0f}x real time"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--rate", type=int, default=16000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--chunk-ms", type=int, default=64)
+    parser.add_argument("--max-pause-ms", type=int, default=None)
+    main(parser.parse_args())
@@ -0,0 +1,161 @@
+"""
+/ws throughput vs. uvicorn worker count, with sessions routed through the SQLite session router.
+
+For each worker count, starts `uvicorn app:app --workers N` and drives it from several client
+processes. Every client does ping/pong round trips on its socket, and out-of-band events are
+POSTed to /sessions/{id}/events, which usually land on a worker that doesn't own the socket
+and have to be forwarded:
+
+    python benchmarks/bench_workers.py --workers 1 2 4 --clients 200 --seconds 10
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not start on port {port}")
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def _client_main(port: int, clients: int, seconds: float, push_rate: float):
+    url = f"ws://127.0.0.1:{port}/ws"
+    sockets = []
+    for _ in range(clients):
+        ws = await websockets.connect(url, max_queue=None)
+        started = json.loads(await ws.recv())
+        sockets.append((ws, started["session_id"]))
+
+    pongs = 0
+    event_latencies = []
+    deadline = time.monotonic() + seconds
+
+    async def pinger(ws):
+        nonlocal pongs
+        while time.monotonic() < deadline:
+            await ws.send(json.dumps({"type": "ping"}))
+            while True:
+                msg = json.loads(await ws.recv())
+                if msg["type"] == "pong":
+                    pongs += 1
+                    break
+                if msg["type"] == "suggestion":
+                    event_latencies.append(time.time() - msg["data"]["sent_at"])
+
+    async def pusher():
+        pushed = 0
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as http:
+            while time.monotonic() < deadline:
+                _, session_id = random.choice(sockets)
+                event = {"type": "suggestion", "data": {"message": "bench", "sent_at": time.time()}}
+                response = await http.post(f"/sessions/{session_id}/events", json=event)
+                pushed += response.status_code == 200
+                await asyncio.sleep(1.0 / push_rate)
+        return pushed
+
+    results = await asyncio.gather(pusher(), *(pinger(ws) for ws, _ in sockets))
+    for ws, _ in sockets:
+        await ws.close()
+    return pongs, results[0], event_latencies
+
+
+def _client_process(args):
+    return asyncio.run(_client_main(*args))
+
+
+def run(workers: int, args) -> dict:
+    tmp = tempfile.mkdtemp(prefix="bench_workers_")
+    port = _free_port()
+    env = dict(
+        os.environ,
+        SESSION_ROUTER="sqlite",
+        SESSION_ROUTER_PATH=os.path.join(tmp, "sessions.db"),
+        SESSION_PUSH="1",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+    try:
+        _wait_for_port(port)
+        time.sleep(1.0)  # let every worker finish its startup
+        per_proc = max(1, args.clients // args.client_procs)
+        job = (port, per_proc, args.seconds, args.push_rate / args.client_procs)
+        with multiprocessing.Pool(args.client_procs) as pool:
+            results = pool.map(_client_process, [job] * args.client_procs)
+    finally:
+        server.terminate()
+        server.wait()
+
+    pongs = sum(r[0] for r in results)
+    pushed = sum(r[1] for r in results)
+    latencies = [lat for r in results for lat in r[2]]
+    return {
+        "workers": workers,
+        "clients": per_proc * args.client_procs,
+        "pings_per_s": round(pongs / args.seconds),
+        "events_pushed": pushed,
+        "events_received": len(latencies),
+        "event_p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "event_p95_ms": round(_percentile(latencies, 95) * 1000, 2),
+    }
+
+
+def main(args) -> None:
+    print(f"{os.cpu_count()} CPU(s)")
+    rows = [run(n, args) for n in args.workers]
+    for row in rows:
+        print(
+            f"workers={row['workers']:<2} clients={row['clients']:<5} "
+            f"{row['pings_per_s']:>8} pings/s  events {row['events_received']}/{row['events_pushed']}  "
+            f"p50 {row['event_p50_ms']:.2f} ms  p95 {row['event_p95_ms']:.2f} ms"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--client-procs", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--push-rate", type=float, default=200.0, help="out-of-band events per second")
+    parser.add_argument("--json", help="also write the results to this file")
+    main(parser.parse_args())
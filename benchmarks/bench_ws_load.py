@@ -0,0 +1,292 @@
+"""
+Load test for the /ws endpoint against the deterministic fake backend (fake_backend.py).
+
+Starts the server in a subprocess, then drives N concurrent WebSocket clients that behave like
+cli_client.GeminiClient: text messages (streamed or not), pings and push-to-talk audio
+(audio_start, PCM chunks, audio_end), mixed by weight. Reports connect time, time to first
+byte of each answer (streamed and not), full-turn latency percentiles, messages per second
+and server RSS:
+
+    python benchmarks/bench_ws_load.py --clients 1000 --seconds 30 --json results.json
+    python benchmarks/bench_ws_load.py --url ws://127.0.0.1:8000/ws   # an already running server
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import websockets
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+TEXTS = [
+    "How do I freeze the top row?",
+    "How do I sum a column?",
+    "What does VLOOKUP do?",
+    "How do I sort by two columns?",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not start on port {port}")
+
+
+def _rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    arr = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(np.percentile(arr, 50)), 2),
+        "p95_ms": round(float(np.percentile(arr, 95)), 2),
+        "p99_ms": round(float(np.percentile(arr, 99)), 2),
+        "max_ms": round(float(arr.max()), 2),
+    }
+
+
+def _speech_pcm(seconds: float, rate: int) -> bytes:
+    # A loud harmonic tone (speech as far as the VAD is concerned), with silence around it
+    t = np.arange(int(seconds * rate)) / rate
+    pcm = 8000 * np.sin(2 * np.pi * 220 * t)
+    pcm[: len(pcm) // 5] = 0
+    pcm[-len(pcm) // 5:] = 0
+    return pcm.astype("<i2").tobytes()
+
+
+class LoadClient:
+    """
+    One simulated user: one socket, one request at a time.
+    """
+
+    def __init__(self, url: str, args, rng: random.Random, stats: Dict[str, list]):
+        self.url = url
+        self.args = args
+        self.rng = rng
+        self.stats = stats
+        self.ws = None
+        self.rate = 16000
+
+    async def connect(self) -> None:
+        start = time.perf_counter()
+        self.ws = await websockets.connect(self.url, max_queue=None, open_timeout=60)
+        started = json.loads(await self.ws.recv())
+        self.rate = started.get("audio", {}).get("sample_rate", self.rate)
+        self.stats["connect"].append(time.perf_counter() - start)
+
+    async def _recv(self) -> dict:
+        msg = json.loads(await self.ws.recv())
+        self.stats["received"][0] += 1
+        return msg
+
+    async def ping(self) -> None:
+        start = time.perf_counter()
+        await self.ws.send(json.dumps({"type": "ping"}))
+        while (await self._recv())["type"] != "pong":
+            pass
+        self.stats["ping"].append(time.perf_counter() - start)
+
+    async def _read_answer(self, start: float, streamed: bool = False) -> None:
+        first: Optional[float] = None
+        while True:
+            msg = await self._recv()
+            kind = msg["type"]
+            if kind in ("response", "response_delta", "error") and first is None:
+                first = time.perf_counter() - start
+            if kind in ("response", "response_end"):
+                self.stats["ttfb_stream" if streamed else "ttfb"].append(first)
+                self.stats["turn"].append(time.perf_counter() - start)
+                return
+            if kind == "error":
+                self.stats["errors"][0] += 1
+                return
+            if kind == "status" and msg.get("status") == "no_speech":
+                return
+
+    async def text(self) -> None:
+        stream = self.rng.random() < self.args.stream_ratio
+        start = time.perf_counter()
+        await self.ws.send(json.dumps({
+            "type": "user_message",
+            "text": self.rng.choice(TEXTS),
+            "backend": "fake",
+            "stream": stream,
+        }))
+        await self._read_answer(start, stream)
+
+    async def audio(self, pcm: bytes) -> None:
+        start = time.perf_counter()
+        await self.ws.send(json.dumps({"type": "audio_start", "encoding": "pcm_s16le", "sample_rate": self.rate}))
+        chunk = self.rate * 2 * self.args.chunk_ms // 1000
+        for i in range(0, len(pcm), chunk):
+            await self.ws.send(pcm[i:i + chunk])
+        await self.ws.send(json.dumps({"type": "audio_end"}))
+        await self._read_answer(start)
+
+    async def run(self, deadline: float) -> None:
+        pcm = _speech_pcm(self.args.audio_seconds, self.rate)
+        actions = [self.text, self.ping, lambda: self.audio(pcm)]
+        weights = [self.args.text_weight, self.args.ping_weight, self.args.audio_weight]
+        try:
+            while time.monotonic() < deadline:
+                await self.rng.choices(actions, weights)[0]()
+                if self.args.think_time:
+                    await asyncio.sleep(self.rng.uniform(0, 2 * self.args.think_time))
+        except websockets.ConnectionClosed:
+            self.stats["dropped"][0] += 1
+        finally:
+            await self.ws.close()
+
+
+async def _client_main(url: str, clients: int, args, seed: int) -> Dict[str, list]:
+    stats: Dict[str, list] = {
+        "connect": [], "ttfb": [], "ttfb_stream": [], "turn": [], "ping": [],
+        "received": [0], "errors": [0], "dropped": [0], "connect_failed": [0],
+    }
+    rng = random.Random(seed)
+    loads = [LoadClient(url, args, random.Random(rng.random()), stats) for _ in range(clients)]
+
+    # ramp up in batches so the accept queue isn't flooded
+    connected = []
+    for i in range(0, len(loads), args.connect_batch):
+        batch = loads[i:i + args.connect_batch]
+        results = await asyncio.gather(*(c.connect() for c in batch), return_exceptions=True)
+        for client, result in zip(batch, results):
+            if isinstance(result, BaseException):
+                stats["connect_failed"][0] += 1
+            else:
+                connected.append(client)
+
+    start = time.monotonic()
+    await asyncio.gather(*(c.run(start + args.seconds) for c in connected))
+    stats["elapsed"] = [time.monotonic() - start]
+    return stats
+
+
+def _client_process(job) -> Dict[str, list]:
+    return asyncio.run(_client_main(*job))
+
+
+def run(args) -> dict:
+    server = None
+    url = args.url
+    if url is None:
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "fake_backend.py"), "--port", str(port),
+             "--latency", str(args.latency), "--tokens-per-s", str(args.tokens_per_s),
+             "--failure-rate", str(args.failure_rate)],
+        )
+        _wait_for_port(port)
+        url = f"ws://127.0.0.1:{port}/ws"
+
+    rss_idle = _rss_mb(server.pid) if server else 0.0
+    rss_peak = rss_idle
+    try:
+        per_proc = max(1, args.clients // args.client_procs)
+        jobs = [(url, per_proc, args, i) for i in range(args.client_procs)]
+        with multiprocessing.Pool(args.client_procs) as pool:
+            pending = pool.map_async(_client_process, jobs)
+            while not pending.ready():
+                pending.wait(0.5)
+                if server:
+                    rss_peak = max(rss_peak, _rss_mb(server.pid))
+            results = pending.get()
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    merged: Dict[str, list] = {}
+    for stats in results:
+        for key, values in stats.items():
+            merged.setdefault(key, []).extend(values)
+    elapsed = max(merged["elapsed"])
+    turns = len(merged["turn"])
+
+    return {
+        "params": {
+            key: getattr(args, key)
+            for key in ("clients", "client_procs", "seconds", "text_weight", "ping_weight", "audio_weight",
+                        "stream_ratio", "latency", "tokens_per_s", "failure_rate", "think_time")
+        },
+        "connected": args.clients - sum(merged["connect_failed"]),
+        "connect_failed": sum(merged["connect_failed"]),
+        "dropped": sum(merged["dropped"]),
+        "errors": sum(merged["errors"]),
+        "connect": _percentiles(merged["connect"]),
+        "ttfb": _percentiles(merged["ttfb"]),
+        "ttfb_stream": _percentiles(merged["ttfb_stream"]),
+        "turn": _percentiles(merged["turn"]),
+        "ping": _percentiles(merged["ping"]),
+        "turns_per_s": round(turns / elapsed, 1),
+        "messages_per_s": round(sum(merged["received"]) / elapsed, 1),
+        "server_rss_mb": {"idle": round(rss_idle, 1), "peak": round(rss_peak, 1)},
+    }
+
+
+def main(args) -> None:
+    result = run(args)
+    for key in ("connect", "ttfb", "ttfb_stream", "turn", "ping"):
+        print(f"{key:11} {result[key]}")
+    print(
+        f"connected {result['connected']} (failed {result['connect_failed']}, dropped {result['dropped']}), "
+        f"errors {result['errors']}, {result['turns_per_s']} turns/s, {result['messages_per_s']} msgs/s, "
+        f"server RSS {result['server_rss_mb']['idle']} -> {result['server_rss_mb']['peak']} MB"
+    )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="drive an already running server instead of starting one")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--client-procs", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--connect-batch", type=int, default=100)
+    parser.add_argument("--text-weight", type=float, default=6)
+    parser.add_argument("--ping-weight", type=float, default=3)
+    parser.add_argument("--audio-weight", type=float, default=1)
+    parser.add_argument("--stream-ratio", type=float, default=0.5, help="share of text turns that stream")
+    parser.add_argument("--audio-seconds", type=float, default=2.0)
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean pause between actions (s)")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake backend: seconds to first token")
+    parser.add_argument("--tokens-per-s", type=float, default=50.0)
+    parser.add_argument("--failure-rate", type=float, default=0.01)
+    parser.add_argument("--json", help="also write the results to this file")
+    main(parser.parse_args())
@@ -0,0 +1,107 @@
+"""
+Deterministic fake LLM backend, and a server launcher that plugs it into app.py.
+
+The fake answers every request (text and audio) with text derived from the last message,
+after a fixed latency, streamed at a fixed token rate, and fails a given fraction of turns:
+
+    python benchmarks/fake_backend.py --port 8000 --latency 0.2 --tokens-per-s 50 --failure-rate 0.01
+
+Clients then use backend "fake" for text; audio turns go to it as well (it replaces
+gemini-live, and live sessions are turned off).
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sys
+from typing import Any, AsyncIterator, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = (
+    "the sheet row column formula cell value chart sum filter sort freeze pane "
+    "select copy paste table range total average format style number text"
+).split()
+
+
+class FakeBackendError(RuntimeError):
+    pass
+
+
+class FakeBackend:
+    def __init__(
+        self,
+        latency: float = 0.2,
+        tokens_per_s: float = 50.0,
+        answer_tokens: int = 40,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.tokens_per_s = tokens_per_s
+        self.answer_tokens = answer_tokens
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    def answer(self, messages: List[Dict[str, str]], audio_data: Any = None) -> List[str]:
+        """
+        Same prompt, same answer: tokens picked from a hash of the last message.
+        """
+        prompt = messages[-1]["content"] if messages else ""
+        digest = hashlib.sha256(prompt.encode("utf-8") + (b"audio" if audio_data else b"")).digest()
+        return [WORDS[digest[i % len(digest)] % len(WORDS)] + " " for i in range(self.answer_tokens)]
+
+    def _maybe_fail(self) -> None:
+        self.calls += 1
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise FakeBackendError("fake backend failure")
+
+    async def chat(self, messages: List[Dict[str, str]], audio_data: Any = None, **_: Any) -> str:
+        tokens = self.answer(messages, audio_data)
+        await asyncio.sleep(self.latency + (len(tokens) / self.tokens_per_s if self.tokens_per_s else 0))
+        self._maybe_fail()
+        return "".join(tokens)
+
+    async def stream(self, messages: List[Dict[str, str]], audio_data: Any = None, **_: Any) -> AsyncIterator[str]:
+        tokens = self.answer(messages, audio_data)
+        await asyncio.sleep(self.latency)
+        self._maybe_fail()
+        delay = 1.0 / self.tokens_per_s if self.tokens_per_s else 0
+        for token in tokens:
+            if delay:
+                await asyncio.sleep(delay)
+            yield token
+
+
+def main(args) -> None:
+    import uvicorn
+
+    from config import config
+    from llm_utils import register_backend
+
+    # Everything goes to the fake: no live connections, no caches hiding the load
+    config["live_sessions"] = False
+    config["response_cache_enabled"] = False
+    config["backend_max_concurrency"] = {}
+
+    fake = FakeBackend(args.latency, args.tokens_per_s, args.answer_tokens, args.failure_rate, args.seed)
+    for name in ("fake", "gemini-live"):
+        register_backend(name, fake.chat, fake.stream)
+
+    from app import app, ws_server_options
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", **ws_server_options())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-s", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,428 @@
+"""
+Replay a traffic capture (see recorder.py) to reproduce a production traffic pattern offline.
+
+The server runs in this process (in its own thread and event loop) with every backend
+replaced by a stub that answers each call after the latencies recorded for it, in as many
+chunks and characters. Sessions connect, send their messages and audio, and close at their
+recorded times, divided by --speed. Reports time to the first reply frame and to the end of
+each turn, recorded vs replayed:
+
+    python benchmarks/replay_traffic.py captures/
+    python benchmarks/replay_traffic.py captures/capture-20260101-120000-0003.jsonl.gz --speed 10
+    python benchmarks/replay_traffic.py captures/ --url ws://127.0.0.1:8000/ws   # a running server
+
+Messages are sent in the native protocol as JSON (whatever dialect was recorded), audio as
+synthetic speech PCM of the recorded chunk sizes (compressed uploads are sent as PCM of the
+compressed size), and acks of resumed sessions are left out.
+"""
+
+import argparse
+import asyncio
+import functools
+import gzip
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_vad import synthetic_utterance  # noqa: E402
+
+# reply frames that show the turn is answering, and the ones that end it
+FIRST_TYPES = ("response", "response_delta", "audio_start")
+DONE_TYPES = ("response", "response_end", "error", "cancelled")
+# call outcomes that were the caller giving up, not the backend failing
+NOT_FAILURES = ("CancelledError", "GeneratorExit")
+
+# (t in seconds, frame type, message_id)
+Frame = Tuple[float, str, Optional[str]]
+
+
+class RecordedSession:
+    __slots__ = ("session_id", "start", "events", "frames", "calls")
+
+    def __init__(self, session_id: str, start: float):
+        self.session_id = session_id
+        self.start = start
+        # (t, kind, data) of what the client did: "in" messages and its "close"
+        self.events: List[Tuple[float, str, Dict[str, Any]]] = []
+        self.frames: List[Frame] = []
+        self.calls: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+
+
+def capture_files(paths: List[str]) -> List[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, n) for n in os.listdir(path) if n.startswith("capture-"))
+        else:
+            files.append(path)
+    return files
+
+
+def load(paths: List[str]) -> Dict[str, RecordedSession]:
+    """
+    Sessions of the capture files, in the order they connected (sessions whose
+    start was rotated away are left out).
+    """
+    sessions: Dict[str, RecordedSession] = {}
+    for path in capture_files(paths):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    t, kind, session_id, data = json.loads(line)
+                except ValueError:
+                    # the last line of a file that was being written when the server died
+                    continue
+                t /= 1000
+                session = sessions.get(session_id)
+                if kind == "open":
+                    if session is None:
+                        sessions[session_id] = RecordedSession(session_id, t)
+                elif session is None:
+                    continue
+                elif kind in ("in", "close"):
+                    if not (kind == "in" and data.get("type") == "ack"):
+                        session.events.append((t, kind, data))
+                elif kind == "out":
+                    session.frames.append((t, data.get("type"), data.get("message_id")))
+                elif kind == "call":
+                    session.calls[data["backend"]].append(data)
+    return dict(sorted(sessions.items(), key=lambda item: item[1].start))
+
+
+def turn_latencies(frames: List[Frame]) -> List[Tuple[Optional[float], float]]:
+    """
+    (time to the first reply frame or None, time to the end) of each turn that ended, in
+    order. A turn is the frames with one message_id, from the first one (the `status` sent
+    when the message was queued).
+    """
+    turns: Dict[str, List[Optional[float]]] = {}
+    for t, frame_type, message_id in frames:
+        if message_id is None:
+            continue
+        turn = turns.setdefault(message_id, [t, None, None])
+        if frame_type in FIRST_TYPES and turn[1] is None:
+            turn[1] = t
+        if frame_type in DONE_TYPES and turn[2] is None:
+            turn[2] = t
+    return [
+        (first - start if first is not None else None, done - start)
+        for start, first, done in turns.values()
+        if done is not None
+    ]
+
+
+# ---------- STUB BACKENDS ----------
+
+class ReplayedError(RuntimeError):
+    pass
+
+
+class ReplayBackend:
+    """
+    Answers each call with the next call recorded for the same session and backend
+    (calls beyond the recording get the backend's median one).
+    """
+
+    def __init__(self, sessions: Dict[str, RecordedSession], speed: float):
+        self.speed = speed
+        self.calls = {session_id: {b: deque(c) for b, c in s.calls.items()} for session_id, s in sessions.items()}
+        self.median: Dict[str, Dict[str, Any]] = {}
+        by_backend: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for session in sessions.values():
+            for backend, calls in session.calls.items():
+                by_backend[backend] += calls
+        for backend, calls in by_backend.items():
+            self.median[backend] = sorted(calls, key=lambda c: c["total_ms"])[len(calls) // 2]
+        # server session_id -> recorded session_id, filled in by the clients
+        self.session_map: Dict[str, str] = {}
+        self.replayed = 0
+        self.unrecorded = 0
+
+    def backends(self) -> List[str]:
+        return sorted(set(self.median) | {"gemini", "ollama", "gemini-live"})
+
+    def _next(self, backend: str) -> Dict[str, Any]:
+        from admission import current_session
+
+        recorded = self.session_map.get(current_session.get() or "")
+        calls = self.calls.get(recorded, {}).get(backend)
+        if calls:
+            self.replayed += 1
+            return calls.popleft()
+        self.unrecorded += 1
+        return self.median.get(backend) or {"first_ms": 200.0, "total_ms": 1000.0, "chunks": 10, "out_chars": 400}
+
+    async def stream(self, backend: str, **_: Any) -> AsyncIterator[str]:
+        call = self._next(backend)
+        total = call["total_ms"] / 1000 / self.speed
+        if call.get("error") and call["error"] not in NOT_FAILURES:
+            await asyncio.sleep(total)
+            raise ReplayedError(f"replayed {call['error']}")
+
+        first = (call.get("first_ms") or call["total_ms"]) / 1000 / self.speed
+        chunks = max(1, call.get("chunks") or 1)
+        size = -(-call.get("out_chars", 0) // chunks)
+        gap = (total - first) / (chunks - 1) if chunks > 1 else 0.0
+        await asyncio.sleep(first)
+        for i in range(chunks):
+            if i:
+                await asyncio.sleep(gap)
+            yield "x" * size
+
+    async def chat(self, backend: str, **kwargs: Any) -> str:
+        return "".join([text async for text in self.stream(backend, **kwargs)])
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(stubs: ReplayBackend, args) -> Tuple[str, Any]:
+    import uvicorn
+
+    from config import config
+    from llm_utils import register_backend
+
+    # every turn goes to the stubs, and the replay itself isn't recorded
+    config["live_sessions"] = False
+    config["record_enabled"] = False
+    config["warmup_backends"] = []
+    config["rate_limit_enabled"] = args.rate_limits
+    for backend in stubs.backends():
+        register_backend(
+            backend,
+            functools.partial(stubs.chat, backend),
+            functools.partial(stubs.stream, backend),
+        )
+
+    from app import app, ws_server_options
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", **ws_server_options()))
+    threading.Thread(target=server.run, name="replay-server", daemon=True).start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("server did not start")
+        time.sleep(0.05)
+    return f"ws://127.0.0.1:{port}/ws", server
+
+
+# ---------- CLIENTS ----------
+
+@functools.lru_cache(maxsize=None)
+def _speech(rate: int) -> bytes:
+    pcm = synthetic_utterance(20.0, rate)
+    # the speech in the middle, without the silence around it
+    return pcm[len(pcm) // 4 // 2 * 2:3 * len(pcm) // 4 // 2 * 2]
+
+
+class SpeechSource:
+    """
+    Synthetic speech PCM, handed out in chunks of any size (looping).
+    """
+
+    def __init__(self, rate: int = 16000):
+        self.pcm = _speech(rate)
+        self.offset = 0
+
+    def take(self, n: int) -> bytes:
+        out = bytearray()
+        while len(out) < n:
+            piece = self.pcm[self.offset:self.offset + n - len(out)]
+            out += piece
+            self.offset = (self.offset + len(piece)) % len(self.pcm)
+        return bytes(out[:n - n % 2])
+
+
+async def _sleep_until(t: float) -> None:
+    delay = t - time.perf_counter()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+async def play(
+    session: RecordedSession,
+    url: str,
+    t0: float,
+    speed: float,
+    session_map: Optional[Dict[str, str]],
+    drain_timeout: float,
+) -> List[Frame]:
+    """
+    One recorded session against the server; returns the frames it got, timed from t0.
+    """
+    frames: List[Frame] = []
+    expected = len(turn_latencies(session.frames))
+    await _sleep_until(t0 + session.start / speed)
+
+    async with websockets.connect(url, max_queue=None, open_timeout=60) as ws:
+        started = json.loads(await ws.recv())
+        if session_map is not None:
+            session_map[started["session_id"]] = session.session_id
+        speech = SpeechSource(started.get("audio", {}).get("sample_rate", 16000))
+        # the session's own clock starts once it is connected, so connect time doesn't push its messages early
+        opened = time.perf_counter() - session.start / speed
+
+        async def read() -> None:
+            async for message in ws:
+                now = time.perf_counter() - t0
+                if isinstance(message, bytes):
+                    frames.append((now, "audio", None))
+                else:
+                    data = json.loads(message)
+                    if data.get("type") == "heartbeat":
+                        # not recorded either; answered so quiet sessions stay open
+                        await ws.send(message)
+                        continue
+                    frames.append((now, data.get("type"), data.get("message_id")))
+
+        reader = asyncio.create_task(read())
+        try:
+            for t, kind, data in session.events:
+                await _sleep_until(opened + t / speed)
+                if kind == "close":
+                    break
+                if data.get("type") == "audio_chunk":
+                    await ws.send(speech.take(data.get("bytes", 0)))
+                    continue
+                if data.get("type") in ("audio_start", "audio_format") and data.get("encoding", "pcm_s16le") not in (
+                    "pcm_s16le", "pcm", "wav",
+                ):
+                    data = dict(data, encoding="pcm_s16le")
+                await ws.send(json.dumps(data))
+
+            # let the turns in flight finish (the replay may be slower than the recording)
+            deadline = time.perf_counter() + drain_timeout
+            while len(turn_latencies(frames)) < expected and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+        finally:
+            reader.cancel()
+    return frames
+
+
+async def warm_up(url: str) -> None:
+    """
+    One throwaway session, so the first replayed one doesn't pay for the server's cold paths.
+    """
+    async with websockets.connect(url, open_timeout=60) as ws:
+        await ws.recv()
+        await ws.send(json.dumps({"type": "ping"}))
+        await ws.recv()
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    arr = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(np.percentile(arr, 50)), 1),
+        "p95_ms": round(float(np.percentile(arr, 95)), 1),
+        "max_ms": round(float(arr.max()), 1),
+    }
+
+
+def summarize(turns: List[Tuple[Optional[float], float]]) -> Dict[str, Dict[str, float]]:
+    return {
+        "first_reply": _percentiles([first for first, _ in turns if first is not None]),
+        "turn": _percentiles([done for _, done in turns]),
+    }
+
+
+async def replay(args) -> Dict[str, Any]:
+    sessions = load(args.captures)
+    if args.sessions:
+        sessions = dict(list(sessions.items())[:args.sessions])
+    if not sessions:
+        raise SystemExit("no sessions in the capture")
+    print(f"{len(sessions)} sessions, {sum(len(s.events) for s in sessions.values())} inbound events")
+
+    stubs = None
+    url = args.url
+    if url is None:
+        stubs = ReplayBackend(sessions, args.speed)
+        url, _ = start_server(stubs, args)
+        await warm_up(url)
+
+    # the recording's clock starts at its first session
+    base = min(s.start for s in sessions.values())
+    for session in sessions.values():
+        session.start -= base
+        session.events = [(t - base, kind, data) for t, kind, data in session.events]
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(
+        play(s, url, t0, args.speed, stubs.session_map if stubs else None, args.drain_timeout)
+        for s in sessions.values()
+    ), return_exceptions=True)
+    wall = time.perf_counter() - t0
+
+    recorded: List[Tuple[Optional[float], float]] = []
+    replayed: List[Tuple[Optional[float], float]] = []
+    failed = 0
+    for session, result in zip(sessions.values(), results):
+        if isinstance(result, BaseException):
+            failed += 1
+            print(f"Error replaying {session.session_id}: {result}")
+            continue
+        # recorded latencies at replay speed, so both columns compare directly
+        recorded += [(f / args.speed if f is not None else None, d / args.speed) for f, d in turn_latencies(session.frames)]
+        replayed += turn_latencies(result)
+
+    report = {
+        "sessions": len(sessions),
+        "failed_sessions": failed,
+        "speed": args.speed,
+        "wall_s": round(wall, 2),
+        "recorded": summarize(recorded),
+        "replayed": summarize(replayed),
+    }
+    if stubs is not None:
+        report["stub_calls"] = {"replayed": stubs.replayed, "unrecorded": stubs.unrecorded}
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"replayed {report['sessions']} sessions at {report['speed']}x in {report['wall_s']} s "
+          f"({report['failed_sessions']} failed)")
+    if "stub_calls" in report:
+        calls = report["stub_calls"]
+        print(f"stub calls: {calls['replayed']} as recorded, {calls['unrecorded']} beyond the recording")
+    print(f"{'':12} {'':9} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for metric in ("first_reply", "turn"):
+        for side in ("recorded", "replayed"):
+            row = report[side][metric]
+            if not row["count"]:
+                continue
+            print(f"{metric:12} {side:9} {row['count']:6} {row['p50_ms']:9} {row['p95_ms']:9} {row['max_ms']:9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("captures", nargs="+", help="capture files, or directories of them")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay this many times faster than recorded")
+    parser.add_argument("--url", help="replay against a running server (with its own backends) instead")
+    parser.add_argument("--sessions", type=int, default=0, help="only the first N sessions (0 = all)")
+    parser.add_argument("--drain-timeout", type=float, default=30.0, help="seconds to wait for unfinished turns")
+    parser.add_argument("--rate-limits", action="store_true", help="keep the server's rate limits on")
+    parser.add_argument("--json", help="also write the report here")
+    args = parser.parse_args()
+    result = asyncio.run(replay(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
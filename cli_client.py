@@ -1,16 +1,60 @@
 import asyncio
 import json
+import os
+import queue
+import struct
 import sys
 import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 import websockets
 import pyaudio
 
+from audio_codec import OPUS_RATES, available_codecs, new_encoder
+
 # Configuration
 WS_URL = "ws://localhost:8000/ws"
 FORMAT = pyaudio.paInt16
 CHANNELS = 1
-RATE = 24000  # Gemini Live often uses 24kHz or 16kHz
+RATE = 24000  # Default capture rate; the server advertises its native rate in session_started
 CHUNK = 1024
+# Binary frames from the server are model audio: stream id, flags, seq (see protocol.AUDIO_HEADER)
+AUDIO_HEADER = struct.Struct("<HHI")
+JITTER_CHUNKS = 3  # chunks held back to absorb reordering / late frames
+# Uplink audio: "auto" = the best codec both ends have (see audio_codec.py), or "pcm", "rice", "opus"
+AUDIO_CODEC = os.getenv("AUDIO_CODEC", "auto")
+OPUS_BITRATE = 24000
+
+
+class JitterBuffer:
+    """
+    Puts audio chunks back in sequence order. A missing chunk is waited for until
+    JITTER_CHUNKS later ones have arrived, then skipped.
+    """
+
+    def __init__(self):
+        self.next_seq = 0
+        self.pending = {}
+
+    def push(self, seq, chunk):
+        if seq < self.next_seq:
+            return []  # too late, already skipped
+        self.pending[seq] = chunk
+        ready = []
+        while self.pending:
+            if self.next_seq in self.pending:
+                ready.append(self.pending.pop(self.next_seq))
+                self.next_seq += 1
+            elif len(self.pending) > JITTER_CHUNKS:
+                self.next_seq = min(self.pending)
+            else:
+                break
+        return ready
+
+    def flush(self):
+        ready = [self.pending[seq] for seq in sorted(self.pending)]
+        self.pending.clear()
+        return ready
+
 
 class GeminiClient:
     def __init__(self):
@@ -19,6 +63,17 @@ class GeminiClient:
         self.p = pyaudio.PyAudio()
         self.input_stream = None
         self.stop_event = threading.Event()
+        self.rate = RATE
+        # compressed uplink codec agreed with the server (None = raw PCM)
+        self.codec = None
+        self.encoder = None
+        # one worker: encoders keep state, and chunks must come out in order
+        self.encode_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-encode")
+        # model audio: stream_id -> JitterBuffer, played by a thread
+        self.jitter = {}
+        self.output_stream = None
+        self.play_queue = queue.Queue()
+        self.play_thread = None
 
     async def connect(self):
         try:
@@ -37,31 +92,88 @@ class GeminiClient:
             self.cleanup_audio()
 
     async def handle_server_messages(self, websocket):
+        streaming = False
         try:
             async for message in websocket:
+                if isinstance(message, bytes):
+                    stream_id, _, seq = AUDIO_HEADER.unpack_from(message)
+                    buffer = self.jitter.setdefault(stream_id, JitterBuffer())
+                    for chunk in buffer.push(seq, message[AUDIO_HEADER.size:]):
+                        self.play_queue.put(chunk)
+                    continue
+
                 data = json.loads(message)
                 msg_type = data.get("type")
 
                 if msg_type == "session_started":
                     print(f"[Server] Session started: {data.get('session_id')}")
+                    # Record at the model's native rate so the server doesn't have to resample
+                    self.rate = data.get("audio", {}).get("sample_rate", RATE)
+                    self.codec = self.pick_codec(data.get("audio_codecs", []))
+                    print(f"[Server] Uplink audio: {self.codec or 'pcm'}")
                 elif msg_type == "pong":
                     print("[Server] Pong!")
+                elif msg_type == "heartbeat":
+                    # the server closes connections that stop answering
+                    await websocket.send(json.dumps({"type": "heartbeat"}))
                 elif msg_type == "status":
                     print(f"[Server Status] {data.get('status')}")
+                    if "upload_ms" in data:
+                        print(f"[Server] Received {data.get('bytes')} bytes in {data.get('chunks')} chunks "
+                              f"(upload {data.get('upload_ms')} ms, ingest {data.get('ingest_ms')} ms)")
                 elif msg_type == "response":
                     print(f"\n[Gemini]: {data.get('text')}\n")
                     print("> ", end="", flush=True)
+                elif msg_type == "response_delta":
+                    if not streaming:
+                        print("\n[Gemini]: ", end="")
+                        streaming = True
+                    print(data.get("text", ""), end="", flush=True)
+                elif msg_type == "response_end":
+                    streaming = False
+                    print("\n")
+                    print("> ", end="", flush=True)
+                elif msg_type == "output_mode":
+                    print(f"[Server] Output mode: {data.get('mode')}")
+                elif msg_type == "audio_start":
+                    print(f"[Server] Audio reply (first audio after {data.get('time_to_first_audio_ms')} ms)")
+                    self.start_playback(data.get("format", {}).get("sample_rate", 24000))
+                elif msg_type == "audio_end":
+                    for chunk in self.jitter.pop(data.get("stream_id"), JitterBuffer()).flush():
+                        self.play_queue.put(chunk)
+                    if data.get("transcript"):
+                        print(f"\n[Gemini (audio)]: {data.get('transcript')}\n")
+                        print("> ", end="", flush=True)
+                elif msg_type == "cancelled":
+                    streaming = False
+                    print(f"[Server] Cancelled {data.get('message_id')}")
                 elif msg_type == "error":
                     print(f"[Error] {data.get('message')}")
         except websockets.exceptions.ConnectionClosed:
             print("Server connection closed.")
 
+    def pick_codec(self, offered):
+        if AUDIO_CODEC == "pcm":
+            return None
+        ours = available_codecs()
+        wanted = ours if AUDIO_CODEC == "auto" else [AUDIO_CODEC]
+        for codec in wanted:
+            if codec == "opus" and self.rate not in OPUS_RATES:
+                continue
+            if codec in offered and codec in ours:
+                return codec
+        if AUDIO_CODEC != "auto":
+            print(f"[Client] {AUDIO_CODEC} is not available on both ends, sending PCM")
+        return None
+
     async def handle_user_input(self, websocket):
         print("Commands:")
         print("  /text <message>  - Send text message")
         print("  /start           - Start recording audio (Push-to-Talk)")
         print("  /end             - Stop recording and send audio")
         print("  /ping            - Ping server")
+        print("  /cancel          - Cancel the reply in progress")
+        print("  /mode <m>        - Reply as text, audio or both")
         print("  /quit            - Exit")
         print("> ", end="", flush=True)
 
@@ -82,17 +194,24 @@ class GeminiClient:
             elif user_input == "/ping":
                 await websocket.send(json.dumps({"type": "ping"}))
             
+            elif user_input == "/cancel":
+                await websocket.send(json.dumps({"type": "cancel"}))
+            
+            elif user_input.startswith("/mode "):
+                await websocket.send(json.dumps({"type": "output_mode", "mode": user_input[6:].strip()}))
+
             elif user_input.startswith("/text "):
                 text = user_input[6:].strip()
                 await websocket.send(json.dumps({
                     "type": "user_message",
                     "text": text,
-                    "backend": "gemini" # Default to gemini text
+                    "backend": "gemini", # Default to gemini text
+                    "stream": True
                 }))
 
             elif user_input == "/start":
                 if not self.recording:
-                    self.start_recording(websocket)
+                    await self.start_recording(websocket)
                 else:
                     print("Already recording.")
 
@@ -107,7 +226,7 @@ class GeminiClient:
             
             print("> ", end="", flush=True)
 
-    def start_recording(self, websocket):
+    async def start_recording(self, websocket):
         print("Recording... (Type /end to stop)")
         self.recording = True
         self.stop_event.clear()
@@ -115,53 +234,104 @@ class GeminiClient:
         self.input_stream = self.p.open(
             format=FORMAT,
             channels=CHANNELS,
-            rate=RATE,
+            rate=self.rate,
             input=True,
             frames_per_buffer=CHUNK
         )
 
-        # Audio capture runs in a separate thread to avoid blocking asyncio loop
-        # However, since we want to send one big blob at the end (simpler for now),
-        # we can just collect frames. 
-        # For a real-time stream, we'd send chunks over websocket continuously.
-        # Given the "Push-to-talk" requirement sending a byte array, we'll accumulate.
-        
-        self.frames = []
-        self.record_thread = threading.Thread(target=self._record_loop)
+        # Stream the utterance: audio_start, one binary frame per chunk, audio_end.
+        # Audio capture runs in a separate thread to avoid blocking asyncio loop;
+        # it hands chunks to the sender task through self.audio_queue.
+        await websocket.send(json.dumps({
+            "type": "audio_start",
+            "encoding": self.codec or "pcm_s16le",
+            "sample_rate": self.rate,
+            "channels": CHANNELS,
+        }))
+        self.encoder = new_encoder(self.codec, self.rate, CHANNELS, OPUS_BITRATE) if self.codec else None
+        self.sent_bytes = 0
+        self.raw_bytes = 0
+        self.send_task = asyncio.create_task(self._send_loop(websocket))
+        self.record_thread = threading.Thread(
+            target=self._record_loop,
+            args=(asyncio.get_running_loop(),),
+        )
         self.record_thread.start()
 
-    def _record_loop(self):
+    def _record_loop(self, loop):
         while self.recording and not self.stop_event.is_set():
             try:
                 data = self.input_stream.read(CHUNK)
-                self.frames.append(data)
+                self.raw_bytes += len(data)
+                if self.encoder is not None:
+                    # encoded in the pool, off both this thread and the event loop
+                    data = self.encode_pool.submit(self.encoder.encode, data)
+                loop.call_soon_threadsafe(self.audio_queue.put_nowait, data)
             except Exception as e:
                 print(f"Error recording: {e}")
                 break
+        loop.call_soon_threadsafe(self.audio_queue.put_nowait, None)
+
+    async def _send_loop(self, websocket):
+        while True:
+            data = await self.audio_queue.get()
+            if data is None:
+                break
+            if isinstance(data, Future):
+                data = await asyncio.wrap_future(data)
+            if data:
+                await websocket.send(data)
+                self.sent_bytes += len(data)
+        if self.encoder is not None:
+            # what the encoder still holds (opus: the last partial frame)
+            tail = await asyncio.wrap_future(self.encode_pool.submit(self.encoder.flush))
+            if tail:
+                await websocket.send(tail)
+                self.sent_bytes += len(tail)
 
     async def stop_recording_and_send(self, websocket):
         print("Stopping recording and sending...")
         self.recording = False
         self.stop_event.set()
-        self.record_thread.join()
+        await asyncio.to_thread(self.record_thread.join)
         
         if self.input_stream:
             self.input_stream.stop_stream()
             self.input_stream.close()
             self.input_stream = None
 
-        audio_data = b"".join(self.frames)
-        
-        # Send as binary message
-        await websocket.send(audio_data)
-        print(f"Sent {len(audio_data)} bytes of audio.")
-        self.frames = []
+        # Wait for the last chunks to go out, then close the utterance
+        await self.send_task
+        await websocket.send(json.dumps({"type": "audio_end"}))
+        if self.encoder is not None:
+            print(f"Sent {self.sent_bytes} bytes of {self.codec} audio ({self.raw_bytes} bytes of PCM).")
+        else:
+            print(f"Sent {self.sent_bytes} bytes of audio.")
+
+    def start_playback(self, rate):
+        if self.output_stream is None:
+            self.output_stream = self.p.open(format=FORMAT, channels=CHANNELS, rate=rate, output=True)
+            self.play_thread = threading.Thread(target=self._play_loop, daemon=True)
+            self.play_thread.start()
+
+    def _play_loop(self):
+        while True:
+            chunk = self.play_queue.get()
+            if chunk is None:
+                break
+            self.output_stream.write(chunk)
 
     def cleanup_audio(self):
         if self.input_stream:
             self.input_stream.stop_stream()
             self.input_stream.close()
+        if self.output_stream:
+            self.play_queue.put(None)
+            self.play_thread.join()
+            self.output_stream.stop_stream()
+            self.output_stream.close()
         self.p.terminate()
+        self.encode_pool.shutdown(wait=False)
 
 if __name__ == "__main__":
     client = GeminiClient()
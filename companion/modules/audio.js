@@ -3,7 +3,7 @@
 // Handles audio playback and recording (PTT)
 // ============================================
 
-import { sendBinaryMessage } from './websocket.js';
+import { sendBinaryMessage, sendMessage } from './websocket.js';
 import { isDebugMode } from './ui.js';
 
 let audioContext = null;
@@ -210,6 +210,9 @@ async function sendAudioToBackend(audioBlob, mimeType = 'audio/webm') {
         //     timestamp: Date.now()
         // });
         // sendBinaryMessage(audioBlob.arrayBuffer());
+        // Tell the server what the blob really is, so it isn't treated as raw PCM
+        const encoding = mimeType.includes('webm') ? 'webm' : (mimeType.includes('ogg') ? 'ogg' : 'wav');
+        sendMessage('audio_format', { encoding });
         sendBinaryMessage(audioBlob);
         // console.log(`📤 Audio sent to backend (${format}, ${(audioBlob.size / 1024).toFixed(2)} KB)`);
     } catch (error) {
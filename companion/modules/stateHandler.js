@@ -40,6 +40,14 @@ export function handleWebSocketMessage(data) {
                 handleReply(message);
                 break;
             
+            // === Streaming replies (app.py /ws) ===
+            case 'response_delta':
+                handleResponseDelta(message);
+                break;
+            case 'response_end':
+                handleResponseEnd(message);
+                break;
+            
             // === Legacy/Additional Events ===
             case 'state':
                 handleStateMessage(message);
@@ -156,6 +164,36 @@ function handleReply(message) {
     }, duration);
 }
 
+// ============================================
+// Streaming Reply Handlers
+// ============================================
+
+// Text received so far for the reply currently being streamed
+let streamingMessageId = null;
+let streamingText = '';
+
+function handleResponseDelta(message) {
+    if (message.message_id !== streamingMessageId) {
+        // First chunk of a new reply: start talking right away
+        streamingMessageId = message.message_id;
+        streamingText = '';
+        setExpression('happy');
+        startTalking();
+    }
+    
+    streamingText += message.text || '';
+    // Keep the bubble open while chunks are still arriving
+    showMessage(streamingText, 0);
+}
+
+function handleResponseEnd(message) {
+    const replyText = message.text || streamingText;
+    streamingMessageId = null;
+    streamingText = '';
+    
+    handleReply({ type: 'reply', data: { message: replyText } });
+}
+
 // ============================================
 // TEST FUNCTIONS (for UI panel buttons)
 // ============================================
@@ -3,12 +3,54 @@
 // Handles connection to backend with auto-reconnect
 // ============================================
 
-const WS_URL = 'ws://localhost:8000/ws';
+// SERVER_SPEC.md dialect (see protocol.py on the server)
+const WS_URL = 'ws://localhost:8000/ws?protocol=companion.v1';
 let websocket = null;
 let wsReconnectTimer = null;
 const WS_RECONNECT_DELAY = 3000;
 let wsConnected = false;
 
+// Session resumption: reconnect to the same session and get the frames we missed
+let sessionId = null;
+let resumeToken = null;
+let framesReceived = 0;
+const ACK_EVERY = 32;
+
+function connectUrl() {
+    if (!sessionId || !resumeToken) return WS_URL;
+    const params = new URLSearchParams({ session_id: sessionId, resume_token: resumeToken, last_seq: framesReceived });
+    return `${WS_URL}&${params}`;
+}
+
+// Returns false for frames that are only about the connection itself
+function trackFrame(data) {
+    if (typeof data === 'string' && data.includes('"heartbeat"')) {
+        // not counted; answered so the server knows we're still here
+        if (JSON.parse(data).type === 'heartbeat') {
+            websocket.send(JSON.stringify({ type: 'heartbeat' }));
+            return false;
+        }
+    }
+    if (typeof data === 'string' && data.includes('"session_')) {
+        const message = JSON.parse(data);
+        if (message.type === 'session_resumed') {
+            console.log(`🔁 Session resumed (${message.replayed} replayed, ${message.missed} missed)`);
+            framesReceived = message.last_seq;
+            return false;
+        }
+        if (message.type === 'session_started') {
+            sessionId = message.session_id;
+            resumeToken = message.resume_token || null;
+            framesReceived = 0;
+        }
+    }
+    framesReceived += 1;
+    if (framesReceived % ACK_EVERY === 0) {
+        websocket.send(JSON.stringify({ type: 'ack', seq: framesReceived }));
+    }
+    return true;
+}
+
 // Callbacks that can be set by other modules
 let onMessageCallback = null;
 let onConnectionStatusChange = null;
@@ -26,11 +68,12 @@ export function connectWebSocket() {
         return;
     }
     
-    console.log('🔌 Connecting to WebSocket:', WS_URL);
+    const url = connectUrl();
+    console.log('🔌 Connecting to WebSocket:', url);
     if (onConnectionStatusChange) onConnectionStatusChange('connecting');
     
     try {
-        websocket = new WebSocket(WS_URL);
+        websocket = new WebSocket(url);
         
         websocket.onopen = () => {
             console.log('✅ WebSocket connected!');
@@ -56,6 +99,7 @@ export function connectWebSocket() {
         };
         
         websocket.onmessage = (event) => {
+            if (!trackFrame(event.data)) return;
             if (onMessageCallback) {
                 onMessageCallback(event.data);
             }
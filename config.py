@@ -9,4 +9,133 @@ config = {
     "gemini_live_model": "gemini-2.5-flash-native-audio-preview-09-2025",
     "ollama_base_url": "http://localhost:11434",
     "ollama_default_model": "llama3.1",
+    # Pooled backend clients (see backend_registry.py)
+    "backend_pool_idle_ttl": 300,
+    "backend_pool_max_clients": 32,
+    "backend_max_concurrency": {
+        "gemini": 16,
+        "ollama": 2,
+        "gemini-live": 8,
+    },
+    # Token streaming on /ws (clients can override per message with "stream")
+    "stream_responses": False,
+    "stream_min_chars": 32,    # coalesce deltas until this many characters...
+    "stream_max_delay": 0.05,  # ...or until they have waited this long (s)
+    # Per-session work queue (see session.py)
+    "session_queue_size": 8,
+    "busy_policy": "queue",    # "queue" | "replace" | "reject" (override per message with "on_busy")
+    # Chunked audio ingest (see audio.py); 16-bit mono PCM at 24 kHz is 48 KB/s
+    "audio_max_bytes": 48000 * 60,      # longest utterance accepted (~60 s)
+    "audio_initial_bytes": 48000 * 10,  # preallocated per session (~10 s)
+    # What clients send unless they declare an audio_format, and the model's native input rate
+    "audio_input_format": {"encoding": "pcm_s16le", "sample_rate": 24000, "channels": 1},
+    "audio_upstream_rate": 16000,
+    # Server-side voice activity detection (see vad.py): trims silence before upload
+    "vad_enabled": True,
+    "vad_frame_ms": 20,
+    "vad_energy_db": -45.0,     # frames louder than this (dBFS) count as speech
+    "vad_padding_ms": 200,      # kept around speech so onsets / endings aren't clipped
+    "vad_max_pause_ms": None,   # if set, pauses longer than this are cut out too
+    # Persistent Gemini Live connection per /ws session (see live_session.py)
+    "live_sessions": True,
+    "live_response_modalities": ["TEXT"],
+    "live_turn_timeout": 60.0,
+    # How live replies come back unless the client sends `output_mode`: "text" | "audio" | "both"
+    "output_mode": "text",
+    "audio_output_rate": 24000,          # native-audio models answer in 24 kHz PCM
+    # Per-session conversation history (see history.py)
+    "history_enabled": True,
+    "history_token_budget": 2000,          # history + system prompt + new message, estimated
+    "history_max_turns": 32,               # ring buffer size per session
+    "history_max_session_bytes": 32 * 1024,
+    "history_max_total_bytes": 32 * 1024 * 1024,
+    "history_idle_ttl": 1800,              # seconds before an idle session's history is dropped
+    "history_summary_batch": 0,            # fold this many evicted turns into a summary (0 = off)
+    # Exact-match response cache in front of chat_messages (see response_cache.py)
+    "response_cache_enabled": False,
+    "response_cache_ttl": 600,                       # seconds
+    "response_cache_max_bytes": 8 * 1024 * 1024,     # LRU-evicted past this
+    "response_cache_max_entry_bytes": 64 * 1024,     # longer answers aren't cached
+    # Several uvicorn workers sharing session ownership (see session_router.py)
+    "workers": int(os.getenv("WORKERS", "1")),
+    "session_router": os.getenv("SESSION_ROUTER", "memory"),   # "memory" | "sqlite"
+    "session_router_path": os.getenv("SESSION_ROUTER_PATH", "sessions.db"),
+    "session_router_poll_interval": 0.01,
+    # POST /sessions/{session_id}/events pushes an event to a session (off: no auth)
+    "session_push_enabled": os.getenv("SESSION_PUSH", "") == "1",
+    # Stage timings and backend counters on GET /metrics (see metrics.py)
+    "metrics_enabled": os.getenv("METRICS", "") == "1",
+    "metrics_slow_turn_ms": None,        # if set, profile turns slower than this
+    "metrics_profile_interval_ms": 5,
+    # Outbound frames per connection (see connection_manager.py)
+    "send_queue_size": 256,               # frames a client may fall behind...
+    "slow_consumer_policy": "close",      # ...before it is closed ("close") or frames are dropped ("drop")
+    # Fallback / hedging / circuit breakers across backends (see backend_router.py)
+    "router_enabled": False,
+    "router_backends": ["gemini", "ollama", "gemini-live"],
+    "router_audio_backends": ["gemini-live"],   # audio turns only fall back to these
+    "router_mode": "prefer",                   # "prefer" (requested first) | "fastest"
+    "router_hedge_delay": None,                # seconds before a second backend is tried too
+    "router_failure_threshold": 3,             # consecutive failures that open a breaker
+    "router_cooldown": 30.0,                   # seconds before a probe is let through
+    "router_ewma_alpha": 0.2,
+    # Fair queueing in front of the local ollama server (see admission.py)
+    "ollama_admission_enabled": True,
+    "ollama_max_in_flight": 2,            # calls (or micro-batches) sent to ollama at once
+    "ollama_max_queue": 64,               # waiting calls before new ones are rejected
+    "ollama_queue_timeout": 60.0,
+    "ollama_batch_window": 0.0,           # seconds short prompts wait for company, 0 = off
+    "ollama_batch_max_chars": 400,
+    "ollama_batch_size": 4,               # keep <= OLLAMA_NUM_PARALLEL
+    # Proactive suggestions from `context` events (see suggestions.py)
+    "suggestions_enabled": True,
+    "suggestion_backend": "gemini",
+    "suggestion_debounce": 1.5,               # seconds the context must be stable
+    "suggestion_rate_per_min": 4,             # LLM calls per session...
+    "suggestion_burst": 1,
+    "suggestion_global_rate_per_min": 120,    # ...and in total (None = no cap)
+    "suggestion_max_actions": 5,
+    "suggestion_max_field_chars": 200,
+    # Backends whose SDK is imported and client built at startup instead of on first use
+    "warmup_backends": [b for b in os.getenv("WARMUP_BACKENDS", "").split(",") if b],
+    # /ws dialect for clients that don't negotiate one (see protocol.py)
+    "protocol_default": "app.v1",         # "app.v1" | "companion.v1"
+    # Reconnects within the grace window resume the session (see resume.py)
+    "resume_enabled": True,
+    "resume_grace": 30.0,
+    "resume_max_parked": 1000,
+    "replay_max_frames": 512,
+    "replay_max_bytes": 1_000_000,
+    # Token-bucket limits in front of the backends (see ratelimit.py);
+    # scope -> kind -> (per minute, burst), kinds: requests, bytes, tokens
+    "rate_limit_enabled": True,
+    "rate_limits": {
+        "session": {"requests": (30, 10), "bytes": (6_000_000, 4_000_000), "tokens": (60_000, 30_000)},
+        "ip": {"requests": (120, 30), "bytes": (20_000_000, 8_000_000)},
+        "global": {"requests": (1200, 200)},
+    },
+    # Fixed system prompts, cached upstream instead of resent each turn (see prompt_cache.py)
+    "system_prompt": os.getenv("SYSTEM_PROMPT", "You are a helpful assistant."),
+    "live_system_prompt": os.getenv("LIVE_SYSTEM_PROMPT", "You are a helpful audio assistant."),
+    "prompt_cache_enabled": True,
+    "prompt_cache_ttl": 3600,             # seconds per create / refresh
+    "prompt_cache_refresh_margin": 600,
+    "prompt_cache_idle": 1800,            # delete caches unused this long
+    "prompt_cache_min_tokens": 1024,      # Gemini's minimum for context caching
+    "ollama_keep_alive": "30m",           # keep the model and its evaluated prompt loaded
+    # Capture of /ws traffic for benchmarks/replay_traffic.py (see recorder.py)
+    "record_enabled": os.getenv("RECORD", "") == "1",
+    "record_dir": os.getenv("RECORD_DIR", "captures"),
+    "record_max_bytes": 50_000_000,       # per file, then gzipped and rotated
+    "record_max_files": 20,
+    "record_queue_size": 10_000,          # events waiting for the writer before they are dropped
+    "record_content": False,              # keep user text (otherwise same-length placeholders)
+    # Server heartbeats and idle reaping on one shared timer (see heartbeat.py)
+    # seconds of silence before a heartbeat, 0 = off (uvicorn pings instead); clients must answer them
+    "heartbeat_interval": float(os.getenv("HEARTBEAT_INTERVAL", "0")),
+    "heartbeat_timeout": 20.0,            # seconds to answer it before the socket is closed
+    "heartbeat_tick": 1.0,
+    "idle_timeout": float(os.getenv("IDLE_TIMEOUT", "0")),   # seconds without user activity, 0 = never
+    # permessage-deflate on /ws: ~45 KB of zlib state per connection
+    "ws_per_message_deflate": False,
 }
@@ -1,18 +1,368 @@
-from typing import Dict, Any
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Any, Iterable, List, Optional
 from fastapi import WebSocket
 
+from metrics import metrics
+from protocol import Codec, Frame, encode_json  # noqa: F401 (encode_json re-exported)
+from resume import ReplayBuffer
+from session_router import InMemorySessionRouter
+
+# ---------- OUTBOUND SEND PATH ----------
+
+# Every connection gets a bounded outbound queue of already-encoded frames and
+# a writer task draining it, so a slow client only ever stalls its own writer:
+# send_json() encodes, enqueues and returns. The writer is started by the first
+# frame queued and exits once the queue is empty, so idle connections hold no
+# task. When a client falls send_queue_size frames behind, slow_consumer_policy
+# decides:
+#
+#   - "close" -> close the socket (1013, try again later); the client reconnects
+#   - "drop"  -> drop the new frame and keep the connection
+#
+# Frames are encoded with the connection's protocol.Codec (negotiated at connect).
+# broadcast() encodes a payload once per codec and enqueues it for many sessions.
+#
+# With replay_max_frames set, every frame queued for a session is also kept in
+# its resume.ReplayBuffer, and a session whose socket dropped can be detached
+# (frames keep going to the buffer) and later resumed on a new socket, which
+# first gets the frames the client hasn't seen.
+#
+# The Outbox also holds when the client was last heard from (see heartbeat.py).
+
+SLOW_CONSUMER_POLICIES = ("close", "drop")
+
+
+class Outbox:
+    __slots__ = (
+        "session_id", "ws", "codec", "queue", "writer", "closed", "detached", "dropped", "replay",
+        "last_seen", "last_active", "pinged_at",
+    )
+
+    def __init__(
+        self,
+        session_id: str,
+        ws: WebSocket,
+        codec: Codec,
+        replay: Optional[ReplayBuffer] = None,
+    ):
+        self.session_id = session_id
+        self.ws = ws
+        self.codec = codec
+        self.queue: Deque[Frame] = deque()
+        self.writer: Optional["asyncio.Task[None]"] = None
+        self.closed = False
+        self.detached = False
+        self.dropped = 0
+        self.replay = replay
+        # time.monotonic() of the last frame from the client / the last one that wasn't a keepalive
+        self.last_seen = self.last_active = time.monotonic()
+        # when the unanswered heartbeat was sent
+        self.pinged_at: Optional[float] = None
+
+    async def _send(self, frame: Frame) -> None:
+        with metrics.span("send"):
+            if isinstance(frame, bytes):
+                await self.ws.send_bytes(frame)
+            else:
+                await self.ws.send_text(frame)
+
+    def put(self, frame: Frame) -> None:
+        self.queue.append(frame)
+        if self.writer is None:
+            self.writer = asyncio.create_task(self.run())
+
+    def stop(self) -> None:
+        self.closed = True
+        if self.writer is not None:
+            self.writer.cancel()
+            self.writer = None
+
+    async def run(self) -> None:
+        """
+        Writer task: send queued frames in order until the queue is empty or
+        the socket goes away.
+        """
+        queue = self.queue
+        try:
+            while queue:
+                await self._send(queue.popleft())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # the client is gone; the receive loop notices and disconnects
+            self.closed = True
+        # nothing awaited since the queue was found empty: the next put() starts a new writer
+        self.writer = None
+
+
 class ConnectionManager:
-    def __init__(self):
+    def __init__(
+        self,
+        router: Optional[InMemorySessionRouter] = None,
+        send_queue_size: int = 256,
+        slow_consumer_policy: str = "close",
+        replay_max_frames: int = 0,
+        replay_max_bytes: int = 1_000_000,
+    ):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(
+                f"Unsupported slow_consumer_policy: {slow_consumer_policy} (use one of {SLOW_CONSUMER_POLICIES})"
+            )
         self.active_sessions: Dict[str, WebSocket] = {}
+        self._outboxes: Dict[str, Outbox] = {}
+        self.send_queue_size = send_queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        # 0 = sessions can't be resumed
+        self.replay_max_frames = replay_max_frames
+        self.replay_max_bytes = replay_max_bytes
+        self.dropped_frames = 0
+        self.slow_closed = 0
+        # codec name -> encoded heartbeat frame
+        self._heartbeat_frames: Dict[str, Frame] = {}
+        # Forwards events for sessions whose socket lives in another worker
+        self.router = router or InMemorySessionRouter()
+        # Called with the session_id when a session goes away (e.g. to close upstream connections)
+        self.disconnect_hooks: List[Callable[[str], None]] = []
+        # Called with (session_id, message or None for model audio, encoded size) for every
+        # frame queued for a local session (e.g. by the traffic recorder)
+        self.send_hooks: List[Callable[[str, Optional[Dict[str, Any]], int], None]] = []
+
+    async def start(self) -> None:
+        await self.router.start(self.send_local)
 
-    async def connect(self, websocket: WebSocket, session_id: str) -> None:
-        await websocket.accept()
+    async def stop(self) -> None:
+        await self.router.stop()
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        session_id: str,
+        codec: Optional[Codec] = None,
+        subprotocol: Optional[str] = None,
+    ) -> None:
+        await websocket.accept(subprotocol=subprotocol)
+        replay = ReplayBuffer(self.replay_max_frames, self.replay_max_bytes) if self.replay_max_frames else None
+        outbox = Outbox(session_id, websocket, codec or Codec(), replay)
         self.active_sessions[session_id] = websocket
-    
-    def disconnect(self, session_id: str) -> None:
+        self._outboxes[session_id] = outbox
+        await self.router.register(session_id)
+
+    def detach(self, session_id: str) -> bool:
+        """
+        The session's socket is gone but the session may be resumed: stop writing,
+        keep buffering its frames for replay (it stays registered with the router).
+        Returns False if the session can't be resumed.
+        """
+        outbox = self._outboxes.get(session_id)
+        if outbox is None or outbox.replay is None:
+            return False
+        outbox.stop()
+        outbox.detached = True
+        outbox.ws = None
         self.active_sessions.pop(session_id, None)
+        return True
+
+    def outbox(self, session_id: str) -> Optional[Outbox]:
+        return self._outboxes.get(session_id)
+
+    def codec(self, session_id: str) -> Optional[Codec]:
+        outbox = self._outboxes.get(session_id)
+        return outbox.codec if outbox is not None else None
+
+    async def resume(
+        self,
+        websocket: WebSocket,
+        session_id: str,
+        last_seq: int,
+        subprotocol: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Attach a detached session to a new socket. The client first gets a
+        session_resumed frame, then the frames after last_seq.
+        """
+        outbox = self._outboxes[session_id]
+        await websocket.accept(subprotocol=subprotocol)
+        frames, before, missed = outbox.replay.since(last_seq)
+        resumed = {
+            "type": "session_resumed",
+            "session_id": session_id,
+            "last_seq": before,
+            "replayed": len(frames),
+            "missed": missed,
+        }
+        outbox.ws = websocket
+        # whatever was still queued for the old socket is among the replayed frames
+        outbox.queue.clear()
+        outbox.closed = False
+        outbox.detached = False
+        outbox.pinged_at = None
+        outbox.last_seen = outbox.last_active = time.monotonic()
+        outbox.put(outbox.codec.encode(resumed))
+        outbox.queue.extend(frames)
+        self.active_sessions[session_id] = websocket
+        return resumed
+
+    def ack(self, session_id: str, seq: int) -> None:
+        outbox = self._outboxes.get(session_id)
+        if outbox is not None and outbox.replay is not None:
+            outbox.replay.ack(seq)
+
+    def disconnect(self, session_id: str) -> None:
+        outbox = self._outboxes.pop(session_id, None)
+        if outbox is not None:
+            outbox.stop()
+        # a detached session is no longer in active_sessions but still registered
+        if self.active_sessions.pop(session_id, None) is not None or outbox is not None:
+            asyncio.ensure_future(self.router.unregister(session_id))
+        for hook in self.disconnect_hooks:
+            try:
+                hook(session_id)
+            except Exception as e:
+                print(f"Error in disconnect hook for {session_id}: {e}")
+
+    def _enqueue(self, outbox: Outbox, frame: Frame) -> bool:
+        replay = outbox.replay
+        if outbox.closed:
+            if replay is None:
+                return False
+            # detached or closing: the frame is only kept for a resume
+            replay.push(frame)
+            return True
+        if len(outbox.queue) < self.send_queue_size:
+            outbox.put(frame)
+            if replay is not None:
+                replay.push(frame)
+            return True
+
+        if self.slow_consumer_policy == "drop":
+            # never numbered, so the client's frame count stays right
+            outbox.dropped += 1
+            self.dropped_frames += 1
+            return False
+
+        print(f"Closing slow consumer {outbox.session_id} ({len(outbox.queue)} frames behind)")
+        self.slow_closed += 1
+        self._close(outbox, 1013)
+        if replay is not None:
+            replay.push(frame)
+            return True
+        return False
+
+    def _close(self, outbox: Outbox, code: int, reason: str = "") -> None:
+        outbox.stop()
+        asyncio.ensure_future(self._close_socket(outbox.ws, code, reason))
+
+    @staticmethod
+    async def _close_socket(ws: WebSocket, code: int, reason: str) -> None:
+        try:
+            await ws.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    def close(self, session_id: str, code: int, reason: str = "") -> None:
+        """
+        Close a local session's socket; its receive loop sees the code and ends
+        (1000) or parks (anything else) the session. Queued frames are not sent.
+        """
+        outbox = self._outboxes.get(session_id)
+        if outbox is not None and not outbox.closed:
+            self._close(outbox, code, reason)
+
+    def heartbeat(self, session_id: str) -> bool:
+        """
+        Queue a heartbeat frame. Unlike other frames it is not numbered or kept
+        for replay, and it is not sent to a client that is already behind.
+        """
+        outbox = self._outboxes.get(session_id)
+        if outbox is None or outbox.closed or len(outbox.queue) >= self.send_queue_size:
+            return False
+        frame = self._heartbeat_frames.get(outbox.codec.name)
+        if frame is None:
+            frame = self._heartbeat_frames[outbox.codec.name] = outbox.codec.encode({"type": "heartbeat"})
+        outbox.put(frame)
+        return True
+
+    def _sent(self, session_id: str, data: Optional[Dict[str, Any]], frame: Frame) -> None:
+        for hook in self.send_hooks:
+            try:
+                hook(session_id, data, len(frame))
+            except Exception as e:
+                print(f"Error in send hook: {e}")
+
+    async def send_local(self, session_id: str, data: Dict[str, Any]) -> bool:
+        outbox = self._outboxes.get(session_id)
+        if outbox is None:
+            return False
+        frame = outbox.codec.encode(data)
+        if self.send_hooks:
+            self._sent(session_id, data, frame)
+        return self._enqueue(outbox, frame)
+
+    async def send_json(self, session_id: str, data: Dict[str, Any]) -> bool:
+        """
+        Queue a frame for the session's socket, wherever it lives.
+        Returns False if no worker has the session or the frame was dropped.
+        """
+        outbox = self._outboxes.get(session_id)
+        if outbox is not None:
+            frame = outbox.codec.encode(data)
+            if self.send_hooks:
+                self._sent(session_id, data, frame)
+            return self._enqueue(outbox, frame)
+        return await self.router.publish(session_id, data)
+
+    def send_audio(self, session_id: str, stream_id: int, seq: int, chunk: bytes) -> bool:
+        """
+        Queue one chunk of model audio (only for sessions on this worker, where the
+        audio is produced).
+        """
+        outbox = self._outboxes.get(session_id)
+        if outbox is None:
+            return False
+        frame = outbox.codec.encode_audio(stream_id, seq, chunk)
+        if self.send_hooks:
+            self._sent(session_id, None, frame)
+        return self._enqueue(outbox, frame)
+
+    async def broadcast(self, data: Dict[str, Any], session_ids: Optional[Iterable[str]] = None) -> int:
+        """
+        Send one payload to many sessions (all local ones by default), encoding it
+        once per codec. Sessions owned by other workers are reached through the router.
+        Returns the number of sessions it was queued for.
+        """
+        frames: Dict[str, Frame] = {}
+
+        def frame_for(outbox: Outbox) -> Frame:
+            frame = frames.get(outbox.codec.name)
+            if frame is None:
+                frame = frames[outbox.codec.name] = outbox.codec.encode(data)
+            if self.send_hooks:
+                self._sent(outbox.session_id, data, frame)
+            return frame
+
+        if session_ids is None:
+            return sum(self._enqueue(outbox, frame_for(outbox)) for outbox in list(self._outboxes.values()))
+
+        sent = 0
+        remote = []
+        for session_id in session_ids:
+            outbox = self._outboxes.get(session_id)
+            if outbox is not None:
+                sent += self._enqueue(outbox, frame_for(outbox))
+            else:
+                remote.append(session_id)
+        if remote:
+            results = await asyncio.gather(*(self.router.publish(sid, data) for sid in remote))
+            sent += sum(results)
+        return sent
 
-    async def send_json(self, session_id: str, data: Dict[str, Any]) -> None:
-        ws = self.active_sessions.get(session_id)
-        if ws:
-            await ws.send_json(data)
\ No newline at end of file
+    def stats(self) -> Dict[str, int]:
+        return {
+            "connections": len(self.active_sessions),
+            "detached": len(self._outboxes) - len(self.active_sessions),
+            "queued_frames": sum(len(outbox.queue) for outbox in self._outboxes.values()),
+            "dropped_frames": self.dropped_frames,
+            "slow_consumers_closed": self.slow_closed,
+        }
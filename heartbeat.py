@@ -0,0 +1,208 @@
+import asyncio
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+from connection_manager import ConnectionManager
+
+
+# ---------- SERVER HEARTBEATS AND IDLE REAPING ----------
+
+# Most companions sit connected and silent for hours, and a peer that vanished
+# (laptop lid closed, NAT entry dropped) leaves a socket nobody will ever close.
+# With heartbeat_interval set, the server finds them with heartbeats of its own
+# (off by default: clients have to answer them, see SERVER_SPEC.md):
+#
+#   - a connection that sent nothing for heartbeat_interval seconds gets a
+#     {"type": "heartbeat"} frame, which the client answers with one of its own
+#     (any other frame counts as an answer too)
+#   - no frame within heartbeat_timeout seconds after that: the peer is dead and
+#     the socket is closed with 1001, so the session is parked for a resume
+#     like any other dropped connection (see resume.py)
+#   - with idle_timeout set (heartbeats on or not), a session without user
+#     activity (messages, audio, context; heartbeats, pings and acks don't
+#     count) for that long is closed with 1000 and ends
+#
+# Heartbeat frames are not numbered and not kept for replay: clients counting
+# frames for a resume skip them, like session_resumed.
+#
+# There is one timer for all connections: a hashed timer wheel advanced every
+# heartbeat_tick seconds by a single task. Each connection has at most one entry
+# in it, and frames arriving only stamp the connection's Outbox (last_seen,
+# last_active), so traffic never touches the wheel; a connection's entry is
+# looked at once per interval and rescheduled from those stamps. uvicorn's own
+# keepalive pings (a timer per socket) are turned off while heartbeats are sent.
+#
+# config keys used (all optional):
+#
+#   "heartbeat_interval": 0,       # seconds of silence before a heartbeat, 0 = off
+#   "heartbeat_timeout": 20.0,     # seconds to answer it
+#   "heartbeat_tick": 1.0,         # wheel resolution
+#   "idle_timeout": 0,             # seconds without user activity, 0 = never reaped
+
+# close codes: the peer is gone (a resume may follow) / closed for being idle
+DEAD_CLOSE_CODE = 1001
+IDLE_CLOSE_CODE = 1000
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel of keys: schedule() and cancel() are O(1), advance()
+    costs the entries of one slot. A key has at most one live deadline;
+    rescheduling leaves the old entry behind, skipped when its slot comes up.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        self.tick = tick
+        self._slots: List[List[str]] = [[] for _ in range(slots)]
+        # key -> tick it is due at
+        self._due: Dict[str, int] = {}
+        self.ticks = 0
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._due
+
+    def schedule(self, key: str, delay: float) -> None:
+        at = self.ticks + max(1, math.ceil(delay / self.tick))
+        self._due[key] = at
+        self._slots[at % len(self._slots)].append(key)
+
+    def cancel(self, key: str) -> None:
+        self._due.pop(key, None)
+
+    def advance(self) -> List[str]:
+        """
+        Move one tick forward and return the keys that are now due.
+        """
+        self.ticks += 1
+        now = self.ticks
+        index = now % len(self._slots)
+        entries = self._slots[index]
+        self._slots[index] = later = []
+        due = []
+        for key in entries:
+            at = self._due.get(key)
+            if at == now:
+                del self._due[key]
+                due.append(key)
+            elif at is not None and at > now and at % len(self._slots) == index:
+                # due on a later turn of the wheel
+                later.append(key)
+        return due
+
+
+class Heartbeats:
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        interval: float = 0,
+        timeout: float = 20.0,
+        tick: float = 1.0,
+        idle_timeout: float = 0,
+    ):
+        self.manager = manager
+        self.interval = interval
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        # a turn of the wheel covers the longest delay, so entries rarely lap
+        longest = max(interval, timeout, idle_timeout or 0)
+        self.wheel = TimerWheel(tick, max(64, int(longest / tick) + 2))
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.sent = 0
+        self.reaped_dead = 0
+        self.reaped_idle = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], manager: ConnectionManager) -> "Heartbeats":
+        return cls(
+            manager,
+            interval=config.get("heartbeat_interval", 0),
+            timeout=config.get("heartbeat_timeout", 20.0),
+            tick=config.get("heartbeat_tick", 1.0),
+            idle_timeout=config.get("idle_timeout", 0),
+        )
+
+    def watch(self, session_id: str) -> None:
+        """
+        Start watching a connection (after connect or resume).
+        """
+        self.wheel.schedule(session_id, self.interval or self.idle_timeout)
+
+    def forget(self, session_id: str) -> None:
+        """
+        The session is gone (disconnect hook).
+        """
+        self.wheel.cancel(session_id)
+
+    def _check(self, session_id: str, now: float) -> None:
+        outbox = self.manager.outbox(session_id)
+        if outbox is None or outbox.closed:
+            # gone, closing or detached; a resume watches it again
+            return
+
+        if self.idle_timeout and now - outbox.last_active >= self.idle_timeout:
+            self.reaped_idle += 1
+            self.manager.close(session_id, IDLE_CLOSE_CODE, "idle")
+            return
+
+        pinged_at = outbox.pinged_at
+        if not self.interval:
+            # idle reaping only
+            delay = self.idle_timeout
+        elif pinged_at is not None and outbox.last_seen < pinged_at:
+            if now - pinged_at >= self.timeout:
+                self.reaped_dead += 1
+                self.manager.close(session_id, DEAD_CLOSE_CODE, "heartbeat timeout")
+                return
+            delay = pinged_at + self.timeout - now
+        else:
+            outbox.pinged_at = None
+            quiet = now - outbox.last_seen
+            if quiet >= self.interval and self.manager.heartbeat(session_id):
+                self.sent += 1
+                outbox.pinged_at = now
+                delay = self.timeout
+            else:
+                delay = self.interval - quiet if quiet < self.interval else self.interval
+
+        if self.idle_timeout:
+            delay = min(delay, self.idle_timeout - (now - outbox.last_active))
+        self.wheel.schedule(session_id, delay)
+
+    def _advance(self) -> None:
+        now = time.monotonic()
+        for session_id in self.wheel.advance():
+            try:
+                self._check(session_id, now)
+            except Exception as e:
+                print(f"Error checking heartbeat of {session_id}: {e}")
+
+    async def _run(self) -> None:
+        tick = self.wheel.tick
+        next_tick = time.monotonic() + tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            # catch up on ticks missed while the loop was busy
+            while next_tick <= time.monotonic():
+                self._advance()
+                next_tick += tick
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "watched": len(self.wheel),
+            "sent": self.sent,
+            "reaped_dead": self.reaped_dead,
+            "reaped_idle": self.reaped_idle,
+        }
@@ -0,0 +1,239 @@
+import sys
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+# ---------- CONVERSATION HISTORY ----------
+
+# Per-session memory for chat_messages without resending an ever-growing prompt:
+#
+#   - each session keeps a ring buffer of compact Turn records (max_turns)
+#   - the prompt for a turn is the system prompt (+ rolling summary) + as many of
+#     the most recent turns as fit in token_budget; the oldest are left out first
+#   - turns pushed out of the ring buffer can be folded into a rolling summary
+#     (optional, done by the caller with an LLM call, see needs_summary)
+#   - memory is capped per session (max_session_bytes, oldest turns go first) and
+#     in total (max_total_bytes, least recently used sessions are evicted), and
+#     sessions idle for idle_ttl seconds are dropped
+#
+# config keys used (all optional):
+#
+#   "history_enabled": True,
+#   "history_token_budget": 2000,
+#   "history_max_turns": 32,
+#   "history_max_session_bytes": 32 * 1024,
+#   "history_max_total_bytes": 32 * 1024 * 1024,
+#   "history_idle_ttl": 1800,
+#   "history_summary_batch": 0,          # 0 = no rolling summary
+
+TURN_OVERHEAD = 64  # approximate size of a Turn object itself
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token), good enough for budgeting.
+    """
+    return len(text) // 4 + 1
+
+
+class Turn:
+    __slots__ = ("role", "content", "tokens", "size")
+
+    def __init__(self, role: str, content: str):
+        self.role = role
+        self.content = content
+        self.tokens = estimate_tokens(content)
+        self.size = sys.getsizeof(content) + TURN_OVERHEAD
+
+
+class SessionHistory:
+    __slots__ = ("turns", "size", "summary", "evicted", "last_used")
+
+    def __init__(self, max_turns: int):
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self.size = 0
+        self.summary: Optional[str] = None
+        # turns pushed out of the ring buffer, waiting to be folded into the summary
+        self.evicted: List[Turn] = []
+        self.last_used = time.monotonic()
+
+    def pop_oldest(self, keep_for_summary: bool) -> Turn:
+        turn = self.turns.popleft()
+        if keep_for_summary:
+            # still held in memory until the summarizer takes it
+            self.evicted.append(turn)
+        else:
+            self.size -= turn.size
+        return turn
+
+
+class HistoryStore:
+    def __init__(
+        self,
+        token_budget: int = 2000,
+        max_turns: int = 32,
+        max_session_bytes: int = 32 * 1024,
+        max_total_bytes: int = 32 * 1024 * 1024,
+        idle_ttl: float = 1800.0,
+        summary_batch: int = 0,
+    ):
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.max_session_bytes = max_session_bytes
+        self.max_total_bytes = max_total_bytes
+        self.idle_ttl = idle_ttl
+        self.summary_batch = summary_batch
+        # least recently used first
+        self._sessions: "OrderedDict[str, SessionHistory]" = OrderedDict()
+        self.total_bytes = 0
+        self.evicted_sessions = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "HistoryStore":
+        return cls(
+            token_budget=config.get("history_token_budget", 2000),
+            max_turns=config.get("history_max_turns", 32),
+            max_session_bytes=config.get("history_max_session_bytes", 32 * 1024),
+            max_total_bytes=config.get("history_max_total_bytes", 32 * 1024 * 1024),
+            idle_ttl=config.get("history_idle_ttl", 1800.0),
+            summary_batch=config.get("history_summary_batch", 0),
+        )
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _get(self, session_id: str, create: bool = False) -> Optional[SessionHistory]:
+        history = self._sessions.get(session_id)
+        if history is None and create:
+            history = self._sessions[session_id] = SessionHistory(self.max_turns)
+        if history is not None:
+            history.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+        return history
+
+    def add(self, session_id: str, role: str, content: str) -> None:
+        history = self._get(session_id, create=True)
+        summarize = self.summary_batch > 0
+        before = history.size
+
+        if len(history.turns) == history.turns.maxlen:
+            history.pop_oldest(summarize)
+
+        turn = Turn(role, content)
+        history.turns.append(turn)
+        history.size += turn.size
+
+        # per-session cap: drop the oldest turns (never the one just added)
+        while history.size > self.max_session_bytes and len(history.turns) > 1:
+            history.pop_oldest(keep_for_summary=False)
+        while history.size > self.max_session_bytes and history.evicted:
+            history.size -= history.evicted.pop(0).size
+
+        self.total_bytes += history.size - before
+        self.evict(keep=session_id)
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Drop idle sessions and, if over the total cap, least recently used ones.
+        """
+        now = time.monotonic()
+        count = 0
+        while self._sessions:
+            session_id, history = next(iter(self._sessions.items()))
+            if session_id == keep:
+                break
+            idle = now - history.last_used >= self.idle_ttl
+            if not idle and self.total_bytes <= self.max_total_bytes:
+                break
+            self.discard(session_id)
+            count += 1
+        self.evicted_sessions += count
+        return count
+
+    def discard(self, session_id: str) -> None:
+        history = self._sessions.pop(session_id, None)
+        if history is not None:
+            self.total_bytes -= history.size
+
+    def build_messages(
+        self,
+        session_id: str,
+        system_prompt: Optional[str],
+        user_text: str,
+        token_budget: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+        """
+        Messages for chat_messages: system prompt (+ summary), the most recent turns
+        that fit in the token budget, then the new user message.
+        Also returns prompt size stats for this turn.
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        history = self._get(session_id)
+
+        system = system_prompt or ""
+        if history and history.summary:
+            system = f"{system}\n\nConversation so far: {history.summary}".strip()
+
+        used = estimate_tokens(user_text) + (estimate_tokens(system) if system else 0)
+        full = used
+        picked: List[Turn] = []
+        fits = True
+        if history:
+            # newest first; once a turn doesn't fit, everything older is left out too
+            for turn in reversed(history.turns):
+                full += turn.tokens
+                if fits and used + turn.tokens <= budget:
+                    picked.append(turn)
+                    used += turn.tokens
+                else:
+                    fits = False
+
+        msgs: List[Dict[str, str]] = []
+        if system:
+            msgs.append({"role": "system", "content": system})
+        for turn in reversed(picked):
+            msgs.append({"role": turn.role, "content": turn.content})
+        msgs.append({"role": "user", "content": user_text})
+
+        stats = {
+            "prompt_tokens": used,
+            "full_history_tokens": full,
+            "history_turns": len(picked),
+            "history_dropped_turns": (len(history.turns) if history else 0) - len(picked),
+        }
+        return msgs, stats
+
+    def needs_summary(self, session_id: str) -> bool:
+        history = self._sessions.get(session_id)
+        return bool(self.summary_batch and history and len(history.evicted) >= self.summary_batch)
+
+    def take_for_summary(self, session_id: str) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """
+        Hand the current summary and the evicted turns to the summarizer.
+        """
+        history = self._sessions.get(session_id)
+        if history is None:
+            return None, []
+        evicted, history.evicted = history.evicted, []
+        freed = sum(turn.size for turn in evicted)
+        history.size -= freed
+        self.total_bytes -= freed
+        return history.summary, [{"role": t.role, "content": t.content} for t in evicted]
+
+    def set_summary(self, session_id: str, summary: str) -> None:
+        history = self._sessions.get(session_id)
+        if history is None:
+            return
+        old = sys.getsizeof(history.summary) if history.summary else 0
+        history.summary = summary
+        delta = sys.getsizeof(summary) - old
+        history.size += delta
+        self.total_bytes += delta
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._sessions),
+            "total_bytes": self.total_bytes,
+            "evicted_sessions": self.evicted_sessions,
+        }
@@ -0,0 +1,231 @@
+import asyncio
+from contextlib import AsyncExitStack
+from typing import Any, AsyncContextManager, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence
+
+from audio import AudioFormat, BytesLike, PcmResampler, encode_for_upstream
+from backend_registry import load_module
+from ratelimit import add_usage
+from vad import VadGate
+
+
+# ---------- PERSISTENT GEMINI LIVE SESSIONS ----------
+
+# Instead of one generate_content call per turn (in a worker thread), each /ws
+# session keeps one bidirectional Live connection open and reuses it:
+#
+#   - text turns     -> send_client_content(..., turn_complete=True)
+#   - audio chunks   -> send_realtime_input(audio=...) as they arrive, then audio_stream_end
+#   - model output   -> receive() until turn_complete, yielded as LiveEvent(text / audio)
+#
+# The upstream connection is opened on first use and closed when the /ws session
+# goes away (LiveSessionManager.discard is registered as a ConnectionManager
+# disconnect hook). Response modalities are fixed per connection, so asking for
+# different ones (a session switching to audio out) reconnects.
+
+# (system_prompt, response_modalities or None for the configured ones) -> connection
+ConnectFn = Callable[[Optional[str], Optional[List[str]]], AsyncContextManager[Any]]
+
+
+class LiveEvent:
+    __slots__ = ("text", "audio")
+
+    def __init__(self, text: Optional[str] = None, audio: Optional[bytes] = None):
+        self.text = text
+        self.audio = audio
+
+
+class LiveSession:
+    def __init__(
+        self,
+        session_id: str,
+        connect_cm: AsyncContextManager[Any],
+        turn_timeout: float = 60.0,
+        modalities: Optional[List[str]] = None,
+    ):
+        self.session_id = session_id
+        self.turn_timeout = turn_timeout
+        self.modalities = modalities
+        self.turns = 0
+        self._cm = connect_cm
+        self._stack = AsyncExitStack()
+        self._session: Any = None
+
+    async def open(self) -> "LiveSession":
+        self._session = await self._stack.enter_async_context(self._cm)
+        return self
+
+    @property
+    def closed(self) -> bool:
+        return self._session is None
+
+    async def send_text(self, text: str) -> None:
+        # google-genai is already loaded once a connection is open
+        genai_types = load_module("google.genai.types")
+        await self._session.send_client_content(
+            turns=genai_types.Content(role="user", parts=[genai_types.Part(text=text)]),
+            turn_complete=True,
+        )
+
+    async def send_audio(self, chunk: bytes, mime_type: str) -> None:
+        blob = load_module("google.genai.types").Blob(data=chunk, mime_type=mime_type)
+        await self._session.send_realtime_input(audio=blob)
+
+    async def end_audio(self) -> None:
+        await self._session.send_realtime_input(audio_stream_end=True)
+
+    async def receive_turn(self) -> AsyncIterator[LiveEvent]:
+        """
+        Yield the model's output for the current turn as it streams in.
+        """
+        messages = self._session.receive().__aiter__()
+        usage = None
+        while True:
+            try:
+                msg = await asyncio.wait_for(messages.__anext__(), self.turn_timeout)
+            except StopAsyncIteration:
+                break
+
+            if msg.usage_metadata is not None:
+                usage = msg.usage_metadata
+
+            content = msg.server_content
+            if content is None:
+                continue
+
+            if content.model_turn:
+                for part in content.model_turn.parts or []:
+                    if part.text:
+                        yield LiveEvent(text=part.text)
+                    if part.inline_data and part.inline_data.data:
+                        yield LiveEvent(audio=part.inline_data.data)
+
+            # With AUDIO responses, the text comes from the output transcription
+            if content.output_transcription and content.output_transcription.text:
+                yield LiveEvent(text=content.output_transcription.text)
+
+            if content.turn_complete:
+                break
+
+        self.turns += 1
+        if usage is not None:
+            # the last report of the turn holds its totals
+            add_usage(usage.prompt_token_count, usage.response_token_count)
+
+    async def aclose(self) -> None:
+        self._session = None
+        await self._stack.aclose()
+
+
+class LiveAudioPipe:
+    """
+    One utterance streamed from /ws into a LiveSession as it arrives:
+    VAD gate (optional) -> resample to the native rate -> send_realtime_input.
+    """
+
+    __slots__ = ("live", "fmt", "upstream_rate", "resampler", "gate", "sent_bytes")
+
+    def __init__(self, live: LiveSession, fmt: AudioFormat, upstream_rate: int, gate: Optional[VadGate] = None):
+        self.live = live
+        self.fmt = fmt
+        self.upstream_rate = upstream_rate
+        self.resampler = PcmResampler(fmt.sample_rate, upstream_rate, fmt.channels) if fmt.is_pcm else None
+        self.gate = gate if fmt.is_pcm else None
+        self.sent_bytes = 0
+
+    @property
+    def removed(self) -> int:
+        return self.gate.removed if self.gate else 0
+
+    async def feed(self, chunk: BytesLike) -> None:
+        await self._send(self.gate.feed(chunk) if self.gate else (chunk,))
+
+    async def _send(self, pieces: Iterable[BytesLike]) -> None:
+        for piece in pieces:
+            payload, mime_type = encode_for_upstream(piece, self.fmt, self.upstream_rate, resampler=self.resampler)
+            await self.live.send_audio(payload, mime_type)
+            self.sent_bytes += len(payload)
+
+    async def finish(self) -> bool:
+        """
+        Close the utterance. Returns False if no speech was sent (nothing to answer).
+        """
+        if self.gate:
+            await self._send(self.gate.finish())
+        if not self.sent_bytes:
+            return False
+        await self.live.end_audio()
+        return True
+
+
+class _Opening:
+    __slots__ = ("live", "task")
+
+    def __init__(self, live: LiveSession):
+        # the session (and its modalities) is known before open() has finished
+        self.live = live
+        self.task: "asyncio.Future[LiveSession]" = asyncio.ensure_future(live.open())
+
+
+class LiveSessionManager:
+    def __init__(self, connect: ConnectFn, turn_timeout: float = 60.0):
+        self._connect = connect
+        self.turn_timeout = turn_timeout
+        self._sessions: Dict[str, _Opening] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def get(
+        self,
+        session_id: str,
+        system_prompt: Optional[str] = None,
+        modalities: Optional[Sequence[str]] = None,
+    ) -> LiveSession:
+        """
+        Return the session's Live connection, opening it on first use (or reopening
+        it if it was opened with other response modalities, even while it is still
+        opening). Concurrent callers share the same opening attempt.
+        """
+        modalities = list(modalities) if modalities else None
+        opening = self._sessions.get(session_id)
+        if opening is not None and opening.live.modalities != modalities:
+            self.discard(session_id)
+            opening = None
+        if opening is None:
+            live = LiveSession(session_id, self._connect(system_prompt, modalities), self.turn_timeout, modalities)
+            opening = self._sessions[session_id] = _Opening(live)
+
+        try:
+            return await asyncio.shield(opening.task)
+        except Exception:
+            # don't keep a broken connection around; the next turn reconnects
+            if self._sessions.get(session_id) is opening:
+                del self._sessions[session_id]
+            raise
+
+    async def close(self, session_id: str) -> None:
+        opening = self._sessions.pop(session_id, None)
+        if opening is not None:
+            await self._close(session_id, opening)
+
+    async def _close(self, session_id: str, opening: _Opening) -> None:
+        try:
+            live = await opening.task
+        except Exception:
+            return
+        try:
+            await live.aclose()
+        except Exception as e:
+            print(f"Error closing live session {session_id}: {e}")
+
+    def discard(self, session_id: str) -> None:
+        """
+        Synchronous close (for ConnectionManager.disconnect): the connection is
+        forgotten right away, so the next get() opens a new one; closing it is scheduled.
+        """
+        opening = self._sessions.pop(session_id, None)
+        if opening is not None:
+            asyncio.ensure_future(self._close(session_id, opening))
+
+    async def close_all(self) -> None:
+        await asyncio.gather(*(self.close(sid) for sid in list(self._sessions)))
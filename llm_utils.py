@@ -1,15 +1,25 @@
 # llm_simple.py
 
 import asyncio
-from typing import Any, Dict, List, Optional
+import functools
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, ContextManager, Dict, List, Optional, Tuple
 
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, BaseMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.chat_models import ChatOllama
+from admission import AdmissionController
+from backend_registry import BACKEND_MODULES, BackendRegistry, load_backend, load_module
+from backend_router import BackendRouter
+from history import estimate_tokens
+from metrics import metrics
+from prompt_cache import PromptCache
+from ratelimit import add_prefix_usage, add_usage
+from response_cache import ResponseCache
 
-# For gemini-live (non-LangChain)
-from google import genai
-from google.genai.types import Content, Part
+if TYPE_CHECKING:
+    # The SDKs themselves are imported on first use (see backend_registry.BACKEND_MODULES)
+    from google import genai
+    from google.genai.types import Content
+    from langchain_core.messages import BaseMessage
 
 
 # ---------- CONFIG SHAPE ----------
@@ -28,6 +38,9 @@ from google.genai.types import Content, Part
 #   - "gemini"       -> LangChain ChatGoogleGenerativeAI (text)
 #   - "ollama"       -> LangChain ChatOllama (text)
 #   - "gemini-live"  -> google-genai client (text in -> text out via live-capable model)
+#
+# registered system prompts are referenced from an upstream cache instead of being
+# resent each turn where the backend supports it (see prompt_cache.py)
 
 
 # ---------- LLM CREATION (LANGCHAIN BACKENDS) ----------
@@ -45,7 +58,7 @@ def create_llm(
     backend = backend.lower()
 
     if backend == "gemini":
-        return ChatGoogleGenerativeAI(
+        return load_module("langchain_google_genai").ChatGoogleGenerativeAI(
             model=model or config.get("gemini_default_model", "gemini-1.5-flash"),
             google_api_key=config["gemini_api_key"],
             streaming=False,
@@ -53,7 +66,9 @@ def create_llm(
         )
 
     if backend == "ollama":
-        return ChatOllama(
+        # keep the model (and the system prompt it has already evaluated) loaded between turns
+        kwargs.setdefault("keep_alive", config.get("ollama_keep_alive", "30m"))
+        return load_module("langchain_community.chat_models.ollama").ChatOllama(
             model=model or config.get("ollama_default_model", "llama3.1"),
             base_url=config.get("ollama_base_url", "http://localhost:11434"),
             streaming=False,
@@ -63,9 +78,168 @@ def create_llm(
     raise ValueError(f"Unsupported backend for create_llm: {backend}")
 
 
+# ---------- POOLED CLIENTS ----------
+
+_registry: Optional[BackendRegistry] = None
+
+
+def get_registry(config: Dict[str, Any]) -> BackendRegistry:
+    """
+    Process-wide registry of long-lived backend clients (built from config on first use).
+    """
+    global _registry
+    if _registry is None:
+        _registry = BackendRegistry.from_config(config)
+    return _registry
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache(config: Dict[str, Any]) -> Optional[ResponseCache]:
+    """
+    Process-wide response cache, or None unless "response_cache_enabled" is set.
+    """
+    global _response_cache
+    if not config.get("response_cache_enabled", False):
+        return None
+    if _response_cache is None:
+        _response_cache = ResponseCache.from_config(config)
+    return _response_cache
+
+
+_router: Optional[BackendRouter] = None
+
+
+def get_router(config: Dict[str, Any]) -> Optional[BackendRouter]:
+    """
+    Process-wide backend router (fallback / hedging / breakers), or None unless "router_enabled" is set.
+    """
+    global _router
+    if not config.get("router_enabled", False):
+        return None
+    if _router is None:
+        _router = BackendRouter.from_config(config)
+    return _router
+
+
+_admission: Optional[AdmissionController] = None
+
+
+def get_admission(config: Dict[str, Any]) -> Optional[AdmissionController]:
+    """
+    Process-wide admission controller for the ollama backend, or None unless "ollama_admission_enabled" is set.
+    """
+    global _admission
+    if not config.get("ollama_admission_enabled", False):
+        return None
+    if _admission is None:
+        _admission = AdmissionController.from_config(config)
+        metrics.add_collector(_admission.prometheus_lines)
+    return _admission
+
+
+_prompt_cache: Optional[PromptCache] = None
+
+
+def get_prompt_cache(config: Dict[str, Any]) -> Optional[PromptCache]:
+    """
+    Process-wide cache of the fixed system prompts, or None if "prompt_cache_enabled" is turned off.
+    """
+    global _prompt_cache
+    if not config.get("prompt_cache_enabled", True):
+        return None
+    if _prompt_cache is None:
+        _prompt_cache = PromptCache.from_config(
+            config,
+            functools.partial(_create_gemini_cache, config),
+            functools.partial(_refresh_gemini_cache, config),
+            functools.partial(_delete_gemini_cache, config),
+        )
+        metrics.add_collector(_prompt_cache.prometheus_lines)
+    return _prompt_cache
+
+
+def _upstream_slot(backend: str, config: Dict[str, Any], messages: List[Dict[str, str]]):
+    """
+    What an upstream call holds while it runs: an admission slot for ollama (when
+    enabled), otherwise the registry's per-backend concurrency limit.
+    """
+    if backend == "ollama":
+        admission = get_admission(config)
+        if admission is not None:
+            return admission.slot(sum(len(m.get("content", "")) for m in messages))
+    return get_registry(config).limit(backend)
+
+
+def get_llm(
+    backend: str,
+    config: Dict[str, Any],
+    model: Optional[str] = None,
+    **kwargs: Any,
+):
+    """
+    Same as create_llm, but returns a cached model so its HTTP client and
+    connection pool are reused across turns.
+    """
+    backend = backend.lower()
+    with metrics.span("create_llm", backend):
+        return get_registry(config).get(
+            backend,
+            model,
+            lambda **kw: create_llm(backend=backend, config=config, model=model, **kw),
+            **kwargs,
+        )
+
+
+def _get_genai_client(config: Dict[str, Any]) -> "genai.Client":
+    return get_registry(config).get(
+        "gemini-live",
+        None,
+        load_module("google.genai").Client,
+        api_key=config["gemini_api_key"],
+    )
+
+
+def _lease_genai_client(config: Dict[str, Any]) -> ContextManager["genai.Client"]:
+    # the pooled genai.Client, not closed by an eviction while the block runs
+    # (LangChain models are never closed, so get_llm needs no lease)
+    return get_registry(config).lease(
+        "gemini-live",
+        None,
+        load_module("google.genai").Client,
+        api_key=config["gemini_api_key"],
+    )
+
+
+async def warm_up(config: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Import the SDKs of config["warmup_backends"] (in a worker thread) and build
+    their pooled clients, so the first turn doesn't pay for either.
+    Returns the seconds each backend took.
+    """
+    timings: Dict[str, float] = {}
+    for backend in config.get("warmup_backends", ()):
+        if backend not in BACKEND_MODULES:
+            print(f"Error warming up {backend}: unknown backend (use one of {list(BACKEND_MODULES)})")
+            continue
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(load_backend, backend)
+            if backend == "gemini-live":
+                _get_genai_client(config)
+            else:
+                get_llm(backend, config)
+        except Exception as e:
+            print(f"Error warming up {backend}: {e}")
+            continue
+        timings[backend] = time.perf_counter() - start
+    return timings
+
+
 # ---------- MESSAGE CONVERSION FOR LANGCHAIN ----------
 
-def _convert_messages(messages: List[Dict[str, str]]) -> List[BaseMessage]:
+def _convert_messages(messages: List[Dict[str, str]]) -> List["BaseMessage"]:
     """
     Convert simple dict messages into LangChain message objects.
 
@@ -75,29 +249,99 @@ def _convert_messages(messages: List[Dict[str, str]]) -> List[BaseMessage]:
       {"role": "assistant", "content": "..."},
     ]
     """
-    lc_messages: List[BaseMessage] = []
+    lc = load_module("langchain_core.messages")
+    lc_messages: List["BaseMessage"] = []
 
     for m in messages:
         role = m.get("role", "user")
         content = m.get("content", "")
 
         if role == "system":
-            lc_messages.append(SystemMessage(content=content))
+            lc_messages.append(lc.SystemMessage(content=content))
         elif role == "assistant":
-            lc_messages.append(AIMessage(content=content))
+            lc_messages.append(lc.AIMessage(content=content))
         else:  # default to user
-            lc_messages.append(HumanMessage(content=content))
+            lc_messages.append(lc.HumanMessage(content=content))
 
     return lc_messages
 
 
 # ---------- GEMINI-LIVE (google-genai) IMPLEMENTATION ----------
 
+def _build_live_contents(
+    messages: List[Dict[str, str]],
+    audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/wav",
+) -> List["Content"]:
+    """
+    Convert our messages into Gemini Content objects (system messages go in the
+    system instruction instead, see _system_instruction).
+    Audio (if any) is attached to the last user message, or to a new one.
+    """
+    genai_types = load_module("google.genai.types")
+    Content, Part = genai_types.Content, genai_types.Part
+    contents: List["Content"] = []
+    for m in messages:
+        role = m.get("role", "user")
+        if role == "system":
+            continue
+
+        # Map roles: "assistant" -> "model", others -> "user"
+        g_role = "model" if role == "assistant" else "user"
+        contents.append(Content(role=g_role, parts=[Part(text=m.get("content", ""))]))
+
+    if audio_data:
+        audio_part = Part.from_bytes(data=audio_data, mime_type=audio_mime_type)
+        if contents and contents[-1].role == "user":
+            contents[-1].parts.append(audio_part)
+        else:
+            contents.append(Content(role="user", parts=[audio_part]))
+
+    return contents
+
+
+def _system_instruction(messages: List[Dict[str, str]]) -> Optional[str]:
+    system = "\n\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    return system or None
+
+
+def _extract_text(resp: Any) -> str:
+    # google-genai usually has resp.text convenience
+    if getattr(resp, "text", None):
+        return resp.text
+
+    # Fallback: manually concatenate text parts
+    out_chunks: List[str] = []
+    for cand in getattr(resp, "candidates", []) or []:
+        content = getattr(cand, "content", None)
+        for part in (content.parts if content is not None else None) or []:
+            if part.text:
+                out_chunks.append(part.text)
+
+    return "".join(out_chunks)
+
+
+def _report_usage(resp: Any) -> None:
+    """
+    Pass the token counts of a response on to the current turn's Usage:
+    LangChain messages carry usage_metadata as a dict, google-genai responses as an object.
+    """
+    meta = getattr(resp, "usage_metadata", None)
+    if not meta:
+        return
+    if isinstance(meta, dict):
+        details = meta.get("input_token_details") or {}
+        add_usage(meta.get("input_tokens"), meta.get("output_tokens"), details.get("cache_read"))
+    else:
+        add_usage(meta.prompt_token_count, meta.candidates_token_count, meta.cached_content_token_count)
+
+
 async def _chat_gemini_live(
     config: Dict[str, Any],
     messages: List[Dict[str, str]],
     model: Optional[str] = None,
     audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/wav",
     **kwargs: Any,
 ) -> str:
     """
@@ -106,96 +350,297 @@ async def _chat_gemini_live(
     This still uses a simple generate_content call, but against a live-capable
     model like "gemini-2.5-flash-native-audio-preview-09-2025".
     """
-    api_key = config["gemini_api_key"]
     live_model = model or config.get(
         "gemini_live_model",
         "gemini-2.5-flash-native-audio-preview-09-2025",
     )
 
-    client = genai.Client(api_key=api_key)
+    with metrics.span("convert_messages", "gemini-live"):
+        contents = _build_live_contents(messages, audio_data, audio_mime_type)
+    gen_config: Dict[str, Any] = {
+        # We only want TEXT back here, even though model can do audio
+        "response_modalities": ["TEXT"],
+        **kwargs,
+    }
+    system = _system_instruction(messages)
+    if system:
+        gen_config["system_instruction"] = system
 
-    # Convert our messages into Gemini Content objects
-    contents: List[Content] = []
-    for m in messages:
-        role = m.get("role", "user")
-        txt = m.get("content", "")
-
-        # Map roles: "assistant" -> "model", others -> "user" or "system"
-        if role == "assistant":
-            g_role = "model"
-        elif role == "system":
-            g_role = "user"  # simplest mapping; you can encode system separately if you like
-            txt = f"[SYSTEM] {txt}"
-        else:
-            g_role = "user"
-
-        parts = [Part(text=txt)]
-        if audio_data and g_role == "user":
-             # Assuming the audio is associated with the last user message or we attach it to this one
-             # For simplicity, if audio_data is passed, we attach it to the user message
-             parts.append(Part.from_bytes(data=audio_data, mime_type="audio/wav")) # Defaulting to wav
-
-        contents.append(
-            Content(
-                role=g_role,
-                parts=parts,
-            )
+    # Call generate_content in a thread so we don't block the event loop
+    submitted = time.perf_counter()
+
+    def _call_generate(client: "genai.Client"):
+        metrics.observe("to_thread_wait", time.perf_counter() - submitted, "gemini-live")
+        return client.models.generate_content(
+            model=live_model,
+            contents=contents,
+            config=gen_config,
         )
 
-    # If audio_data was provided but not attached (e.g. no user message), attach it to a new one
-    # (Simplification: assume caller structures messages correctly or we just attach to the last one if not done)
-    # Better approach: just process parts.
+    with _lease_genai_client(config) as client:
+        resp = await asyncio.to_thread(_call_generate, client)
+    _report_usage(resp)
+    return _extract_text(resp).strip()
 
-    # RE-IMPLEMENTATION for safer audio attachment:
-    # We will reconstruct contents.
-    
-    contents = []
-    for m in messages:
-        role = m.get("role", "user")
-        txt = m.get("content", "")
-        
-        if role == "assistant":
-            g_role = "model"
-        else:
-            g_role = "user"
-            if role == "system":
-                txt = f"[SYSTEM] {txt}"
-        
-        contents.append(Content(role=g_role, parts=[Part(text=txt)]))
 
-    if audio_data:
-        # Add audio to the last user message, or create a new one if none exists
-        if contents and contents[-1].role == "user":
-            contents[-1].parts.append(Part.from_bytes(data=audio_data, mime_type="audio/wav"))
-        else:
-            contents.append(Content(role="user", parts=[Part.from_bytes(data=audio_data, mime_type="audio/wav")]))
+async def _stream_gemini_live(
+    config: Dict[str, Any],
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/wav",
+    **kwargs: Any,
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of _chat_gemini_live: yields text chunks as the model
+    produces them (google-genai async streaming, no worker thread).
+    """
+    live_model = model or config.get(
+        "gemini_live_model",
+        "gemini-2.5-flash-native-audio-preview-09-2025",
+    )
 
-    # Call generate_content in a thread so we don't block the event loop
-    def _call_generate():
-        return client.models.generate_content(
+    with metrics.span("convert_messages", "gemini-live"):
+        contents = _build_live_contents(messages, audio_data, audio_mime_type)
+    gen_config: Dict[str, Any] = {
+        "response_modalities": ["TEXT"],
+        **kwargs,
+    }
+    system = _system_instruction(messages)
+    if system:
+        gen_config["system_instruction"] = system
+
+    with _lease_genai_client(config) as client:
+        stream = await client.aio.models.generate_content_stream(
             model=live_model,
             contents=contents,
-            config={
-                # We only want TEXT back here, even though model can do audio
-                "response_modalities": ["TEXT"],
-                **kwargs,
-            },
+            config=gen_config,
         )
+        # every chunk carries the running totals; the last one has the turn's
+        last = None
+        try:
+            async for chunk in stream:
+                last = chunk
+                text = _extract_text(chunk)
+                if text:
+                    yield text
+        finally:
+            if last is not None:
+                _report_usage(last)
 
-    resp = await asyncio.to_thread(_call_generate)
 
-    # Extract text (google-genai usually has resp.text convenience)
-    if getattr(resp, "text", None):
-        return resp.text
+# ---------- SYSTEM-PROMPT PREFIX CACHING (see prompt_cache.py) ----------
 
-    # Fallback: manually concatenate text parts
-    out_chunks: List[str] = []
-    for cand in getattr(resp, "candidates", []) or []:
-        for part in getattr(cand, "content", Content()).parts or []:
-            if part.text:
-                out_chunks.append(part.text)
+async def _create_gemini_cache(config: Dict[str, Any], model: str, text: str, ttl: int) -> str:
+    genai_types = load_module("google.genai.types")
+    with _lease_genai_client(config) as client:
+        cached = await client.aio.caches.create(
+            model=model,
+            config=genai_types.CreateCachedContentConfig(system_instruction=text, ttl=f"{ttl}s"),
+        )
+    return cached.name
+
+
+async def _refresh_gemini_cache(config: Dict[str, Any], name: str, ttl: int) -> None:
+    genai_types = load_module("google.genai.types")
+    with _lease_genai_client(config) as client:
+        await client.aio.caches.update(
+            name=name,
+            config=genai_types.UpdateCachedContentConfig(ttl=f"{ttl}s"),
+        )
+
+
+async def _delete_gemini_cache(config: Dict[str, Any], name: str) -> None:
+    with _lease_genai_client(config) as client:
+        await client.aio.caches.delete(name=name)
+
+
+def _cached_prefix(
+    backend: str,
+    config: Dict[str, Any],
+    model: Optional[str],
+    messages: List[Dict[str, str]],
+) -> Tuple[List[Dict[str, str]], Optional[str]]:
+    """
+    If the messages start with a registered system prompt that the backend holds
+    in a context cache, return them without it plus the cache name; otherwise
+    (messages, None). Reports the prefix tokens sent inline / cached either way.
+    """
+    cache = get_prompt_cache(config)
+    if cache is None:
+        return messages, None
+    prefix, rest = cache.split(messages)
+    if prefix is None:
+        return messages, None
+
+    name = None
+    if backend == "gemini":
+        name = cache.lookup(model or config.get("gemini_default_model", "gemini-1.5-flash"), prefix)
+    elif backend == "gemini-live":
+        name = cache.lookup(
+            model or config.get("gemini_live_model", "gemini-2.5-flash-native-audio-preview-09-2025"),
+            prefix,
+        )
+    tokens = estimate_tokens(prefix)
+    sent, cached = (0, tokens) if name else (tokens, 0)
+    cache.record(backend, sent, cached)
+    add_prefix_usage(sent, cached)
+    return (rest, name) if name else (messages, None)
+
+
+def connect_live(
+    config: Dict[str, Any],
+    system_prompt: Optional[str] = None,
+    model: Optional[str] = None,
+    response_modalities: Optional[List[str]] = None,
+    **kwargs: Any,
+):
+    """
+    Async context manager for a bidirectional Gemini Live session
+    (used by live_session.LiveSessionManager, one per /ws session).
+    """
+    live_model = model or config.get(
+        "gemini_live_model",
+        "gemini-2.5-flash-native-audio-preview-09-2025",
+    )
+
+    live_config: Dict[str, Any] = {
+        "response_modalities": response_modalities or config.get("live_response_modalities", ["TEXT"]),
+        **kwargs,
+    }
+    if "AUDIO" in live_config["response_modalities"]:
+        # Native-audio models answer in audio; ask for a transcript so we still get text
+        live_config.setdefault("output_audio_transcription", {})
+    if system_prompt:
+        live_config["system_instruction"] = system_prompt
+
+    return _live_connection(config, live_model, live_config)
+
+
+@asynccontextmanager
+async def _live_connection(config: Dict[str, Any], live_model: str, live_config: Dict[str, Any]):
+    # the client stays leased for as long as the connection is open
+    with _lease_genai_client(config) as client:
+        async with client.aio.live.connect(model=live_model, config=live_config) as session:
+            yield session
+
+# ---------- CUSTOM BACKENDS ----------
+
+# Extra backends (e.g. a deterministic fake for load tests) can be plugged in by
+# name. They take precedence over the built-in ones and are called as
+#
+#   await chat(config=..., messages=..., model=..., audio_data=..., audio_mime_type=..., **kwargs) -> str
+#   async for text in stream(...same arguments...)                                               -> str chunks
+
+ChatFn = Callable[..., Awaitable[str]]
+StreamFn = Callable[..., AsyncIterator[str]]
+
+_custom_backends: Dict[str, Tuple[ChatFn, Optional[StreamFn]]] = {}
+
+
+def register_backend(name: str, chat: ChatFn, stream: Optional[StreamFn] = None) -> None:
+    """
+    Route backend=name to `chat` / `stream` (without `stream`, the full
+    answer is streamed as one chunk).
+    """
+    _custom_backends[name.lower()] = (chat, stream)
+
+
+def unregister_backend(name: str) -> None:
+    _custom_backends.pop(name.lower(), None)
 
-    return "".join(out_chunks).strip()
+
+# ---------- CALL HOOKS ----------
+
+# Called with a summary of every upstream call once it is over (e.g. by
+# recorder.TrafficRecorder). With no hooks, calls are not timed at all.
+#
+#   {"backend", "model", "prompt_chars", "audio_bytes",
+#    "first_ms", "total_ms", "chunks", "out_chars", "error"}
+
+CallHook = Callable[[Dict[str, Any]], None]
+call_hooks: List[CallHook] = []
+
+
+class CallTimer:
+    """
+    Timings and sizes of one upstream call, handed to the call hooks by done().
+    """
+
+    __slots__ = ("record", "start")
+
+    def __init__(
+        self,
+        backend: str,
+        model: Optional[str],
+        messages: List[Dict[str, str]],
+        audio_data: Optional[bytes] = None,
+    ):
+        self.start = time.perf_counter()
+        self.record: Dict[str, Any] = {
+            "backend": backend,
+            "model": model,
+            "prompt_chars": sum(len(m.get("content", "")) for m in messages),
+            "audio_bytes": len(audio_data) if audio_data else 0,
+            "first_ms": None,
+            "chunks": 0,
+            "out_chars": 0,
+        }
+
+    def chunk(self, text: str) -> None:
+        if self.record["first_ms"] is None:
+            self.record["first_ms"] = round((time.perf_counter() - self.start) * 1000, 1)
+        self.record["chunks"] += 1
+        self.record["out_chars"] += len(text)
+
+    def done(self, error: Optional[BaseException] = None) -> None:
+        self.record["total_ms"] = round((time.perf_counter() - self.start) * 1000, 1)
+        self.record["error"] = type(error).__name__ if error is not None else None
+        for hook in call_hooks:
+            try:
+                hook(self.record)
+            except Exception as e:
+                print(f"Error in call hook: {e}")
+
+
+async def _chat_timed(
+    backend: str,
+    config: Dict[str, Any],
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/wav",
+    **kwargs: Any,
+) -> str:
+    timer = CallTimer(backend, model, messages, audio_data)
+    try:
+        text = await _chat_upstream(backend, config, messages, model, audio_data, audio_mime_type, **kwargs)
+    except BaseException as e:
+        timer.done(e)
+        raise
+    timer.chunk(text)
+    timer.done()
+    return text
+
+
+async def _stream_timed(
+    backend: str,
+    config: Dict[str, Any],
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/wav",
+    **kwargs: Any,
+) -> AsyncIterator[str]:
+    timer = CallTimer(backend, model, messages, audio_data)
+    try:
+        async for text in _stream_upstream(backend, config, messages, model, audio_data, audio_mime_type, **kwargs):
+            timer.chunk(text)
+            yield text
+    except BaseException as e:
+        timer.done(e)
+        raise
+    timer.done()
 
 
 # ---------- MAIN ENTRYPOINT: TEXT IN → TEXT OUT ----------
@@ -206,6 +651,7 @@ async def chat_messages(
     messages: List[Dict[str, str]],
     model: Optional[str] = None,
     audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/wav",
     **kwargs: Any,
 ) -> str:
     """
@@ -213,26 +659,127 @@ async def chat_messages(
     - chooses backend ("gemini", "ollama", "gemini-live")
     - takes chat messages
     - returns a single final text response (no streaming)
+    - text-only requests go through the response cache when it is enabled
     """
     backend = backend.lower()
 
+    cache = get_response_cache(config)
+    if cache is not None and not audio_data:
+        key = cache.key(backend, model, messages, kwargs)
+        return await cache.get_or_call(
+            key,
+            lambda: _chat_routed(backend, config, messages, model, **kwargs),
+        )
+
+    return await _chat_routed(
+        backend,
+        config,
+        messages,
+        model,
+        audio_data=audio_data,
+        audio_mime_type=audio_mime_type,
+        **kwargs,
+    )
+
+
+async def _chat_routed(
+    backend: str,
+    config: Dict[str, Any],
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/wav",
+    **kwargs: Any,
+) -> str:
+    """
+    _chat_upstream on the requested backend, or through the router when it is enabled
+    (other backends get their default model, since `model` names a model of the requested one).
+    """
+    upstream = _chat_timed if call_hooks else _chat_upstream
+    router = get_router(config)
+    if router is None:
+        return await upstream(backend, config, messages, model, audio_data, audio_mime_type, **kwargs)
+
+    return await router.chat(
+        backend,
+        lambda chosen: upstream(
+            chosen,
+            config,
+            messages,
+            model if chosen == backend else None,
+            audio_data,
+            audio_mime_type,
+            **kwargs,
+        ),
+        audio=bool(audio_data),
+    )
+
+
+def _prompt_bytes(messages: List[Dict[str, str]], audio_data: Optional[bytes]) -> int:
+    if not metrics.enabled:
+        return 0
+    return sum(len(m.get("content", "")) for m in messages) + (len(audio_data) if audio_data else 0)
+
+
+async def _chat_upstream(
+    backend: str,
+    config: Dict[str, Any],
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/wav",
+    **kwargs: Any,
+) -> str:
+    custom = _custom_backends.get(backend)
+    if custom is not None:
+        chat, _ = custom
+        async with _upstream_slot(backend, config, messages):
+            with metrics.backend_call(backend, _prompt_bytes(messages, audio_data)) as call:
+                text = await chat(
+                    config=config,
+                    messages=messages,
+                    model=model,
+                    audio_data=audio_data,
+                    audio_mime_type=audio_mime_type,
+                    **kwargs,
+                )
+                call.add_bytes_out(len(text))
+        return text
+
     if backend in ("gemini", "ollama"):
         # LangChain path
         # Note: LangChain path currently ignores audio_data
-        llm = create_llm(backend=backend, config=config, model=model, **kwargs)
-        lc_messages = _convert_messages(messages)
-        response = await llm.ainvoke(lc_messages)
-        return response.content if isinstance(response.content, str) else str(response.content)
+        messages, cached_content = _cached_prefix(backend, config, model, messages)
+        if cached_content:
+            kwargs = {**kwargs, "cached_content": cached_content}
+        llm = get_llm(backend=backend, config=config, model=model, **kwargs)
+        with metrics.span("convert_messages", backend):
+            lc_messages = _convert_messages(messages)
+        async with _upstream_slot(backend, config, messages):
+            with metrics.backend_call(backend, _prompt_bytes(messages, None)) as call:
+                response = await llm.ainvoke(lc_messages)
+                _report_usage(response)
+                text = response.content if isinstance(response.content, str) else str(response.content)
+                call.add_bytes_out(len(text))
+        return text
 
     if backend == "gemini-live":
         # google-genai path (live-capable model, but we use it in text mode)
-        return await _chat_gemini_live(
-            config=config,
-            messages=messages,
-            model=model,
-            audio_data=audio_data,
-            **kwargs,
-        )
+        messages, cached_content = _cached_prefix(backend, config, model, messages)
+        if cached_content:
+            kwargs = {**kwargs, "cached_content": cached_content}
+        async with _upstream_slot(backend, config, messages):
+            with metrics.backend_call(backend, _prompt_bytes(messages, audio_data)) as call:
+                text = await _chat_gemini_live(
+                    config=config,
+                    messages=messages,
+                    model=model,
+                    audio_data=audio_data,
+                    audio_mime_type=audio_mime_type,
+                    **kwargs,
+                )
+                call.add_bytes_out(len(text))
+        return text
 
     raise ValueError(f"Unsupported backend: {backend} (use 'gemini', 'ollama', or 'gemini-live')")
 
@@ -244,6 +791,7 @@ async def chat_simple(
     system_prompt: Optional[str] = None,
     model: Optional[str] = None,
     audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/wav",
     **kwargs: Any,
 ) -> str:
     """
@@ -260,10 +808,195 @@ async def chat_simple(
         messages=msgs,
         model=model,
         audio_data=audio_data,
+        audio_mime_type=audio_mime_type,
         **kwargs,
     )
 
 
+
+# ---------- STREAMING ENTRYPOINT: TEXT IN → TEXT CHUNKS OUT ----------
+
+async def stream_messages(
+    backend: str,
+    config: Dict[str, Any],
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/wav",
+    **kwargs: Any,
+) -> AsyncIterator[str]:
+    """
+    Same as chat_messages, but yields text chunks as they arrive
+    instead of waiting for the full completion.
+    A cached answer is yielded as one chunk; a completed stream is cached
+    (streams are not coalesced).
+    """
+    backend = backend.lower()
+
+    cache = get_response_cache(config)
+    if cache is None or audio_data:
+        async for text in _stream_routed(
+            backend,
+            config,
+            messages,
+            model,
+            audio_data=audio_data,
+            audio_mime_type=audio_mime_type,
+            **kwargs,
+        ):
+            yield text
+        return
+
+    key = cache.key(backend, model, messages, kwargs)
+    cached = cache.get(key)
+    if cached is not None:
+        cache.hits += 1
+        yield cached
+        return
+
+    cache.misses += 1
+    chunks: List[str] = []
+    async for text in _stream_routed(backend, config, messages, model, **kwargs):
+        chunks.append(text)
+        yield text
+    cache.put(key, "".join(chunks))
+
+
+async def _stream_routed(
+    backend: str,
+    config: Dict[str, Any],
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/wav",
+    **kwargs: Any,
+) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of _chat_routed.
+    """
+    upstream = _stream_timed if call_hooks else _stream_upstream
+    router = get_router(config)
+    if router is None:
+        stream = upstream(backend, config, messages, model, audio_data, audio_mime_type, **kwargs)
+    else:
+        stream = router.stream(
+            backend,
+            lambda chosen: upstream(
+                chosen,
+                config,
+                messages,
+                model if chosen == backend else None,
+                audio_data,
+                audio_mime_type,
+                **kwargs,
+            ),
+            audio=bool(audio_data),
+        )
+    async for text in stream:
+        yield text
+
+
+async def _stream_upstream(
+    backend: str,
+    config: Dict[str, Any],
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/wav",
+    **kwargs: Any,
+) -> AsyncIterator[str]:
+    custom = _custom_backends.get(backend)
+    if custom is not None:
+        chat, stream = custom
+        call_kwargs = dict(
+            config=config,
+            messages=messages,
+            model=model,
+            audio_data=audio_data,
+            audio_mime_type=audio_mime_type,
+            **kwargs,
+        )
+        async with _upstream_slot(backend, config, messages):
+            with metrics.backend_call(backend, _prompt_bytes(messages, audio_data)) as call:
+                if stream is None:
+                    text = await chat(**call_kwargs)
+                    call.add_bytes_out(len(text))
+                    yield text
+                else:
+                    async for text in stream(**call_kwargs):
+                        call.add_bytes_out(len(text))
+                        yield text
+        return
+
+    if backend in ("gemini", "ollama"):
+        # LangChain astream streams regardless of the model's `streaming` flag
+        messages, cached_content = _cached_prefix(backend, config, model, messages)
+        if cached_content:
+            kwargs = {**kwargs, "cached_content": cached_content}
+        llm = get_llm(backend=backend, config=config, model=model, **kwargs)
+        with metrics.span("convert_messages", backend):
+            lc_messages = _convert_messages(messages)
+        async with _upstream_slot(backend, config, messages):
+            with metrics.backend_call(backend, _prompt_bytes(messages, None)) as call:
+                async for chunk in llm.astream(lc_messages):
+                    # chunks carry their share of the usage
+                    _report_usage(chunk)
+                    content = chunk.content if isinstance(chunk.content, str) else str(chunk.content)
+                    if content:
+                        call.add_bytes_out(len(content))
+                        yield content
+        return
+
+    if backend == "gemini-live":
+        messages, cached_content = _cached_prefix(backend, config, model, messages)
+        if cached_content:
+            kwargs = {**kwargs, "cached_content": cached_content}
+        async with _upstream_slot(backend, config, messages):
+            with metrics.backend_call(backend, _prompt_bytes(messages, audio_data)) as call:
+                async for text in _stream_gemini_live(
+                    config=config,
+                    messages=messages,
+                    model=model,
+                    audio_data=audio_data,
+                    audio_mime_type=audio_mime_type,
+                    **kwargs,
+                ):
+                    call.add_bytes_out(len(text))
+                    yield text
+        return
+
+    raise ValueError(f"Unsupported backend: {backend} (use 'gemini', 'ollama', or 'gemini-live')")
+
+
+async def stream_simple(
+    backend: str,
+    config: Dict[str, Any],
+    user_text: str,
+    system_prompt: Optional[str] = None,
+    model: Optional[str] = None,
+    audio_data: Optional[bytes] = None,
+    audio_mime_type: str = "audio/wav",
+    **kwargs: Any,
+) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of chat_simple.
+    """
+    msgs: List[Dict[str, str]] = []
+    if system_prompt:
+        msgs.append({"role": "system", "content": system_prompt})
+    msgs.append({"role": "user", "content": user_text})
+
+    async for text in stream_messages(
+        backend=backend,
+        config=config,
+        messages=msgs,
+        model=model,
+        audio_data=audio_data,
+        audio_mime_type=audio_mime_type,
+        **kwargs,
+    ):
+        yield text
+
 # ---------- EXAMPLE USAGE ----------
 
 # import asyncio
@@ -0,0 +1,314 @@
+import asyncio
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+
+# ---------- HOT-PATH METRICS ----------
+
+# Timing spans around each stage of a turn, so a slow turn can be attributed:
+#
+#   decode            JSON decode of a client frame (websocket_endpoint)
+#   queue_wait        job waiting in the session queue before the worker picks it up
+#   create_llm        get_llm (registry lookup / client construction)
+#   convert_messages  dict messages -> LangChain / google-genai objects
+#   upstream          the backend call itself (to the full answer, or the end of the stream)
+#   to_thread_wait    time a generate_content call waits for a worker thread
+#   admission_wait    time an ollama call waits in the admission queue (admission.py)
+#   first_audio       a live turn's start to its first chunk of model audio (audio out)
+#   send              ConnectionManager.send_json
+#   turn              a whole turn, from the worker picking it up to the last frame
+#
+# plus per-backend counters (in flight, requests, errors, bytes in / out), all
+# exposed in Prometheus text format on GET /metrics.
+#
+# With "metrics_enabled" off, span() / backend_call() return a shared no-op
+# context manager and the counters aren't touched: one attribute check per call.
+# /metrics is then empty, the collectors (admission queue, prompt cache) included.
+#
+# "metrics_slow_turn_ms" turns on a sampling profiler: a background thread
+# records the event loop thread's stack every few ms, and a turn slower than
+# the threshold is reported with the hottest stacks seen while it ran (printed,
+# and passed to any registered slow_turn_hooks).
+#
+# config keys used (all optional):
+#
+#   "metrics_enabled": False,
+#   "metrics_slow_turn_ms": None,
+#   "metrics_profile_interval_ms": 5,
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+IDLE_STACK = ("<idle: waiting on I/O>",)
+
+SlowTurnHook = Callable[[Dict[str, Any]], None]
+# returns extra Prometheus text lines, evaluated on each /metrics scrape
+Collector = Callable[[], List[str]]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class BackendStats:
+    __slots__ = ("in_flight", "requests", "errors", "bytes_in", "bytes_out")
+
+    def __init__(self):
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+    def add_bytes_out(self, n: int) -> None:
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("hist", "start")
+
+    def __init__(self, hist: Histogram):
+        self.hist = hist
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.hist.observe(time.perf_counter() - self.start)
+
+
+class _BackendCall:
+    __slots__ = ("hist", "stats", "start")
+
+    def __init__(self, hist: Histogram, stats: BackendStats):
+        self.hist = hist
+        self.stats = stats
+
+    def __enter__(self) -> "_BackendCall":
+        self.stats.in_flight += 1
+        self.stats.requests += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, *exc: Any) -> None:
+        self.hist.observe(time.perf_counter() - self.start)
+        self.stats.in_flight -= 1
+        # a stream closed early or a cancelled turn isn't a backend error
+        if exc_type is not None and not issubclass(exc_type, (GeneratorExit, asyncio.CancelledError)):
+            self.stats.errors += 1
+
+    def add_bytes_out(self, n: int) -> None:
+        self.stats.bytes_out += n
+
+
+class StackSampler:
+    """
+    Samples one thread's stack every `interval` seconds into a ring buffer,
+    so slow turns can be explained after the fact.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005, max_samples: int = 20000):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Deque[Tuple[float, Tuple[str, ...]]] = deque(maxlen=max_samples)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            code = frame.f_code if frame is not None else None
+            if code is not None and code.co_name == "select" and code.co_filename.endswith("selectors.py"):
+                # the event loop is idle, waiting on sockets / timers
+                self.samples.append((time.perf_counter(), IDLE_STACK))
+                continue
+            stack = []
+            while frame is not None and len(stack) < 32:
+                code = frame.f_code
+                stack.append(f"{code.co_filename}:{frame.f_lineno} {code.co_name}")
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), tuple(stack)))
+
+    def hottest(self, start: float, end: float, top: int = 5) -> List[Tuple[int, Tuple[str, ...]]]:
+        counts = Counter(stack for t, stack in list(self.samples) if start <= t <= end)
+        return [(count, stack) for stack, count in counts.most_common(top)]
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.slow_turn_s: Optional[float] = None
+        self.slow_turn_hooks: List[SlowTurnHook] = []
+        self._stages: Dict[Tuple[str, str], Histogram] = {}
+        self._backends: Dict[str, BackendStats] = {}
+        self._sampler: Optional[StackSampler] = None
+        self._profile_interval = 0.005
+        self._collectors: List[Collector] = []
+
+    def configure(self, config: Dict[str, Any]) -> None:
+        self.enabled = bool(config.get("metrics_enabled", False))
+        slow_ms = config.get("metrics_slow_turn_ms")
+        self.slow_turn_s = slow_ms / 1000 if self.enabled and slow_ms else None
+        self._profile_interval = config.get("metrics_profile_interval_ms", 5) / 1000
+
+    def start_profiler(self) -> None:
+        """
+        Start sampling the calling thread (call from the event loop) if slow-turn profiling is on.
+        """
+        if self.slow_turn_s and self._sampler is None:
+            self._sampler = StackSampler(threading.get_ident(), self._profile_interval)
+            self._sampler.start()
+
+    def stop_profiler(self) -> None:
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._sampler = None
+
+    def add_collector(self, collector: Collector) -> None:
+        """
+        Add gauges computed at scrape time (no cost on the hot path).
+        """
+        self._collectors.append(collector)
+
+    def _hist(self, stage: str, backend: str) -> Histogram:
+        key = (stage, backend)
+        hist = self._stages.get(key)
+        if hist is None:
+            hist = self._stages[key] = Histogram()
+        return hist
+
+    def _backend(self, backend: str) -> BackendStats:
+        stats = self._backends.get(backend)
+        if stats is None:
+            stats = self._backends[backend] = BackendStats()
+        return stats
+
+    def span(self, stage: str, backend: str = ""):
+        """
+        Context manager timing one stage.
+        """
+        if not self.enabled:
+            return NOOP
+        return _Span(self._hist(stage, backend))
+
+    def observe(self, stage: str, seconds: float, backend: str = "") -> None:
+        if self.enabled:
+            self._hist(stage, backend).observe(seconds)
+
+    def backend_call(self, backend: str, bytes_in: int = 0):
+        """
+        Context manager around an upstream call: in-flight gauge, request / error
+        counters and the `upstream` span. Report the answer size with add_bytes_out().
+        """
+        if not self.enabled:
+            return NOOP
+        stats = self._backend(backend)
+        stats.bytes_in += bytes_in
+        return _BackendCall(self._hist("upstream", backend), stats)
+
+    def turn_finished(self, start: float, labels: Dict[str, Any]) -> None:
+        """
+        Record a whole turn (start is a perf_counter() timestamp) and report it if it was slow.
+        """
+        if not self.enabled:
+            return
+        end = time.perf_counter()
+        duration = end - start
+        self._hist("turn", labels.get("backend", "")).observe(duration)
+        if self.slow_turn_s is None or duration < self.slow_turn_s:
+            return
+
+        report = dict(labels, duration_ms=round(duration * 1000, 1))
+        if self._sampler is not None:
+            report["stacks"] = self._sampler.hottest(start, end)
+        print(f"Slow turn ({report['duration_ms']} ms): {labels}")
+        for count, stack in report.get("stacks", [])[:3]:
+            print(f"  {count} samples: " + " <- ".join(stack[:6]))
+        for hook in self.slow_turn_hooks:
+            try:
+                hook(report)
+            except Exception as e:
+                print(f"Error in slow turn hook: {e}")
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format; empty with metrics_enabled off
+        (the collectors included, so nothing is computed per scrape).
+        """
+        if not self.enabled:
+            return ""
+        lines = [
+            "# HELP companion_stage_seconds Time spent per stage of a turn.",
+            "# TYPE companion_stage_seconds histogram",
+        ]
+        for (stage, backend), hist in sorted(self._stages.items()):
+            labels = f'stage="{stage}",backend="{backend}"'
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                lines.append(f'companion_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'companion_stage_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+            lines.append(f"companion_stage_seconds_sum{{{labels}}} {hist.sum:.6f}")
+            lines.append(f"companion_stage_seconds_count{{{labels}}} {hist.count}")
+
+        counters = (
+            ("in_flight", "gauge", "Upstream calls currently in flight."),
+            ("requests", "counter", "Upstream calls started."),
+            ("errors", "counter", "Upstream calls that failed."),
+            ("bytes_in", "counter", "Prompt bytes (text + audio) sent upstream."),
+            ("bytes_out", "counter", "Answer bytes received from upstream."),
+        )
+        for field, kind, help_text in counters:
+            name = f"companion_backend_{field}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for backend, stats in sorted(self._backends.items()):
+                lines.append(f'{name}{{backend="{backend}"}} {getattr(stats, field)}')
+
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                print(f"Error in metrics collector: {e}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide instance (configured by app.py from config)
+metrics = Metrics()
@@ -0,0 +1,258 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from history import estimate_tokens
+
+
+# ---------- UPSTREAM PROMPT-PREFIX CACHING ----------
+
+# Every turn starts with one of a few fixed system prompts (app.py registers
+# them at startup). Instead of resending a multi-kilobyte persona each turn:
+#
+#   - gemini / gemini-live: the prompt is stored once per model as a Gemini
+#     context cache (caches.create, system_instruction only), and turns pass
+#     cached_content=<name> without a system instruction. The cache is created
+#     in the background on first use (that turn still sends the prompt inline),
+#     its TTL is extended while it is in use, and it is deleted once idle.
+#     Gemini won't cache short prompts: below prompt_cache_min_tokens the
+#     prompt is always sent inline.
+#   - ollama: nothing to register; the model is kept loaded (ollama_keep_alive)
+#     and the prompt stays byte-identical at the front, so Ollama reuses the
+#     prefix it already evaluated.
+#
+# Anything after a registered prefix in the system message (e.g. the rolling
+# history summary) moves to the front of the first user message.
+#
+# Each turn reports the prefix tokens it sent inline and the ones served from
+# a cache (ratelimit.Usage, then the `prompt` stats of the reply and /metrics).
+#
+# config keys used (all optional):
+#
+#   "prompt_cache_enabled": True,
+#   "prompt_cache_ttl": 3600,               # seconds per create / refresh
+#   "prompt_cache_refresh_margin": 600,     # refresh when less than this is left
+#   "prompt_cache_idle": 1800,              # delete caches unused this long
+#   "prompt_cache_min_tokens": 1024,
+#   "prompt_cache_retry": 300,              # seconds before retrying a failed create
+#   "prompt_cache_interval": 60,            # maintenance period
+#   "ollama_keep_alive": "30m",
+
+# (model, prompt, ttl seconds) -> cache name
+CreateFn = Callable[[str, str, int], Awaitable[str]]
+# (name, ttl seconds)
+RefreshFn = Callable[[str, int], Awaitable[None]]
+DeleteFn = Callable[[str], Awaitable[None]]
+
+
+class CachedPrefix:
+    __slots__ = ("model", "text", "tokens", "name", "expires_at", "last_used", "failed_at", "creating")
+
+    def __init__(self, model: str, text: str):
+        self.model = model
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        self.name: Optional[str] = None
+        self.expires_at = 0.0
+        self.last_used = time.monotonic()
+        self.failed_at: Optional[float] = None
+        self.creating = False
+
+
+class PromptCache:
+    def __init__(
+        self,
+        create: CreateFn,
+        refresh: RefreshFn,
+        delete: DeleteFn,
+        ttl: int = 3600,
+        refresh_margin: float = 600,
+        idle: float = 1800,
+        min_tokens: int = 1024,
+        retry: float = 300,
+        interval: float = 60,
+    ):
+        self._create_fn = create
+        self._refresh_fn = refresh
+        self._delete_fn = delete
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.idle = idle
+        self.min_tokens = min_tokens
+        self.retry = retry
+        self.interval = interval
+        # registered prefixes, longest first
+        self._prefixes: List[str] = []
+        self._entries: Dict[Tuple[str, str], CachedPrefix] = {}
+        self._task: Optional["asyncio.Task[None]"] = None
+        # backend -> [prefix tokens sent inline, prefix tokens served from a cache]
+        self._tokens: Dict[str, List[int]] = {}
+        self.created = 0
+        self.refreshed = 0
+        self.deleted = 0
+        self.failed = 0
+
+    @classmethod
+    def from_config(
+        cls,
+        config: Dict[str, Any],
+        create: CreateFn,
+        refresh: RefreshFn,
+        delete: DeleteFn,
+    ) -> "PromptCache":
+        return cls(
+            create,
+            refresh,
+            delete,
+            ttl=config.get("prompt_cache_ttl", 3600),
+            refresh_margin=config.get("prompt_cache_refresh_margin", 600),
+            idle=config.get("prompt_cache_idle", 1800),
+            min_tokens=config.get("prompt_cache_min_tokens", 1024),
+            retry=config.get("prompt_cache_retry", 300),
+            interval=config.get("prompt_cache_interval", 60),
+        )
+
+    # ----- prefixes -----
+
+    def register(self, text: str) -> None:
+        if text and text not in self._prefixes:
+            self._prefixes.append(text)
+            self._prefixes.sort(key=len, reverse=True)
+
+    def split(self, messages: List[Dict[str, str]]) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """
+        If the messages start with a registered prefix, return it and the messages
+        without it (the rest of the system message goes in front of the first user
+        message). Otherwise (None, messages).
+        """
+        if not messages or messages[0].get("role") != "system":
+            return None, messages
+        system = messages[0].get("content", "")
+        for prefix in self._prefixes:
+            if system.startswith(prefix):
+                break
+        else:
+            return None, messages
+
+        rest = messages[1:]
+        remainder = system[len(prefix):].strip()
+        if remainder:
+            if rest and rest[0].get("role") == "user":
+                rest = [{"role": "user", "content": f"{remainder}\n\n{rest[0].get('content', '')}"}, *rest[1:]]
+            else:
+                rest = [{"role": "user", "content": remainder}, *rest]
+        return prefix, rest
+
+    # ----- upstream caches -----
+
+    def lookup(self, model: str, prefix: str) -> Optional[str]:
+        """
+        Name of the upstream cache holding prefix for model, or None if it has to be
+        sent inline this time (creation is then started in the background).
+        """
+        entry = self._entries.get((model, prefix))
+        if entry is None:
+            entry = self._entries[(model, prefix)] = CachedPrefix(model, prefix)
+        now = time.monotonic()
+        entry.last_used = now
+        # not one that could expire before the request reaches it
+        if entry.name is not None and entry.expires_at > now + 5:
+            return entry.name
+        if entry.tokens >= self.min_tokens and not entry.creating and (
+            entry.failed_at is None or now - entry.failed_at > self.retry
+        ):
+            entry.creating = True
+            asyncio.ensure_future(self._create(entry))
+        return None
+
+    async def _create(self, entry: CachedPrefix) -> None:
+        try:
+            entry.name = await self._create_fn(entry.model, entry.text, self.ttl)
+            entry.expires_at = time.monotonic() + self.ttl
+            entry.failed_at = None
+            self.created += 1
+        except Exception as e:
+            entry.failed_at = time.monotonic()
+            self.failed += 1
+            print(f"Error caching the system prompt for {entry.model}: {e}")
+        finally:
+            entry.creating = False
+
+    async def _maintain_once(self) -> None:
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if entry.creating:
+                continue
+            if now - entry.last_used > self.idle:
+                del self._entries[key]
+                if entry.name is not None and entry.expires_at > now:
+                    await self._delete(entry)
+            elif entry.name is not None and entry.expires_at - now < self.refresh_margin:
+                try:
+                    await self._refresh_fn(entry.name, self.ttl)
+                    entry.expires_at = time.monotonic() + self.ttl
+                    self.refreshed += 1
+                except Exception as e:
+                    # expired or deleted upstream: the next turn recreates it
+                    print(f"Error refreshing the cached system prompt for {entry.model}: {e}")
+                    entry.name = None
+
+    async def _delete(self, entry: CachedPrefix) -> None:
+        try:
+            await self._delete_fn(entry.name)
+            self.deleted += 1
+        except Exception as e:
+            print(f"Error deleting the cached system prompt for {entry.model}: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self._maintain_once()
+            except Exception as e:
+                print(f"Error maintaining prompt caches: {e}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop refreshing and delete the caches (they would otherwise be billed until they expire).
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        now = time.monotonic()
+        entries, self._entries = list(self._entries.values()), {}
+        await asyncio.gather(*(self._delete(e) for e in entries if e.name is not None and e.expires_at > now))
+
+    # ----- accounting -----
+
+    def record(self, backend: str, sent: int, cached: int) -> None:
+        tokens = self._tokens.get(backend)
+        if tokens is None:
+            tokens = self._tokens[backend] = [0, 0]
+        tokens[0] += sent
+        tokens[1] += cached
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "prefixes": len(self._prefixes),
+            "caches": sum(1 for e in self._entries.values() if e.name is not None and e.expires_at > now),
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "deleted": self.deleted,
+            "failed": self.failed,
+            "prefix_tokens": {
+                backend: {"sent": sent, "cached": cached} for backend, (sent, cached) in self._tokens.items()
+            },
+        }
+
+    def prometheus_lines(self) -> List[str]:
+        lines = ["# TYPE companion_prefix_tokens_total counter"]
+        for backend, (sent, cached) in self._tokens.items():
+            lines.append(f'companion_prefix_tokens_total{{backend="{backend}",mode="sent"}} {sent}')
+            lines.append(f'companion_prefix_tokens_total{{backend="{backend}",mode="cached"}} {cached}')
+        return lines
@@ -0,0 +1,247 @@
+import json
+import struct
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+from urllib.parse import parse_qs
+
+
+# ---------- WIRE PROTOCOLS ----------
+
+# /ws speaks two dialects, picked per connection at connect time:
+#
+#   - "app.v1"        the native one: user_message in; response / response_delta /
+#                     response_end / status out (see cli_client.py)
+#   - "companion.v1"  SERVER_SPEC.md: message {data: {content}} in; reply
+#                     {data: {message}}, thinking_start, state out
+#
+# and two encodings:
+#
+#   - "json"     text frames; binary frames are raw audio chunks
+#   - "msgpack"  every frame is a binary MessagePack map (needs msgpack or
+#                ormsgpack); audio chunks travel as {"type": "audio_chunk", "audio": <bin>}
+#
+# The client asks with a WebSocket subprotocol ("companion.v1", "app.v1+msgpack")
+# or, for clients that can't set one, query parameters (/ws?protocol=companion.v1&encoding=msgpack).
+#
+# Model audio goes out as numbered chunks (see "audio out" below): raw binary
+# frames with an AUDIO_HEADER on JSON connections, audio_chunk maps on msgpack ones.
+#
+# A Codec turns frames into native message dicts and back. Inbound messages are
+# checked against VALIDATORS, a table of per-type checks compiled once at import,
+# and the caller dispatches on the type through a handler table.
+#
+# config keys used (all optional):
+#
+#   "protocol_default": "app.v1",
+
+try:
+    import orjson
+
+    def encode_json(data: Any) -> str:
+        return orjson.dumps(data).decode("utf-8")
+
+    decode_json = orjson.loads
+except ImportError:
+    def encode_json(data: Any) -> str:
+        # same output as starlette's WebSocket.send_json
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+    decode_json = json.loads
+
+try:
+    import msgpack
+except ImportError:
+    try:
+        # same packb / unpackb API
+        import ormsgpack as msgpack
+    except ImportError:
+        msgpack = None
+
+PROTOCOLS = ("app.v1", "companion.v1")
+ENCODINGS = ("json", "msgpack") if msgpack is not None else ("json",)
+
+# what a session wants back: text frames, model audio, or both
+OUTPUT_MODES = ("text", "audio", "both")
+
+# audio out on JSON connections: stream id (uint16, from audio_start), flags
+# (uint16, reserved), sequence number (uint32, from 0), then the PCM bytes
+AUDIO_HEADER = struct.Struct("<HHI")
+
+Message = Dict[str, Any]
+Frame = Union[str, bytes]
+Validator = Callable[[Message], Optional[str]]
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+# ----- validators -----
+
+def compile_validator(required: Dict[str, Any], optional: Optional[Dict[str, Any]] = None) -> Validator:
+    """
+    Build a check for one message type: {field: type or tuple of types}.
+    The validator returns None for a valid message, otherwise what is wrong with it.
+    """
+    checks = tuple(
+        (name, types, name in required, getattr(types, "__name__", None) or "/".join(t.__name__ for t in types))
+        for name, types in {**(optional or {}), **required}.items()
+    )
+
+    def validate(message: Message) -> Optional[str]:
+        for name, types, is_required, type_name in checks:
+            value = message.get(name)
+            if value is None:
+                if is_required:
+                    return f"missing field: {name}"
+            elif not isinstance(value, types):
+                return f"{name} must be {type_name}"
+        return None
+
+    return validate
+
+
+_AUDIO_FORMAT_FIELDS = {"encoding": str, "sample_rate": int, "channels": int}
+
+# native (app.v1) inbound message types
+VALIDATORS: Dict[str, Validator] = {
+    "ping": compile_validator({}),
+    "cancel": compile_validator({}, {"message_id": str}),
+    "audio_format": compile_validator({}, _AUDIO_FORMAT_FIELDS),
+    "audio_start": compile_validator({}, _AUDIO_FORMAT_FIELDS),
+    "audio_chunk": compile_validator({"audio": bytes}),
+    "audio_end": compile_validator({}),
+    "user_message": compile_validator({"text": str}, {"backend": str, "stream": bool, "on_busy": str}),
+    "context": compile_validator({"data": dict}),
+    "output_mode": compile_validator({"mode": str}),
+    "ack": compile_validator({"seq": int}),
+}
+
+
+# ----- companion.v1 <-> native -----
+
+def _companion_message(message: Message) -> Message:
+    data = message.get("data")
+    content = data.get("content") if isinstance(data, dict) else None
+    native = {"type": "user_message", "text": content}
+    for key in ("backend", "stream", "on_busy"):
+        if key in message:
+            native[key] = message[key]
+    return native
+
+
+_STATES = {"processing_audio": "processing", "no_speech": "idle"}
+
+
+def _companion_status(message: Message) -> Message:
+    status = message.get("status")
+    if status == "thinking":
+        return {
+            "type": "thinking_start",
+            "data": {"context": ""},
+            "message_id": message.get("message_id"),
+        }
+    state = dict(message)
+    state["type"] = "state"
+    state["state"] = _STATES.get(status, status)
+    return state
+
+
+def _companion_response(message: Message) -> Message:
+    return {
+        "type": "reply",
+        "data": {"message": message.get("text", "")},
+        "message_id": message.get("message_id"),
+    }
+
+
+_INBOUND: Dict[str, Dict[str, Callable[[Message], Message]]] = {
+    "app.v1": {},
+    "companion.v1": {"message": _companion_message},
+}
+
+_OUTBOUND: Dict[str, Dict[str, Callable[[Message], Message]]] = {
+    "app.v1": {},
+    "companion.v1": {"status": _companion_status, "response": _companion_response},
+}
+
+
+class Codec:
+    __slots__ = ("protocol", "encoding", "binary", "_inbound", "_outbound", "_dumps", "_loads")
+
+    def __init__(self, protocol: str = "app.v1", encoding: str = "json"):
+        if protocol not in PROTOCOLS:
+            raise ProtocolError(f"Unsupported protocol: {protocol} (use one of {PROTOCOLS})")
+        if encoding not in ENCODINGS:
+            raise ProtocolError(f"Unsupported encoding: {encoding} (use one of {ENCODINGS})")
+        self.protocol = protocol
+        self.encoding = encoding
+        self.binary = encoding == "msgpack"
+        self._inbound = _INBOUND[protocol]
+        self._outbound = _OUTBOUND[protocol]
+        if self.binary:
+            self._dumps = msgpack.packb
+            self._loads = msgpack.unpackb
+        else:
+            self._dumps = encode_json
+            self._loads = decode_json
+
+    @property
+    def name(self) -> str:
+        return self.protocol if self.encoding == "json" else f"{self.protocol}+{self.encoding}"
+
+    def encode(self, message: Message) -> Frame:
+        translate = self._outbound.get(message.get("type"))
+        if translate is not None:
+            message = translate(message)
+        return self._dumps(message)
+
+    def encode_audio(self, stream_id: int, seq: int, chunk: bytes) -> bytes:
+        if self.binary:
+            return self._dumps({"type": "audio_chunk", "stream_id": stream_id, "seq": seq, "audio": chunk})
+        return AUDIO_HEADER.pack(stream_id, 0, seq) + chunk
+
+    def decode(self, frame: Frame) -> Tuple[Message, Optional[Validator]]:
+        """
+        Parse a frame into a native message, plus the validator for its type
+        (None for types the server doesn't know). Raises ProtocolError for garbage.
+        """
+        try:
+            # a text frame is JSON even on a msgpack connection
+            message = decode_json(frame) if isinstance(frame, str) else self._loads(frame)
+        except Exception as e:
+            raise ProtocolError(f"Undecodable frame: {e}")
+        if not isinstance(message, dict):
+            raise ProtocolError("A frame must hold an object")
+        translate = self._inbound.get(message.get("type"))
+        if translate is not None:
+            message = translate(message)
+        return message, VALIDATORS.get(message.get("type"))
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"protocol": self.protocol, "encoding": self.encoding}
+
+
+def _parse(value: str) -> Tuple[str, str]:
+    protocol, _, encoding = value.partition("+")
+    return protocol, encoding or "json"
+
+
+def negotiate(scope: Dict[str, Any], default: str = "app.v1") -> Tuple[Codec, Optional[str]]:
+    """
+    Pick the codec for a connection from its ASGI scope.
+    Returns it and the subprotocol to accept with (None if the client offered none).
+    """
+    for offered in scope.get("subprotocols") or ():
+        protocol, encoding = _parse(offered)
+        if protocol in PROTOCOLS and encoding in ENCODINGS:
+            return Codec(protocol, encoding), offered
+
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    protocol = query.get("protocol", [default])[0]
+    encoding = query.get("encoding", ["json"])[0]
+    if protocol not in PROTOCOLS:
+        protocol = default
+    if encoding not in ENCODINGS:
+        # e.g. msgpack asked for but not installed: stay readable, the client sees it in session_started
+        encoding = "json"
+    return Codec(protocol, encoding), None
@@ -0,0 +1,298 @@
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+
+# ---------- RATE LIMITS AND USAGE ACCOUNTING ----------
+
+# Token buckets in front of everything that costs an upstream call, at three
+# scopes: per session, per client IP and global. Each scope can limit
+#
+#   - requests   turns (user_message, an audio utterance)
+#   - bytes      what the client sends to be forwarded upstream (text, audio)
+#   - tokens     upstream tokens, as reported by the backends after each call
+#
+# requests and bytes are charged up front. Token counts are only known after the
+# call, so they are charged afterwards and may push a bucket into debt; a scope in
+# token debt gets no new requests until it has refilled.
+#
+# A request bigger than a bucket's burst is let through when the bucket is full
+# (and leaves it in debt), so nothing is unsatisfiable.
+#
+# A check is a fixed number of bucket refills, no scans. IP buckets that have
+# refilled completely carry no information and are dropped (least recently used
+# first, a couple per check).
+#
+# config keys used (all optional):
+#
+#   "rate_limit_enabled": True,
+#   "rate_limits": {                   # scope -> kind -> (per minute, burst)
+#       "session": {"requests": (20, 5), "bytes": (4_000_000, 2_000_000), "tokens": (40_000, 20_000)},
+#       "ip": {"requests": (60, 15)},
+#       "global": {"requests": (1200, 200)},
+#   },
+
+SCOPES = ("session", "ip", "global")
+KINDS = ("requests", "bytes", "tokens")
+
+# (kind, cost) pairs for one check
+Costs = Sequence[Tuple[str, float]]
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: Optional[float] = None):
+        # rate in tokens per second
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait(self, now: float, cost: float = 1.0) -> float:
+        """
+        Seconds until `cost` can be taken (0 if it can now).
+        """
+        self._refill(now)
+        need = min(cost, self.burst)
+        if self.tokens >= need:
+            return 0.0
+        return (need - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, cost: float = 1.0) -> None:
+        self.tokens -= cost
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class Usage:
+    __slots__ = ("input_tokens", "output_tokens", "cached_tokens", "prefix_sent", "prefix_cached")
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        # input tokens the upstream served from a cache (part of input_tokens, billed at a discount)
+        self.cached_tokens = 0
+        # estimated system-prompt prefix tokens sent inline / referenced by cache (see prompt_cache.py)
+        self.prefix_sent = 0
+        self.prefix_cached = 0
+
+    @property
+    def total(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+# The Usage of the turn being run (set by app.run_turn); backends report into it
+current_usage: ContextVar[Optional[Usage]] = ContextVar("current_usage", default=None)
+
+
+def add_usage(input_tokens: Optional[int], output_tokens: Optional[int], cached_tokens: Optional[int] = None) -> None:
+    """
+    Called by the backends with the token counts an upstream call reported.
+    """
+    usage = current_usage.get()
+    if usage is not None:
+        usage.input_tokens += input_tokens or 0
+        usage.output_tokens += output_tokens or 0
+        usage.cached_tokens += cached_tokens or 0
+
+
+def add_prefix_usage(sent: int, cached: int) -> None:
+    """
+    Called by the backends with the system-prompt prefix tokens of an upstream call.
+    """
+    usage = current_usage.get()
+    if usage is not None:
+        usage.prefix_sent += sent
+        usage.prefix_cached += cached
+
+
+class RateLimited:
+    __slots__ = ("scope", "kind", "retry_after")
+
+    def __init__(self, scope: str, kind: str, retry_after: float):
+        self.scope = scope
+        self.kind = kind
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict[str, Any]:
+        what = "upstream tokens" if self.kind == "tokens" else self.kind
+        whose = {"session": "this session", "ip": "this address", "global": "the server"}[self.scope]
+        return {
+            "type": "rate_limited",
+            "scope": self.scope,
+            "limit": self.kind,
+            "retry_after_ms": round(self.retry_after * 1000),
+            "message": f"Too many {what} for {whose}, retry in {self.retry_after:.1f} s",
+        }
+
+
+class SessionQuota:
+    __slots__ = ("ip", "buckets", "requests", "bytes", "input_tokens", "output_tokens", "cached_tokens", "limited")
+
+    def __init__(self, ip: str, buckets: Dict[str, TokenBucket]):
+        self.ip = ip
+        self.buckets = buckets
+        self.requests = 0
+        self.bytes = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.limited = 0
+
+    def usage(self) -> Dict[str, Any]:
+        return {
+            "ip": self.ip,
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+            "rate_limited": self.limited,
+        }
+
+
+class RateLimiter:
+    def __init__(self, limits: Optional[Dict[str, Dict[str, Tuple[float, float]]]] = None, max_ips: int = 100_000):
+        limits = limits or {}
+        for scope, kinds in limits.items():
+            if scope not in SCOPES:
+                raise ValueError(f"Unsupported rate limit scope: {scope} (use one of {SCOPES})")
+            for kind in kinds:
+                if kind not in KINDS:
+                    raise ValueError(f"Unsupported rate limit: {kind} (use one of {KINDS})")
+        # scope -> kind -> (tokens per second, burst)
+        self._limits = {
+            scope: {kind: (per_min / 60.0, burst) for kind, (per_min, burst) in limits.get(scope, {}).items()}
+            for scope in SCOPES
+        }
+        self.max_ips = max_ips
+        self._sessions: Dict[str, SessionQuota] = {}
+        # least recently used first
+        self._ips: "OrderedDict[str, Dict[str, TokenBucket]]" = OrderedDict()
+        self._global = self._buckets("global")
+        self.limited: Dict[str, int] = {}
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "RateLimiter":
+        return cls(config.get("rate_limits"))
+
+    def _buckets(self, scope: str, now: Optional[float] = None) -> Dict[str, TokenBucket]:
+        return {kind: TokenBucket(rate, burst, now) for kind, (rate, burst) in self._limits[scope].items()}
+
+    def _ip_buckets(self, ip: str, now: float) -> Dict[str, TokenBucket]:
+        buckets = self._ips.get(ip)
+        if buckets is None:
+            buckets = self._ips[ip] = self._buckets("ip", now)
+        else:
+            self._ips.move_to_end(ip)
+        # forget a couple of idle, refilled addresses (a new entry starts full anyway)
+        for _ in range(2):
+            oldest, old = next(iter(self._ips.items()))
+            if oldest == ip or not (len(self._ips) > self.max_ips or all(b.full(now) for b in old.values())):
+                break
+            del self._ips[oldest]
+        return buckets
+
+    def open(self, session_id: str, ip: str) -> None:
+        self._sessions[session_id] = SessionQuota(ip, self._buckets("session"))
+
+    def close(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+    def _quota(self, session_id: str) -> SessionQuota:
+        quota = self._sessions.get(session_id)
+        if quota is None:
+            quota = self._sessions[session_id] = SessionQuota("", self._buckets("session"))
+        return quota
+
+    def check(self, session_id: str, costs: Costs) -> Optional[RateLimited]:
+        """
+        Charge costs against every scope, or nothing if any scope is out of budget;
+        then the longest wait is returned.
+        """
+        now = time.monotonic()
+        quota = self._quota(session_id)
+        scopes = (
+            ("session", quota.buckets),
+            ("ip", self._ip_buckets(quota.ip, now) if self._limits["ip"] else {}),
+            ("global", self._global),
+        )
+
+        worst: Optional[RateLimited] = None
+        for scope, buckets in scopes:
+            for kind, cost in costs:
+                bucket = buckets.get(kind)
+                if bucket is None:
+                    continue
+                wait = bucket.wait(now, cost)
+                if wait > 0 and (worst is None or wait > worst.retry_after):
+                    worst = RateLimited(scope, kind, wait)
+
+        if worst is not None:
+            quota.limited += 1
+            key = f"{worst.scope}:{worst.kind}"
+            self.limited[key] = self.limited.get(key, 0) + 1
+            return worst
+
+        for _, buckets in scopes:
+            for kind, cost in costs:
+                bucket = buckets.get(kind)
+                if bucket is not None and cost:
+                    bucket.take(cost)
+        for kind, cost in costs:
+            if kind == "requests":
+                quota.requests += int(cost)
+            elif kind == "bytes":
+                quota.bytes += int(cost)
+        return None
+
+    def record_usage(self, session_id: str, usage: Usage) -> None:
+        """
+        Account the tokens a turn used, and charge them to the token buckets.
+        """
+        if not usage.total:
+            return
+        quota = self._sessions.get(session_id)
+        self.input_tokens += usage.input_tokens
+        self.output_tokens += usage.output_tokens
+        self.cached_tokens += usage.cached_tokens
+        buckets = [self._global.get("tokens")]
+        if quota is not None:
+            quota.input_tokens += usage.input_tokens
+            quota.output_tokens += usage.output_tokens
+            quota.cached_tokens += usage.cached_tokens
+            buckets.append(quota.buckets.get("tokens"))
+            ip_buckets = self._ips.get(quota.ip)
+            if ip_buckets is not None:
+                buckets.append(ip_buckets.get("tokens"))
+        for bucket in buckets:
+            if bucket is not None:
+                bucket.take(usage.total)
+
+    def usage(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        if session_id is not None:
+            quota = self._sessions.get(session_id)
+            return quota.usage() if quota is not None else {}
+        return {session_id: quota.usage() for session_id, quota in self._sessions.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "ips": len(self._ips),
+            "rate_limited": dict(self.limited),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+        }
@@ -0,0 +1,258 @@
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from admission import current_session
+
+
+# ---------- TRAFFIC RECORDING ----------
+
+# Opt-in capture of what /ws sessions do, so a traffic pattern seen in
+# production can be replayed offline (benchmarks/replay_traffic.py). One event
+# per line, a JSON array:
+#
+#   [t_ms, kind, session_id, data]
+#
+#   t_ms   milliseconds since the recorder started (monotonic, across files)
+#   kind   "capture"  first line of every file: {"version", "started" (unix time)}
+#          "open"     a session connected: {"protocol", "resumed"}
+#          "in"       an inbound message as the server decoded it (native
+#                     protocol); audio chunks as {"type": "audio_chunk", "bytes": n}
+#          "out"      an outbound frame: {"type", "message_id"?, "bytes"}
+#                     (model audio chunks have type "audio")
+#          "call"     an upstream call with its timings (see llm_utils.call_hooks)
+#          "close"    the socket went away: {"normal"}
+#
+# Unless record_content is set, the free text in inbound messages (user text,
+# context fields) is replaced by "x"s of the same length, so prompt sizes are
+# kept but not what people said.
+#
+# Recording never blocks the caller: record() puts the event on a bounded queue
+# and a writer thread serializes and writes it. When the queue is full (the disk
+# can't keep up) events are dropped and counted. The log is append-only; when a
+# file reaches record_max_bytes it is gzipped and a new one started, and only
+# the newest record_max_files files are kept.
+#
+# config keys used (all optional):
+#
+#   "record_enabled": False,
+#   "record_dir": "captures",
+#   "record_max_bytes": 50_000_000,
+#   "record_max_files": 20,
+#   "record_queue_size": 10_000,
+#   "record_content": False,
+
+CAPTURE_VERSION = 1
+
+# inbound fields that are kept as is (the rest is free text, redacted)
+KEEP_FIELDS = frozenset((
+    "type", "backend", "stream", "on_busy", "mode", "message_id", "seq",
+    "encoding", "sample_rate", "channels", "bytes",
+))
+
+# (t_ms, kind, session_id, data)
+Event = Tuple[float, str, str, Any]
+
+
+def _redact(value: Any) -> Any:
+    if isinstance(value, str):
+        return "x" * len(value)
+    if isinstance(value, dict):
+        return {k: _redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact(v) for v in value]
+    return value
+
+
+def redact(message: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v if k in KEEP_FIELDS else _redact(v) for k, v in message.items()}
+
+
+class TrafficRecorder:
+    def __init__(
+        self,
+        directory: str = "captures",
+        max_bytes: int = 50_000_000,
+        max_files: int = 20,
+        queue_size: int = 10_000,
+        content: bool = False,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.content = content
+        self._queue: "queue.Queue[Optional[Event]]" = queue.Queue(maxsize=queue_size)
+        self._t0 = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._path: Optional[str] = None
+        self._file_bytes = 0
+        self._next_file = 0
+        self.events = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self.files = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "TrafficRecorder":
+        return cls(
+            directory=config.get("record_dir", "captures"),
+            max_bytes=config.get("record_max_bytes", 50_000_000),
+            max_files=config.get("record_max_files", 20),
+            queue_size=config.get("record_queue_size", 10_000),
+            content=config.get("record_content", False),
+        )
+
+    # ----- producers (event loop) -----
+
+    def record(self, kind: str, session_id: str, data: Any) -> None:
+        try:
+            self._queue.put_nowait((round((time.monotonic() - self._t0) * 1000, 1), kind, session_id, data))
+        except queue.Full:
+            self.dropped += 1
+
+    def opened(self, session_id: str, protocol: str, resumed: bool) -> None:
+        self.record("open", session_id, {"protocol": protocol, "resumed": resumed})
+
+    def closed(self, session_id: str, normal: bool) -> None:
+        self.record("close", session_id, {"normal": normal})
+
+    def inbound(self, session_id: str, message: Dict[str, Any]) -> None:
+        if message.get("type") == "audio_chunk":
+            # msgpack connections send audio as audio_chunk messages; keep the size only
+            audio = message.get("audio")
+            self.record("in", session_id, {"type": "audio_chunk", "bytes": len(audio) if audio else 0})
+        else:
+            # copied: handlers may add to it before the writer gets to it
+            self.record("in", session_id, dict(message))
+
+    def inbound_audio(self, session_id: str, nbytes: int) -> None:
+        self.record("in", session_id, {"type": "audio_chunk", "bytes": nbytes})
+
+    def outbound(self, session_id: str, message: Optional[Dict[str, Any]], nbytes: int) -> None:
+        """
+        A ConnectionManager send hook.
+        """
+        if message is None:
+            self.record("out", session_id, ("audio", None, nbytes))
+        else:
+            self.record("out", session_id, (message.get("type"), message.get("message_id"), nbytes))
+
+    def call(self, record: Dict[str, Any]) -> None:
+        """
+        An llm_utils call hook; the call is filed under the session of the turn making it.
+        """
+        self.record("call", current_session.get() or "", record)
+
+    # ----- writer thread -----
+
+    def _encode(self, event: Event) -> str:
+        t, kind, session_id, data = event
+        if kind == "in" and not self.content:
+            data = redact(data)
+        elif kind == "out":
+            frame_type, message_id, nbytes = data
+            data = {"type": frame_type, "bytes": nbytes}
+            if message_id is not None:
+                data["message_id"] = message_id
+        return json.dumps([t, kind, session_id, data], separators=(",", ":"), ensure_ascii=False) + "\n"
+
+    def _open_file(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self._path = os.path.join(self.directory, f"capture-{stamp}-{self._next_file:04d}.jsonl")
+        self._next_file += 1
+        self._file = open(self._path, "a", encoding="utf-8")
+        self._file_bytes = 0
+        self.files += 1
+        header = (round((time.monotonic() - self._t0) * 1000, 1), "capture", "", {
+            "version": CAPTURE_VERSION,
+            "started": time.time() - (time.monotonic() - self._t0),
+        })
+        self._write(self._encode(header))
+
+    def _write(self, line: str) -> None:
+        self._file.write(line)
+        # close enough to the byte count for rotation (ASCII in practice)
+        self._file_bytes += len(line)
+        self.bytes_written += len(line)
+
+    def _rotate(self) -> None:
+        self._file.close()
+        path = self._path
+        try:
+            with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+        except OSError as e:
+            # keep the file uncompressed
+            print(f"Error compressing capture {path}: {e}")
+        self._prune()
+        self._open_file()
+
+    def _prune(self) -> None:
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith("capture-"))
+        # the file about to be opened counts too
+        for name in names[:max(0, len(names) + 1 - self.max_files)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError as e:
+                print(f"Error removing old capture {name}: {e}")
+
+    def _run(self) -> None:
+        while True:
+            event = self._queue.get()
+            batch: List[Optional[Event]] = [event]
+            # write whatever else is waiting in one go
+            while event is not None:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(event)
+            for event in batch:
+                if event is None:
+                    self._file.close()
+                    return
+                try:
+                    self._write(self._encode(event))
+                    self.events += 1
+                except Exception as e:
+                    print(f"Error writing traffic capture: {e}")
+            try:
+                self._file.flush()
+                if self._file_bytes >= self.max_bytes:
+                    self._rotate()
+            except Exception as e:
+                print(f"Error writing traffic capture: {e}")
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._open_file()
+            self._thread = threading.Thread(target=self._run, name="traffic-recorder", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Write out what is queued and close the current file (blocks; run it in a thread).
+        """
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "file": self._path,
+            "files": self.files,
+            "events": self.events,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+            "bytes_written": self.bytes_written,
+        }
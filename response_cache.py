@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import json
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+# ---------- RESPONSE CACHE ----------
+
+# Opt-in exact-match cache in front of chat_messages, for the questions users
+# ask over and over ("how do I freeze the top row"):
+#
+#   - key: backend + model + normalized messages + generation kwargs (hashed)
+#   - entries expire after ttl seconds; the cache is LRU-bounded by bytes
+#   - concurrent identical requests share one upstream call (coalescing)
+#   - audio requests bypass the cache (the caller doesn't ask)
+#   - errors are never cached
+#
+# Normalization only collapses whitespace; anything else (case, punctuation)
+# is part of the key.
+#
+# config keys used (all optional):
+#
+#   "response_cache_enabled": False,
+#   "response_cache_ttl": 600,
+#   "response_cache_max_bytes": 8 * 1024 * 1024,
+#   "response_cache_max_entry_bytes": 64 * 1024,
+
+ENTRY_OVERHEAD = 128  # approximate size of the key, entry object and dict slot
+
+
+def normalize_messages(messages: List[Dict[str, str]]) -> List[List[str]]:
+    return [
+        [str(m.get("role", "user")).lower(), " ".join(str(m.get("content", "")).split())]
+        for m in messages
+    ]
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires")
+
+    def __init__(self, value: str, size: int, expires: float):
+        self.value = value
+        self.size = size
+        self.expires = expires
+
+
+class _InFlight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[str]"):
+        self.task = task
+        self.waiters = 0
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        ttl: float = 600.0,
+        max_bytes: int = 8 * 1024 * 1024,
+        max_entry_bytes: int = 64 * 1024,
+    ):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        # least recently used first
+        self._entries: "OrderedDict[bytes, _Entry]" = OrderedDict()
+        self._in_flight: Dict[bytes, _InFlight] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evicted = 0
+        self.expired = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ResponseCache":
+        return cls(
+            ttl=config.get("response_cache_ttl", 600.0),
+            max_bytes=config.get("response_cache_max_bytes", 8 * 1024 * 1024),
+            max_entry_bytes=config.get("response_cache_max_entry_bytes", 64 * 1024),
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(
+        backend: str,
+        model: Optional[str],
+        messages: List[Dict[str, str]],
+        kwargs: Optional[Dict[str, Any]] = None,
+    ) -> bytes:
+        """
+        Fixed-size cache key, so long prompts don't get stored twice.
+        """
+        raw = json.dumps(
+            [backend.lower(), model, normalize_messages(messages), kwargs or {}],
+            sort_keys=True,
+            separators=(",", ":"),
+            default=repr,
+        )
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            self._remove(key)
+            self.expired += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def put(self, key: bytes, value: str) -> None:
+        size = sys.getsizeof(value) + ENTRY_OVERHEAD
+        if size > self.max_entry_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _Entry(value, size, time.monotonic() + self.ttl)
+        self.total_bytes += size
+
+        while self.total_bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evicted += 1
+
+    def _remove(self, key: bytes) -> None:
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+
+    async def get_or_call(self, key: bytes, call: Callable[[], Awaitable[str]]) -> str:
+        """
+        Cached value for `key`, or the result of call() (which is then cached).
+        Callers asking for the same key while a call is running wait for that call
+        instead of starting another one. The upstream call is only cancelled once
+        every caller waiting on it has been cancelled.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        flight = self._in_flight.get(key)
+        if flight is None:
+            self.misses += 1
+            flight = self._in_flight[key] = _InFlight(asyncio.ensure_future(self._fill(key, call)))
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    async def _fill(self, key: bytes, call: Callable[[], Awaitable[str]]) -> str:
+        try:
+            value = await call()
+            self.put(key, value)
+            return value
+        finally:
+            self._in_flight.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
@@ -0,0 +1,200 @@
+import asyncio
+import hmac
+import secrets
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from protocol import Frame
+
+
+# ---------- SESSION RESUMPTION ----------
+
+# A client that loses its socket (Wi-Fi blip, laptop lid) can reconnect to the
+# same session within a grace window instead of starting over:
+#
+#   - session_started carries a resume_token
+#   - every frame the server sends on a session is numbered from 1 (the client
+#     counts them; session_resumed is the only frame that isn't counted) and kept
+#     in a bounded per-session ReplayBuffer until the client acks it with
+#     {"type": "ack", "seq": N}
+#   - when the socket drops (anything but a normal 1000 close) the session is
+#     parked: its worker keeps running the current turn, and what it sends piles
+#     up in the replay buffer
+#   - the client reconnects with /ws?session_id=...&resume_token=...&last_seq=N,
+#     gets {"type": "session_resumed", "last_seq", "replayed", "missed"} and then
+#     every buffered frame after N (missed counts the ones the buffer had to drop)
+#   - a parked session that isn't resumed within resume_grace seconds is torn
+#     down as if it had disconnected; past resume_max_parked the oldest parked
+#     session is torn down early
+#
+# Parked sessions hold at most replay_max_bytes each, so resume_max_parked x
+# replay_max_bytes bounds their buffers. A session resumes only on the worker
+# that holds it, with the protocol and encoding it started with; otherwise the
+# client gets a fresh session (session_started with a resume_error).
+#
+# config keys used (all optional):
+#
+#   "resume_enabled": True,
+#   "resume_grace": 30.0,           # seconds a dropped session waits for its client
+#   "resume_max_parked": 1000,
+#   "replay_max_frames": 512,       # per session
+#   "replay_max_bytes": 1_000_000,  # per session (characters for text frames)
+
+
+class ReplayBuffer:
+    __slots__ = ("frames", "max_frames", "max_bytes", "size", "seq")
+
+    def __init__(self, max_frames: int = 512, max_bytes: int = 1_000_000):
+        self.frames: Deque[Tuple[int, Frame]] = deque()
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.size = 0
+        # number of the last frame sent
+        self.seq = 0
+
+    def push(self, frame: Frame) -> int:
+        self.seq += 1
+        self.frames.append((self.seq, frame))
+        self.size += len(frame)
+        while self.frames and (len(self.frames) > self.max_frames or self.size > self.max_bytes):
+            _, old = self.frames.popleft()
+            self.size -= len(old)
+        return self.seq
+
+    def ack(self, seq: int) -> None:
+        """
+        Forget the frames the client has (up to and including seq).
+        """
+        frames = self.frames
+        while frames and frames[0][0] <= seq:
+            _, old = frames.popleft()
+            self.size -= len(old)
+
+    def since(self, last_seq: int) -> Tuple[List[Frame], int, int]:
+        """
+        The frames after last_seq that are still buffered, the number of the frame
+        before the first of them, and how many in between were dropped.
+        """
+        self.ack(last_seq)
+        if not self.frames:
+            return [], self.seq, max(0, self.seq - last_seq)
+        first = self.frames[0][0]
+        return [frame for _, frame in self.frames], first - 1, max(0, first - 1 - last_seq)
+
+
+def resume_request(scope: Dict[str, Any]) -> Optional[Tuple[str, str, int]]:
+    """
+    (session_id, resume_token, last_seq) from the /ws query string, if the client asks to resume.
+    """
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    session_id = query.get("session_id", [""])[0]
+    token = query.get("resume_token", [""])[0]
+    if not session_id or not token:
+        return None
+    try:
+        last_seq = int(query.get("last_seq", ["0"])[0])
+    except ValueError:
+        last_seq = 0
+    return session_id, token, last_seq
+
+
+class _Parked:
+    __slots__ = ("state", "timer", "parked_at")
+
+    def __init__(self, state: Any, timer: asyncio.TimerHandle):
+        self.state = state
+        self.timer = timer
+        self.parked_at = time.monotonic()
+
+
+class ResumeStore:
+    """
+    Resume tokens of the sessions on this worker, and the sessions parked in
+    their grace window. `expire(session_id, state)` tears a parked session down.
+    """
+
+    def __init__(
+        self,
+        expire: Callable[[str, Any], None],
+        grace: float = 30.0,
+        max_parked: int = 1000,
+    ):
+        self._expire_fn = expire
+        self.grace = grace
+        self.max_parked = max_parked
+        self._tokens: Dict[str, str] = {}
+        # oldest first
+        self._parked: "OrderedDict[str, _Parked]" = OrderedDict()
+        self.resumed = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], expire: Callable[[str, Any], None]) -> "ResumeStore":
+        return cls(
+            expire,
+            grace=config.get("resume_grace", 30.0),
+            max_parked=config.get("resume_max_parked", 1000),
+        )
+
+    def issue(self, session_id: str) -> str:
+        token = self._tokens[session_id] = secrets.token_urlsafe(24)
+        return token
+
+    def forget(self, session_id: str) -> None:
+        """
+        The session is gone for good (disconnect hook).
+        """
+        self._tokens.pop(session_id, None)
+        parked = self._parked.pop(session_id, None)
+        if parked is not None:
+            parked.timer.cancel()
+
+    def park(self, session_id: str, state: Any) -> None:
+        timer = asyncio.get_running_loop().call_later(self.grace, self._expire, session_id, False)
+        self._parked[session_id] = _Parked(state, timer)
+        while len(self._parked) > self.max_parked:
+            self._expire(next(iter(self._parked)), True)
+
+    def can_resume(self, session_id: str, token: str) -> bool:
+        expected = self._tokens.get(session_id)
+        return (
+            expected is not None
+            and session_id in self._parked
+            and hmac.compare_digest(expected.encode(), token.encode())
+        )
+
+    def claim(self, session_id: str) -> Any:
+        """
+        Take a parked session back (after can_resume); returns the state it was parked with.
+        """
+        parked = self._parked.pop(session_id)
+        parked.timer.cancel()
+        self.resumed += 1
+        return parked.state
+
+    def _expire(self, session_id: str, evicted: bool) -> None:
+        parked = self._parked.pop(session_id, None)
+        if parked is None:
+            return
+        parked.timer.cancel()
+        self._tokens.pop(session_id, None)
+        if evicted:
+            self.evicted += 1
+        else:
+            self.expired += 1
+        try:
+            self._expire_fn(session_id, parked.state)
+        except Exception as e:
+            print(f"Error ending parked session {session_id}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "resumable": len(self._tokens),
+            "parked": len(self._parked),
+            "resumed": self.resumed,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from metrics import metrics
+
+
+# ---------- PER-SESSION WORK QUEUE ----------
+
+# Each /ws connection gets a receive loop (app.py) and a worker task (Session.run).
+# The receive loop never awaits the LLM: it turns user messages into jobs and puts
+# them on a bounded queue, so pings and `cancel` are handled while a turn is running.
+# The worker only exists while there are jobs: submit() starts it and it exits
+# once the queue is drained, so an idle session holds no task (most companions
+# sit idle most of the time).
+#
+# What happens when a message arrives while a turn is in flight ("busy_policy"):
+#   - "queue"   -> wait behind the current turn (rejected if the queue is full)
+#   - "replace" -> cancel the current turn and anything queued, run the new one
+#   - "reject"  -> refuse it with an error frame
+
+BUSY_POLICIES = ("queue", "replace", "reject")
+
+SendFn = Callable[[Dict[str, Any]], Awaitable[None]]
+JobFn = Callable[[], Awaitable[None]]
+
+
+class Job:
+    __slots__ = ("message_id", "run", "cancelled", "queued_at")
+
+    def __init__(self, message_id: str, run: JobFn):
+        self.message_id = message_id
+        self.run = run
+        self.cancelled = False
+        self.queued_at = time.perf_counter()
+
+
+class Session:
+    __slots__ = (
+        "session_id", "send", "busy_policy", "max_queue", "queue", "current", "_current_task", "_worker",
+        "_pending", "audio", "audio_format", "audio_decoder", "audio_pipe", "output_mode",
+    )
+
+    def __init__(
+        self,
+        session_id: str,
+        send: SendFn,
+        max_queue: int = 8,
+        busy_policy: str = "queue",
+    ):
+        if busy_policy not in BUSY_POLICIES:
+            raise ValueError(f"Unsupported busy_policy: {busy_policy} (use one of {BUSY_POLICIES})")
+
+        self.session_id = session_id
+        self.send = send
+        self.busy_policy = busy_policy
+        self.max_queue = max_queue
+        self.queue: Deque[Job] = deque()
+        self.current: Optional[Job] = None
+        self._current_task: Optional[asyncio.Task] = None
+        self._worker: Optional["asyncio.Task[None]"] = None
+        self._pending: Dict[str, Job] = {}
+        # audio.AudioBuffer, created on the session's first audio_start
+        self.audio = None
+        # audio.AudioFormat the client declared (see audio_format messages)
+        self.audio_format = None
+        # audio_codec decoder of the current utterance, when it is sent compressed
+        self.audio_decoder = None
+        # live_session.LiveAudioPipe while an utterance is piped into Gemini Live
+        self.audio_pipe = None
+        # protocol.OUTPUT_MODES: how live replies come back (text frames, audio chunks, both)
+        self.output_mode = "text"
+
+    @property
+    def busy(self) -> bool:
+        return self.current is not None or bool(self._pending)
+
+    async def submit(self, job: Job, policy: Optional[str] = None) -> bool:
+        """
+        Hand a job to the worker according to the busy policy.
+        Returns False (after telling the client) if the job was refused.
+        """
+        policy = policy if policy in BUSY_POLICIES else self.busy_policy
+
+        if self.busy:
+            if policy == "reject":
+                await self._refuse(job, "busy", "A message is already being processed")
+                return False
+            if policy == "replace":
+                await self.cancel_all()
+
+        if len(self.queue) >= self.max_queue:
+            await self._refuse(job, "queue_full", "Too many messages queued")
+            return False
+
+        self.queue.append(job)
+        self._pending[job.message_id] = job
+        if self._worker is None:
+            self._worker = asyncio.create_task(self.run())
+        return True
+
+    async def cancel(self, message_id: Optional[str] = None) -> bool:
+        """
+        Cancel one job (queued or in flight), or the in-flight one if no id is given.
+        """
+        if message_id is None or (self.current and self.current.message_id == message_id):
+            return self._cancel_current()
+
+        job = self._pending.pop(message_id, None)
+        if job is None:
+            return False
+
+        job.cancelled = True
+        # out of the queue too, so it no longer counts against max_queue
+        self.queue.remove(job)
+        await self._notify_cancelled(job)
+        return True
+
+    async def cancel_all(self) -> None:
+        for job in list(self._pending.values()):
+            job.cancelled = True
+            await self._notify_cancelled(job)
+        self._pending.clear()
+        self.queue.clear()
+        self._cancel_current()
+
+    async def run(self) -> None:
+        """
+        Worker: run queued jobs one at a time until the queue is empty.
+        """
+        while self.queue:
+            job = self.queue.popleft()
+            if job.cancelled:
+                continue
+
+            self._pending.pop(job.message_id, None)
+            metrics.observe("queue_wait", time.perf_counter() - job.queued_at)
+            self.current = job
+            self._current_task = asyncio.create_task(job.run())
+            try:
+                await self._current_task
+            except asyncio.CancelledError:
+                if not job.cancelled:
+                    # the worker itself is being shut down
+                    self._current_task.cancel()
+                    raise
+                await self._notify_cancelled(job)
+            except Exception as e:
+                print(f"Error in session {self.session_id}: {e}")
+            finally:
+                self.current = None
+                self._current_task = None
+        # nothing awaited since the queue was found empty: the next submit() starts a new worker
+        self._worker = None
+
+    def close(self) -> None:
+        for job in self._pending.values():
+            job.cancelled = True
+        self._pending.clear()
+        self.queue.clear()
+        self._cancel_current()
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def _cancel_current(self) -> bool:
+        if self._current_task is None or self._current_task.done():
+            return False
+        self.current.cancelled = True
+        self._current_task.cancel()
+        return True
+
+    async def _notify_cancelled(self, job: Job) -> None:
+        await self.send({
+            "type": "cancelled",
+            "session_id": self.session_id,
+            "message_id": job.message_id,
+        })
+
+    async def _refuse(self, job: Job, code: str, message: str) -> None:
+        await self.send({
+            "type": "error",
+            "code": code,
+            "message": message,
+            "session_id": self.session_id,
+            "message_id": job.message_id,
+        })
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+
+# ---------- SESSION ROUTING ACROSS WORKERS ----------
+
+# A /ws socket lives in exactly one uvicorn worker process, but events for a
+# session (e.g. a proactive `suggestion`) can originate in any worker. The
+# ConnectionManager sends to local sockets directly and hands everything else
+# to a SessionRouter, which forwards it to the worker that owns the socket.
+#
+#   - InMemorySessionRouter: single process (the default), nothing to forward
+#   - SqliteSessionRouter:   several workers on one machine sharing a SQLite
+#                            file (WAL mode): a sessions table records which
+#                            worker owns each session, and each worker polls
+#                            its own rows of an outbox table
+#
+# config keys used (all optional):
+#
+#   "session_router": "memory",          # "memory" | "sqlite"
+#   "session_router_path": "sessions.db",
+#   "session_router_poll_interval": 0.01,
+#   "workers": 1,                        # uvicorn worker processes
+
+Deliver = Callable[[str, Dict[str, Any]], Awaitable[bool]]
+
+
+class InMemorySessionRouter:
+    """
+    Single-process router: every session is local, so there is nothing to forward.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._deliver: Optional[Deliver] = None
+        self.local: Set[str] = set()
+        self.published = 0
+        self.delivered = 0
+
+    async def start(self, deliver: Deliver) -> None:
+        """
+        Begin accepting forwarded events; deliver(session_id, data) sends to a local socket.
+        """
+        self._deliver = deliver
+
+    async def stop(self) -> None:
+        self._deliver = None
+
+    async def register(self, session_id: str) -> None:
+        self.local.add(session_id)
+
+    async def unregister(self, session_id: str) -> None:
+        self.local.discard(session_id)
+
+    async def owner(self, session_id: str) -> Optional[str]:
+        return self.worker_id if session_id in self.local else None
+
+    async def publish(self, session_id: str, data: Dict[str, Any]) -> bool:
+        """
+        Forward an event to the worker that owns session_id.
+        Returns False if no worker owns it.
+        """
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "router": type(self).__name__,
+            "worker_id": self.worker_id,
+            "local_sessions": len(self.local),
+            "published": self.published,
+            "delivered": self.delivered,
+        }
+
+
+class SqliteSessionRouter(InMemorySessionRouter):
+    """
+    Multi-worker router for one machine, backed by a shared SQLite file.
+    Workers that stop heartbeating (crashed) lose ownership of their sessions.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS workers (
+            worker_id TEXT PRIMARY KEY,
+            heartbeat REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            worker_id TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            worker_id TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            payload TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS outbox_by_worker ON outbox (worker_id, id);
+    """
+
+    def __init__(
+        self,
+        path: str,
+        worker_id: Optional[str] = None,
+        poll_interval: float = 0.01,
+        heartbeat_interval: float = 1.0,
+        batch_size: int = 256,
+    ):
+        super().__init__(worker_id)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = heartbeat_interval * 5
+        self.batch_size = batch_size
+        # one connection, used from worker threads one call at a time
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._poller: Optional["asyncio.Task[None]"] = None
+
+    def _execute(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        # autocommit: each statement is its own transaction, so writers from
+        # other workers never wait on a read-then-write upgrade
+        with self._lock:
+            return fn(self._db)
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        return await asyncio.to_thread(self._execute, fn)
+
+    async def start(self, deliver: Deliver) -> None:
+        await super().start(deliver)
+        self._db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+
+        def reset(db: sqlite3.Connection) -> None:
+            # a previous process with the same id (pid reuse) may have left rows behind
+            db.execute("DELETE FROM sessions WHERE worker_id = ?", (self.worker_id,))
+            db.execute("DELETE FROM outbox WHERE worker_id = ?", (self.worker_id,))
+            db.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, heartbeat) VALUES (?, ?)",
+                (self.worker_id, time.time()),
+            )
+
+        await self._run(reset)
+        self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self._poller:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+
+        def cleanup(db: sqlite3.Connection) -> None:
+            db.execute("DELETE FROM sessions WHERE worker_id = ?", (self.worker_id,))
+            db.execute("DELETE FROM outbox WHERE worker_id = ?", (self.worker_id,))
+            db.execute("DELETE FROM workers WHERE worker_id = ?", (self.worker_id,))
+
+        if self._db is not None:
+            await self._run(cleanup)
+            self._db.close()
+            self._db = None
+        await super().stop()
+
+    async def register(self, session_id: str) -> None:
+        await super().register(session_id)
+        await self._run(lambda db: db.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, worker_id) VALUES (?, ?)",
+            (session_id, self.worker_id),
+        ))
+
+    async def unregister(self, session_id: str) -> None:
+        await super().unregister(session_id)
+        if self._db is None:
+            return
+        await self._run(lambda db: db.execute(
+            "DELETE FROM sessions WHERE session_id = ? AND worker_id = ?",
+            (session_id, self.worker_id),
+        ))
+
+    def _owner(self, db: sqlite3.Connection, session_id: str) -> Optional[str]:
+        row = db.execute(
+            "SELECT s.worker_id FROM sessions s JOIN workers w ON w.worker_id = s.worker_id "
+            "WHERE s.session_id = ? AND w.heartbeat > ?",
+            (session_id, time.time() - self.stale_after),
+        ).fetchone()
+        return row[0] if row else None
+
+    async def owner(self, session_id: str) -> Optional[str]:
+        if session_id in self.local:
+            return self.worker_id
+        return await self._run(lambda db: self._owner(db, session_id))
+
+    async def publish(self, session_id: str, data: Dict[str, Any]) -> bool:
+        payload = json.dumps(data)
+
+        def insert(db: sqlite3.Connection) -> bool:
+            owner = self._owner(db, session_id)
+            if owner is None:
+                return False
+            db.execute(
+                "INSERT INTO outbox (worker_id, session_id, payload) VALUES (?, ?, ?)",
+                (owner, session_id, payload),
+            )
+            return True
+
+        published = await self._run(insert)
+        self.published += published
+        return published
+
+    def _take(self, db: sqlite3.Connection, beat: bool) -> List[Tuple[str, str]]:
+        if beat:
+            db.execute("UPDATE workers SET heartbeat = ? WHERE worker_id = ?", (time.time(), self.worker_id))
+        rows = db.execute(
+            "SELECT id, session_id, payload FROM outbox WHERE worker_id = ? ORDER BY id LIMIT ?",
+            (self.worker_id, self.batch_size),
+        ).fetchall()
+        if rows:
+            db.execute("DELETE FROM outbox WHERE worker_id = ? AND id <= ?", (self.worker_id, rows[-1][0]))
+        return [(session_id, payload) for _, session_id, payload in rows]
+
+    async def _poll(self) -> None:
+        last_beat = 0.0
+        while True:
+            now = time.monotonic()
+            beat = now - last_beat >= self.heartbeat_interval
+            if beat:
+                last_beat = now
+            try:
+                rows = await self._run(lambda db: self._take(db, beat))
+            except sqlite3.Error as e:
+                print(f"Error polling session outbox: {e}")
+                rows = []
+
+            for session_id, payload in rows:
+                try:
+                    self.delivered += await self._deliver(session_id, json.loads(payload))
+                except Exception as e:
+                    print(f"Error delivering to session {session_id}: {e}")
+
+            # drain a backlog right away, otherwise wait for the next poll
+            if len(rows) < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+
+def create_router(config: Dict[str, Any]) -> InMemorySessionRouter:
+    kind = config.get("session_router", "memory")
+    if kind == "memory":
+        return InMemorySessionRouter()
+    if kind == "sqlite":
+        return SqliteSessionRouter(
+            config.get("session_router_path", "sessions.db"),
+            poll_interval=config.get("session_router_poll_interval", 0.01),
+        )
+    raise ValueError(f"Unsupported session_router: {kind} (use 'memory' or 'sqlite')")
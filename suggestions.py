@@ -0,0 +1,245 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from ratelimit import TokenBucket
+
+
+# ---------- PROACTIVE SUGGESTIONS ----------
+
+# The companion reports what the user is doing as `context` events (active app,
+# window title, recent actions); the engine turns them into the `thinking_start`
+# and `suggestion` events of SERVER_SPEC.md:
+#
+#   - each event is merged into a small per-session context (app, title and the
+#     last max_actions distinct actions, all truncated to max_field_chars)
+#   - an event that leaves the context unchanged is dropped (deduplicated)
+#   - a change (re)starts a debounce timer; only when the context has been
+#     stable for debounce seconds is a suggestion computed, and never twice for
+#     the same context
+#   - LLM calls are limited by a token bucket per session (rate_per_min, burst)
+#     and one shared by all sessions (global_rate_per_min); when out of tokens
+#     the suggestion is deferred, and whatever the context is by then is used
+#   - at most one call per session is in flight; changes that arrive meanwhile
+#     are picked up after it finishes
+#
+# So the call rate is bounded by the budgets however chatty the event source is.
+#
+# config keys used (all optional):
+#
+#   "suggestions_enabled": True,
+#   "suggestion_backend": "gemini",
+#   "suggestion_debounce": 1.5,              # seconds the context must be stable
+#   "suggestion_rate_per_min": 4,            # LLM calls per session...
+#   "suggestion_burst": 1,
+#   "suggestion_global_rate_per_min": 120,   # ...and across all sessions (None = no cap)
+#   "suggestion_max_actions": 5,
+#   "suggestion_max_field_chars": 200,
+
+SUGGESTION_SYSTEM_PROMPT = (
+    "You watch which app the user is working in and what they just did, and offer "
+    "one short, concrete tip (a shortcut, a feature, a next step) that would help "
+    "right now. Reply with the tip only, in one or two sentences. If there is "
+    "nothing genuinely useful to say, reply with NONE."
+)
+
+NO_SUGGESTION = "NONE"
+
+# (session_id, messages) -> answer
+ChatFn = Callable[[str, List[Dict[str, str]]], Awaitable[str]]
+SendFn = Callable[[str, Dict[str, Any]], Awaitable[bool]]
+
+
+class SuggestionContext:
+    __slots__ = (
+        "app_name",
+        "window_title",
+        "actions",
+        "fingerprint",
+        "suggested",
+        "last_message",
+        "bucket",
+        "timer",
+        "task",
+    )
+
+    def __init__(self, max_actions: int, bucket: TokenBucket):
+        self.app_name = ""
+        self.window_title = ""
+        self.actions: Deque[str] = deque(maxlen=max_actions)
+        self.fingerprint = 0
+        # fingerprint of the context the last suggestion was computed for
+        self.suggested: Optional[int] = None
+        self.last_message = ""
+        self.bucket = bucket
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.task: Optional["asyncio.Task[None]"] = None
+
+    def describe(self) -> str:
+        lines = [f"App: {self.app_name or 'unknown'}"]
+        if self.window_title:
+            lines.append(f"Window: {self.window_title}")
+        if self.actions:
+            lines.append("Recent actions (oldest first):")
+            lines.extend(f"- {action}" for action in self.actions)
+        return "\n".join(lines)
+
+
+class SuggestionEngine:
+    def __init__(
+        self,
+        chat: ChatFn,
+        send: SendFn,
+        debounce: float = 1.5,
+        rate_per_min: float = 4,
+        burst: float = 1,
+        global_rate_per_min: Optional[float] = 120,
+        max_actions: int = 5,
+        max_field_chars: int = 200,
+    ):
+        self.chat = chat
+        self.send = send
+        self.debounce = debounce
+        self.rate_per_min = rate_per_min
+        self.burst = burst
+        self.global_bucket = (
+            TokenBucket(global_rate_per_min / 60.0, max(burst, 1)) if global_rate_per_min else None
+        )
+        self.max_actions = max_actions
+        self.max_field_chars = max_field_chars
+        self._contexts: Dict[str, SuggestionContext] = {}
+        self.events = 0
+        self.deduplicated = 0
+        self.deferred = 0
+        self.calls = 0
+        self.suggestions = 0
+        self.errors = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], chat: ChatFn, send: SendFn) -> "SuggestionEngine":
+        return cls(
+            chat,
+            send,
+            debounce=config.get("suggestion_debounce", 1.5),
+            rate_per_min=config.get("suggestion_rate_per_min", 4),
+            burst=config.get("suggestion_burst", 1),
+            global_rate_per_min=config.get("suggestion_global_rate_per_min", 120),
+            max_actions=config.get("suggestion_max_actions", 5),
+            max_field_chars=config.get("suggestion_max_field_chars", 200),
+        )
+
+    def _field(self, value: Any) -> str:
+        return " ".join(str(value).split())[: self.max_field_chars]
+
+    def update(self, session_id: str, data: Dict[str, Any]) -> bool:
+        """
+        Merge a context event ({"app_name", "window_title", "action"}, all optional).
+        Returns False if it didn't change anything.
+        """
+        self.events += 1
+        ctx = self._contexts.get(session_id)
+        if ctx is None:
+            ctx = self._contexts[session_id] = SuggestionContext(
+                self.max_actions, TokenBucket(self.rate_per_min / 60.0, self.burst)
+            )
+
+        if "app_name" in data:
+            app_name = self._field(data["app_name"])
+            if app_name != ctx.app_name:
+                # actions in the previous app don't describe this one
+                ctx.actions.clear()
+                ctx.window_title = ""
+            ctx.app_name = app_name
+        if "window_title" in data:
+            ctx.window_title = self._field(data["window_title"])
+        action = self._field(data.get("action") or "")
+        if action and (not ctx.actions or ctx.actions[-1] != action):
+            ctx.actions.append(action)
+
+        fingerprint = hash((ctx.app_name, ctx.window_title, tuple(ctx.actions)))
+        if fingerprint == ctx.fingerprint:
+            self.deduplicated += 1
+            return False
+        ctx.fingerprint = fingerprint
+
+        # debounce: wait for the context to settle
+        if ctx.timer is not None:
+            ctx.timer.cancel()
+        ctx.timer = asyncio.get_running_loop().call_later(self.debounce, self._fire, session_id)
+        return True
+
+    def _fire(self, session_id: str) -> None:
+        ctx = self._contexts.get(session_id)
+        if ctx is None:
+            return
+        ctx.timer = None
+        if ctx.task is not None or ctx.fingerprint == ctx.suggested:
+            # in flight (picked up when it finishes), or nothing new
+            return
+
+        now = time.monotonic()
+        wait = ctx.bucket.wait(now)
+        if self.global_bucket is not None:
+            wait = max(wait, self.global_bucket.wait(now))
+        if wait > 0:
+            self.deferred += 1
+            ctx.timer = asyncio.get_running_loop().call_later(wait, self._fire, session_id)
+            return
+
+        ctx.bucket.take()
+        if self.global_bucket is not None:
+            self.global_bucket.take()
+        ctx.suggested = ctx.fingerprint
+        ctx.task = asyncio.create_task(self._suggest(session_id, ctx, ctx.describe()))
+
+    async def _suggest(self, session_id: str, ctx: SuggestionContext, context: str) -> None:
+        self.calls += 1
+        try:
+            await self.send(session_id, {
+                "type": "thinking_start",
+                "session_id": session_id,
+                "data": {"context": ctx.app_name},
+            })
+            text = (await self.chat(session_id, [
+                {"role": "system", "content": SUGGESTION_SYSTEM_PROMPT},
+                {"role": "user", "content": context},
+            ])).strip()
+            if text and text.upper().rstrip(".") != NO_SUGGESTION and text != ctx.last_message:
+                ctx.last_message = text
+                self.suggestions += 1
+                await self.send(session_id, {
+                    "type": "suggestion",
+                    "session_id": session_id,
+                    "data": {"app_name": ctx.app_name, "message": text},
+                })
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            print(f"Error computing suggestion for {session_id}: {e}")
+        finally:
+            ctx.task = None
+            if self._contexts.get(session_id) is ctx and ctx.fingerprint != ctx.suggested and ctx.timer is None:
+                # the context moved on while we were busy
+                self._fire(session_id)
+
+    def discard(self, session_id: str) -> None:
+        ctx = self._contexts.pop(session_id, None)
+        if ctx is None:
+            return
+        if ctx.timer is not None:
+            ctx.timer.cancel()
+        if ctx.task is not None:
+            ctx.task.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._contexts),
+            "events": self.events,
+            "deduplicated": self.deduplicated,
+            "deferred": self.deferred,
+            "calls": self.calls,
+            "suggestions": self.suggestions,
+            "errors": self.errors,
+        }
@@ -0,0 +1,12 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run(coro):
+    """
+    Run a coroutine on a fresh event loop (no pytest asyncio plugin needed).
+    """
+    return asyncio.run(coro)
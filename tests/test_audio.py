@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from audio import AudioFormat, PcmResampler, encode_for_upstream
+
+
+def pcm(seconds: float, rate: int, channels: int) -> bytes:
+    t = np.arange(int(rate * seconds)) / rate
+    mono = (8000 * np.sin(2 * np.pi * 440 * t)).astype("<i2")
+    return np.repeat(mono, channels).tobytes()
+
+
+def encode_in_chunks(data: bytes, fmt: AudioFormat, dst_rate: int, chunk_bytes: int) -> bytes:
+    resampler = PcmResampler(fmt.sample_rate, dst_rate, fmt.channels)
+    out = b""
+    for i in range(0, len(data), chunk_bytes):
+        payload, _ = encode_for_upstream(data[i:i + chunk_bytes], fmt, dst_rate, resampler=resampler)
+        out += bytes(payload)
+    return out
+
+
+@pytest.mark.parametrize("rate, channels", [(16000, 1), (48000, 1), (24000, 2)])
+@pytest.mark.parametrize("chunk_bytes", [321, 999, 4097])
+def test_misaligned_chunks_keep_every_sample(rate, channels, chunk_bytes):
+    fmt = AudioFormat("pcm_s16le", rate, channels)
+    data = pcm(0.5, rate, channels)
+    whole, _ = encode_for_upstream(data, fmt, 16000, resampler=PcmResampler(rate, 16000, channels))
+    assert encode_in_chunks(data, fmt, 16000, chunk_bytes) == bytes(whole)
+
+
+def test_output_length_counts_the_carried_partial_frame():
+    resampler = PcmResampler(16000, 16000, 2)
+    assert len(resampler.process(bytes(7))) == 1
+    assert resampler.output_length(1) == 1
+    assert len(resampler.process(bytes(1))) == 1
+
+
+@pytest.mark.parametrize("rate, channels", [(24000, 1), (48000, 2)])
+def test_chunk_shorter_than_a_frame_comes_out_empty(rate, channels):
+    fmt = AudioFormat("pcm_s16le", rate, channels)
+    resampler = PcmResampler(rate, 16000, channels)
+    data = pcm(0.1, rate, channels)
+    payload, _ = encode_for_upstream(data[:1], fmt, 16000, resampler=resampler)
+    assert bytes(payload) == b""
+    # and the byte is still there for the next chunk
+    rest, _ = encode_for_upstream(data[1:], fmt, 16000, resampler=resampler)
+    whole, _ = encode_for_upstream(data, fmt, 16000, resampler=PcmResampler(rate, 16000, channels))
+    assert bytes(rest) == bytes(whole)
+
+
+def test_one_byte_utterance_is_not_an_error():
+    payload, mime_type = encode_for_upstream(b"\x01", AudioFormat("pcm_s16le", 24000, 1), 16000, container="wav")
+    assert mime_type == "audio/wav"
+    assert len(payload) == 44
@@ -0,0 +1,63 @@
+import struct
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from audio_codec import RICE_HEADER, RICE_VERSION, RAW, RiceDecoder, RiceEncoder
+
+
+def speech(frames: int, channels: int = 1) -> bytes:
+    t = np.arange(frames) / 16000
+    mono = (6000 * np.sin(2 * np.pi * 220 * t) + 500 * np.sin(2 * np.pi * 3100 * t)).astype("<i2")
+    return np.repeat(mono, channels).tobytes()
+
+
+@pytest.mark.parametrize("channels", [1, 2])
+def test_rice_round_trip(channels):
+    pcm = speech(4000, channels)
+    chunk = RiceEncoder(16000, channels).encode(pcm)
+    assert len(chunk) < len(pcm)
+    assert RiceDecoder(16000, channels).decode(chunk, max_bytes=len(pcm)) == pcm
+
+
+def test_forged_frame_count_is_rejected_before_allocating():
+    chunk = bytearray(RiceEncoder(16000).encode(speech(4000)))
+    # claim 2**32 - 1 frames over a 100 KB chunk
+    struct.pack_into("<I", chunk, 3, 0xFFFFFFFF)
+    chunk += bytes(100_000)
+
+    tracemalloc.start()
+    try:
+        for max_bytes in (None, 48000 * 60):
+            with pytest.raises(ValueError):
+                RiceDecoder(16000).decode(bytes(chunk), max_bytes=max_bytes)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 5_000_000
+
+
+@pytest.mark.parametrize("body", [
+    # raw chunk shorter than its header says
+    RICE_HEADER.pack(RICE_VERSION, 1, RAW, 100) + bytes(10),
+    # order 0, 1000 samples: 4 partitions, but too few unary bytes for them
+    RICE_HEADER.pack(RICE_VERSION, 1, 0, 1000) + bytes(4) + struct.pack("<I", 10) + bytes(10),
+    # unary length past the end of the chunk
+    RICE_HEADER.pack(RICE_VERSION, 1, 0, 8) + bytes(1) + struct.pack("<I", 1000) + bytes(4),
+    # enough unary bytes, but no stop bits in them
+    RICE_HEADER.pack(RICE_VERSION, 1, 0, 8) + bytes(1) + struct.pack("<I", 1) + bytes(1),
+    # truncated header, no channels
+    RICE_HEADER.pack(RICE_VERSION, 1, 0, 8)[:4],
+    RICE_HEADER.pack(RICE_VERSION, 0, 0, 8) + bytes(8),
+])
+def test_malformed_rice_chunks_raise_value_error(body):
+    with pytest.raises(ValueError):
+        RiceDecoder(16000).decode(body)
+
+
+def test_chunk_over_the_remaining_budget_is_rejected():
+    pcm = speech(4000)
+    chunk = RiceEncoder(16000).encode(pcm)
+    with pytest.raises(ValueError, match="allowed"):
+        RiceDecoder(16000).decode(chunk, max_bytes=len(pcm) - 2)
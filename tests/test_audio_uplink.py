@@ -0,0 +1,45 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import app as server
+from config import config
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # no upstream: audio turns would go to the buffered path, and none should start
+    monkeypatch.setitem(config, "live_sessions", False)
+    with TestClient(server.app) as client:
+        yield client
+
+
+def frames_until_pong(ws):
+    frames = []
+    ws.send_json({"type": "ping"})
+    while True:
+        frame = ws.receive_json()
+        if frame["type"] == "pong":
+            return frames
+        frames.append(frame)
+
+
+@pytest.mark.parametrize("legacy", [False, True])
+def test_corrupt_compressed_chunk_gives_one_error_and_no_turn(client, legacy):
+    with client.websocket_connect("/ws") as ws:
+        assert ws.receive_json()["type"] == "session_started"
+        if legacy:
+            ws.send_json({"type": "audio_format", "encoding": "rice", "sample_rate": 16000, "channels": 1})
+            assert ws.receive_json()["type"] == "audio_format"
+        else:
+            ws.send_json({"type": "audio_start", "encoding": "rice", "sample_rate": 16000, "channels": 1})
+        # unknown rice chunk version
+        ws.send_bytes(b"\x09" + bytes(64))
+        if not legacy:
+            ws.send_bytes(b"\x09" + bytes(64))
+            ws.send_json({"type": "audio_end"})
+
+        frames = frames_until_pong(ws)
+
+    errors = [f for f in frames if f["type"] == "error"]
+    assert [e["code"] for e in errors] == ["bad_audio"]
+    assert not [f for f in frames if f["type"] in ("status", "response", "response_delta", "response_end")]
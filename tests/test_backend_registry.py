@@ -0,0 +1,57 @@
+from backend_registry import BackendRegistry
+
+
+class StubClient:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_lease_returns_the_pooled_client():
+    registry = BackendRegistry()
+    with registry.lease("gemini-live", None, StubClient, api_key="k") as leased:
+        assert registry.get("gemini-live", None, StubClient, api_key="k") is leased
+    assert registry.stats()["created"] == 1
+
+
+def test_lru_eviction_waits_for_the_last_lease():
+    registry = BackendRegistry(max_clients=1)
+    with registry.lease("gemini-live", None, StubClient, api_key="a") as first:
+        with registry.lease("gemini-live", None, StubClient, api_key="a"):
+            # pushes the leased client out of the cache
+            second = registry.get("gemini-live", None, StubClient, api_key="b")
+            assert registry.stats()["retired"] == 1
+        assert not first.closed
+    assert first.closed
+    assert not second.closed
+    assert registry.stats()["retired"] == 0
+
+
+def test_unleased_clients_are_closed_on_lru_eviction():
+    registry = BackendRegistry(max_clients=1)
+    first = registry.get("gemini", "m", StubClient, api_key="a")
+    registry.get("gemini", "m", StubClient, api_key="b")
+    assert first.closed
+
+
+def test_idle_eviction_skips_leased_clients():
+    registry = BackendRegistry(idle_ttl=10.0)
+    with registry.lease("gemini-live", None, StubClient, api_key="a") as leased:
+        idle = registry.get("gemini", "m", StubClient)
+        # both last used long ago
+        for entry in registry._clients.values():
+            entry.last_used -= 60.0
+        assert registry.evict_idle() == 1
+        assert idle.closed and not leased.closed
+        assert registry.get("gemini-live", None, StubClient, api_key="a") is leased
+
+
+def test_clear_closes_retired_clients():
+    registry = BackendRegistry(max_clients=1)
+    with registry.lease("gemini-live", None, StubClient, api_key="a") as leased:
+        registry.get("gemini-live", None, StubClient, api_key="b")
+        registry.clear()
+        assert leased.closed
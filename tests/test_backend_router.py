@@ -0,0 +1,184 @@
+import asyncio
+from typing import Dict, List
+
+import pytest
+
+from conftest import run
+from backend_router import CLOSED, HALF_OPEN, OPEN, BackendRouter, NoBackendAvailable
+from ratelimit import Usage, add_usage, current_usage
+
+
+class StubBackends:
+    """
+    call(backend) for BackendRouter.chat: each backend answers after its delay,
+    reports one output token per call, or raises its error.
+    """
+
+    def __init__(self, delays: Dict[str, float], errors: Dict[str, BaseException] = None):
+        self.delays = delays
+        self.errors = errors or {}
+        self.calls: List[str] = []
+        self.cancelled: List[str] = []
+
+    async def __call__(self, backend: str) -> str:
+        self.calls.append(backend)
+        try:
+            await asyncio.sleep(self.delays.get(backend, 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(backend)
+            raise
+        if backend in self.errors:
+            raise self.errors[backend]
+        add_usage(1, 1)
+        return f"answer from {backend}"
+
+
+def router(**kwargs) -> BackendRouter:
+    kwargs.setdefault("backends", ("a", "b", "c"))
+    kwargs.setdefault("audio_backends", ("c",))
+    return BackendRouter(**kwargs)
+
+
+# ---------- FALLBACK ----------
+
+@pytest.mark.parametrize("error", [RuntimeError("upstream 500"), asyncio.TimeoutError()])
+def test_falls_back_on_error_or_timeout(error):
+    r = router()
+    stub = StubBackends({}, {"a": error})
+    assert run(r.chat("a", stub)) == "answer from b"
+    assert stub.calls == ["a", "b"]
+    assert r.fallbacks == 1
+    assert r.health("a").failures == 1 and r.health("b").failures == 0
+
+
+def test_raises_the_last_error_when_every_backend_fails():
+    r = router()
+    stub = StubBackends({}, {"a": RuntimeError("a down"), "b": RuntimeError("b down"), "c": RuntimeError("c down")})
+    with pytest.raises(RuntimeError, match="c down"):
+        run(r.chat("a", stub))
+    assert stub.calls == ["a", "b", "c"]
+
+
+def test_audio_requests_only_fall_back_to_audio_backends():
+    r = router()
+    assert r.candidates("a", audio=True) == ["a", "c"]
+
+
+def test_stream_falls_back_before_its_first_chunk():
+    r = router()
+
+    async def open_stream(backend: str):
+        if backend == "a":
+            raise RuntimeError("a down")
+        yield f"{backend}-1"
+        yield f"{backend}-2"
+
+    async def main():
+        return [chunk async for chunk in r.stream("a", open_stream)]
+
+    assert run(main()) == ["b-1", "b-2"]
+    assert r.fallbacks == 1
+
+
+# ---------- HEDGING ----------
+
+def test_losing_hedge_is_cancelled_and_not_counted():
+    r = router(backends=("a", "b"), hedge_delay=0.01)
+    stub = StubBackends({"a": 0.5, "b": 0.02})
+
+    async def main():
+        usage = Usage()
+        current_usage.set(usage)
+        answer = await r.chat("a", stub)
+        # the loser has had every chance to finish by now
+        await asyncio.sleep(0.05)
+        return answer, usage
+
+    answer, usage = run(main())
+    assert answer == "answer from b"
+    assert stub.calls == ["a", "b"]
+    assert stub.cancelled == ["a"]
+    assert (usage.input_tokens, usage.output_tokens) == (1, 1)
+    assert (r.hedges, r.hedge_wins) == (1, 1)
+    # cancelled, not failed
+    assert r.health("a").failures == 0 and r.health("a").errors == 0
+
+
+def test_no_hedge_when_the_first_backend_answers_in_time():
+    r = router(hedge_delay=0.05)
+    stub = StubBackends({"a": 0.0, "b": 0.0})
+    assert run(r.chat("a", stub)) == "answer from a"
+    assert stub.calls == ["a"]
+    assert r.hedges == 0
+
+
+# ---------- CIRCUIT BREAKER ----------
+
+def fail(r: BackendRouter, backend: str) -> None:
+    stub = StubBackends({}, {backend: RuntimeError(f"{backend} down")})
+    run(r.chat(backend, stub))
+
+
+def cool_down(r: BackendRouter, backend: str) -> None:
+    r.health(backend).opened_at -= r.cooldown
+
+
+def test_breaker_opens_after_consecutive_failures():
+    r = router(failure_threshold=3)
+    for _ in range(2):
+        fail(r, "a")
+        assert r.health("a").state == CLOSED
+    fail(r, "a")
+    assert r.health("a").state == OPEN
+    assert r.candidates("a") == ["b", "c"]
+
+
+def test_breaker_half_opens_after_cooldown_and_closes_on_success():
+    r = router(failure_threshold=1, cooldown=30.0)
+    fail(r, "a")
+    assert r.health("a").state == OPEN
+    cool_down(r, "a")
+    assert r.candidates("a") == ["a", "b", "c"]
+    assert r.health("a").state == HALF_OPEN
+
+    assert run(r.chat("a", StubBackends({}))) == "answer from a"
+    assert r.health("a").state == CLOSED
+    assert r.health("a").failures == 0
+
+
+def test_breaker_reopens_when_the_half_open_probe_fails():
+    r = router(failure_threshold=2, cooldown=30.0)
+    fail(r, "a")
+    fail(r, "a")
+    cool_down(r, "a")
+    r.candidates("a")
+    assert r.health("a").state == HALF_OPEN
+
+    fail(r, "a")
+    assert r.health("a").state == OPEN
+    assert "a" not in r.candidates("a")
+
+
+def test_half_open_lets_one_probe_through_at_a_time():
+    r = router(failure_threshold=1, cooldown=30.0)
+    fail(r, "a")
+    cool_down(r, "a")
+
+    async def main():
+        stub = StubBackends({"a": 0.05})
+        probe = asyncio.ensure_future(r.chat("a", stub))
+        await asyncio.sleep(0.01)
+        during_probe = r.candidates("a")
+        await probe
+        return during_probe
+
+    assert run(main()) == ["b", "c"]
+    assert r.health("a").state == CLOSED
+
+
+def test_no_backend_available_when_every_breaker_is_open():
+    r = router(backends=("a",), failure_threshold=1)
+    with pytest.raises(RuntimeError):
+        fail(r, "a")
+    with pytest.raises(NoBackendAvailable):
+        run(r.chat("a", StubBackends({})))
@@ -0,0 +1,22 @@
+import asyncio
+import gc
+
+from conftest import run
+import app as server
+
+
+def test_background_tasks_are_held_until_done(capsys):
+    async def fails():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("summary failed")
+
+    async def main():
+        server.run_in_background(fails())
+        server.run_in_background(asyncio.sleep(0.01))
+        gc.collect()
+        held = len(server.background_tasks)
+        await asyncio.sleep(0.05)
+        return held, len(server.background_tasks)
+
+    assert run(main()) == (2, 0)
+    assert "summary failed" in capsys.readouterr().out
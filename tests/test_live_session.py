@@ -0,0 +1,386 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any, List, Optional
+
+from conftest import run
+from audio import AudioFormat
+from live_session import LiveAudioPipe, LiveSession, LiveSessionManager
+from ratelimit import Usage, current_usage
+from vad import VadGate
+
+
+# ---------- FAKE LIVE ENDPOINT ----------
+
+def message(
+    text: Optional[str] = None,
+    audio: Optional[bytes] = None,
+    transcript: Optional[str] = None,
+    turn_complete: bool = False,
+    usage: Optional[tuple] = None,
+) -> SimpleNamespace:
+    """
+    One server message shaped like google.genai.types.LiveServerMessage.
+    """
+    parts = []
+    if text is not None:
+        parts.append(SimpleNamespace(text=text, inline_data=None))
+    if audio is not None:
+        parts.append(SimpleNamespace(text=None, inline_data=SimpleNamespace(data=audio)))
+    content = SimpleNamespace(
+        model_turn=SimpleNamespace(parts=parts) if parts else None,
+        output_transcription=SimpleNamespace(text=transcript) if transcript else None,
+        turn_complete=turn_complete,
+    )
+    usage_metadata = None
+    if usage is not None:
+        usage_metadata = SimpleNamespace(prompt_token_count=usage[0], response_token_count=usage[1])
+    return SimpleNamespace(server_content=content, usage_metadata=usage_metadata)
+
+
+class FakeLiveConnection:
+    """
+    Records what is sent; receive() plays back the next scripted turn.
+    """
+
+    def __init__(self, turns: List[List[SimpleNamespace]]):
+        self.turns = list(turns)
+        self.sent: List[Any] = []
+
+    async def send_realtime_input(self, **kwargs: Any) -> None:
+        self.sent.append(("realtime", kwargs))
+
+    async def send_client_content(self, **kwargs: Any) -> None:
+        self.sent.append(("content", kwargs))
+
+    async def receive(self):
+        for msg in self.turns.pop(0) if self.turns else []:
+            await asyncio.sleep(0)
+            yield msg
+
+
+class FakeConnect:
+    """
+    Async context manager standing in for client.aio.live.connect(...).
+    """
+
+    def __init__(self, connection: FakeLiveConnection, modalities: Optional[List[str]] = None):
+        self.connection = connection
+        self.modalities = modalities
+        self.entered = False
+        self.exited = False
+
+    async def __aenter__(self) -> FakeLiveConnection:
+        self.entered = True
+        return self.connection
+
+    async def __aexit__(self, *exc: Any) -> None:
+        self.exited = True
+
+
+class FakeConnector:
+    """
+    ConnectFn for LiveSessionManager that hands out a new FakeConnect per call.
+    """
+
+    def __init__(self, turns: Optional[List[List[SimpleNamespace]]] = None):
+        self.turns = turns or []
+        self.opened: List[FakeConnect] = []
+
+    def __call__(self, system_prompt: Optional[str], modalities: Optional[List[str]]) -> FakeConnect:
+        cm = FakeConnect(FakeLiveConnection(self.turns), modalities)
+        self.opened.append(cm)
+        return cm
+
+
+async def collect(live: LiveSession) -> List[Any]:
+    return [(event.text, event.audio) async for event in live.receive_turn()]
+
+
+# ---------- LiveSession.receive_turn ----------
+
+def test_receive_turn_yields_text_audio_and_transcription():
+    turn = [
+        message(text="Hello"),
+        message(audio=b"\x01\x02"),
+        message(transcript="spoken words"),
+        message(turn_complete=True),
+        message(text="next turn, never read"),
+    ]
+
+    async def main():
+        live = await LiveSession("s1", FakeConnect(FakeLiveConnection([turn]))).open()
+        events = await collect(live)
+        return events, live.turns
+
+    events, turns = run(main())
+    assert events == [("Hello", None), (None, b"\x01\x02"), ("spoken words", None)]
+    assert turns == 1
+
+
+def test_receive_turn_reports_the_last_usage_of_the_turn():
+    turn = [
+        message(text="a", usage=(10, 1)),
+        message(text="b", usage=(10, 5)),
+        message(turn_complete=True),
+    ]
+
+    async def main():
+        usage = Usage()
+        current_usage.set(usage)
+        live = await LiveSession("s1", FakeConnect(FakeLiveConnection([turn]))).open()
+        await collect(live)
+        return usage
+
+    usage = run(main())
+    assert (usage.input_tokens, usage.output_tokens) == (10, 5)
+
+
+def test_receive_turn_times_out_without_turn_complete():
+    class Silent(FakeLiveConnection):
+        async def receive(self):
+            await asyncio.sleep(10)
+            yield message(turn_complete=True)
+
+    async def main():
+        live = await LiveSession("s1", FakeConnect(Silent([])), turn_timeout=0.01).open()
+        await collect(live)
+
+    try:
+        run(main())
+    except asyncio.TimeoutError:
+        pass
+    else:
+        raise AssertionError("receive_turn should time out")
+
+
+def test_send_text_and_audio():
+    async def main():
+        connection = FakeLiveConnection([])
+        live = await LiveSession("s1", FakeConnect(connection)).open()
+        await live.send_text("hi")
+        await live.send_audio(b"\x00\x00", "audio/pcm;rate=16000")
+        await live.end_audio()
+        return connection.sent
+
+    sent = run(main())
+    assert [kind for kind, _ in sent] == ["content", "realtime", "realtime"]
+    assert sent[0][1]["turn_complete"] is True
+    assert sent[0][1]["turns"].parts[0].text == "hi"
+    assert sent[1][1]["audio"].mime_type == "audio/pcm;rate=16000"
+    assert sent[2][1] == {"audio_stream_end": True}
+
+
+# ---------- LiveSessionManager ----------
+
+def test_manager_reuses_the_connection():
+    async def main():
+        connect = FakeConnector()
+        sessions = LiveSessionManager(connect)
+        first = await sessions.get("s1", "prompt", ["TEXT"])
+        second = await sessions.get("s1", "prompt", ["TEXT"])
+        both = await asyncio.gather(sessions.get("s2"), sessions.get("s2"))
+        return connect, first, second, both
+
+    connect, first, second, both = run(main())
+    assert first is second
+    assert both[0] is both[1]
+    assert len(connect.opened) == 2
+
+
+def test_manager_reconnects_when_modalities_change():
+    async def main():
+        connect = FakeConnector()
+        sessions = LiveSessionManager(connect)
+        text = await sessions.get("s1", None, ["TEXT"])
+        audio = await sessions.get("s1", None, ["AUDIO"])
+        return connect, text, audio, len(sessions)
+
+    connect, text, audio, open_sessions = run(main())
+    assert text is not audio
+    assert audio.modalities == ["AUDIO"]
+    assert [cm.modalities for cm in connect.opened] == [["TEXT"], ["AUDIO"]]
+    assert connect.opened[0].exited and not connect.opened[1].exited
+    assert open_sessions == 1
+
+
+def test_manager_forgets_a_failed_connection():
+    class Failing(FakeConnect):
+        async def __aenter__(self):
+            raise ConnectionError("refused")
+
+    async def main():
+        attempts = []
+
+        def connect(system_prompt, modalities):
+            attempts.append(modalities)
+            return Failing(FakeLiveConnection([])) if len(attempts) == 1 else FakeConnect(FakeLiveConnection([]))
+
+        sessions = LiveSessionManager(connect)
+        try:
+            await sessions.get("s1")
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError("the first connection should fail")
+        await sessions.get("s1")
+        return len(attempts), len(sessions)
+
+    assert run(main()) == (2, 1)
+
+
+def test_discard_and_close_all():
+    async def main():
+        connect = FakeConnector()
+        sessions = LiveSessionManager(connect)
+        await sessions.get("s1")
+        await sessions.get("s2")
+        await sessions.get("s3")
+        sessions.discard("s1")
+        sessions.discard("unknown")
+        for _ in range(3):
+            await asyncio.sleep(0)
+        after_discard = [cm.exited for cm in connect.opened]
+        await sessions.close_all()
+        return after_discard, [cm.exited for cm in connect.opened], len(sessions)
+
+    after_discard, after_close_all, remaining = run(main())
+    assert after_discard == [True, False, False]
+    assert after_close_all == [True, True, True]
+    assert remaining == 0
+
+
+# ---------- LiveAudioPipe ----------
+
+PCM16K = AudioFormat("pcm_s16le", 16000, 1)
+
+
+def test_pipe_finish_without_audio_returns_false():
+    async def main():
+        connection = FakeLiveConnection([])
+        live = await LiveSession("s1", FakeConnect(connection)).open()
+        pipe = LiveAudioPipe(live, PCM16K, 16000)
+        return await pipe.finish(), connection.sent
+
+    spoke, sent = run(main())
+    assert spoke is False
+    assert sent == []
+
+
+def test_pipe_finish_with_only_silence_returns_false():
+    async def main():
+        connection = FakeLiveConnection([])
+        live = await LiveSession("s1", FakeConnect(connection)).open()
+        pipe = LiveAudioPipe(live, PCM16K, 16000, VadGate(16000))
+        await pipe.feed(bytes(6400))
+        return await pipe.finish(), pipe.removed, connection.sent
+
+    spoke, removed, sent = run(main())
+    assert spoke is False
+    assert removed == 6400
+    assert sent == []
+
+
+def test_pipe_sends_audio_and_ends_the_stream():
+    async def main():
+        connection = FakeLiveConnection([])
+        live = await LiveSession("s1", FakeConnect(connection)).open()
+        pipe = LiveAudioPipe(live, PCM16K, 16000)
+        await pipe.feed(b"\x10\x00" * 160)
+        return await pipe.finish(), pipe.sent_bytes, connection.sent
+
+    spoke, sent_bytes, sent = run(main())
+    assert spoke is True
+    assert sent_bytes == 320
+    assert sent[0][1]["audio"].data == b"\x10\x00" * 160
+    assert sent[-1][1] == {"audio_stream_end": True}
+
+
+def test_discard_forgets_the_connection_right_away():
+    async def main():
+        connect = FakeConnector()
+        sessions = LiveSessionManager(connect)
+        first = await sessions.get("s1")
+        sessions.discard("s1")
+        second = await sessions.get("s1")
+        await asyncio.sleep(0)
+        return first, second
+
+    first, second = run(main())
+    assert second is not first
+    assert first.closed and not second.closed
+
+
+# ---------- PIPING NEXT TO A TURN IN FLIGHT ----------
+
+def live_app_session(monkeypatch, busy: bool):
+    import app as server
+    from config import config
+    from session import Job, Session
+
+    monkeypatch.setitem(config, "live_sessions", True)
+    monkeypatch.setattr(server, "limiter", None)
+    monkeypatch.setattr(server, "live_sessions", LiveSessionManager(FakeConnector()))
+    session = Session("s1", lambda frame: None)
+    session.audio_format = server.DEFAULT_AUDIO_FORMAT
+    if busy:
+        session.current = Job("m1", lambda: None)
+    return server, session
+
+
+def test_audio_start_pipes_into_an_idle_session(monkeypatch):
+    server, session = live_app_session(monkeypatch, busy=False)
+    run(server.on_audio_start(session, {"type": "audio_start"}))
+    assert session.audio_pipe is not None
+    assert session.audio.store is False
+
+
+def test_audio_start_buffers_while_a_turn_is_in_flight(monkeypatch):
+    server, session = live_app_session(monkeypatch, busy=True)
+    run(server.on_audio_start(session, {"type": "audio_start"}))
+    assert session.audio_pipe is None
+    assert session.audio.store is True
+    assert len(server.live_sessions) == 0
+
+
+def test_piped_reply_fails_fast_once_its_connection_is_gone(monkeypatch):
+    server, _ = live_app_session(monkeypatch, busy=False)
+
+    async def main():
+        live = await server.live_sessions.get("s1")
+        server.live_sessions.discard("s1")
+        await asyncio.sleep(0)
+        await asyncio.wait_for(server.respond_live("s1", "m1", False, live=live), 1.0)
+
+    try:
+        run(main())
+    except RuntimeError as e:
+        assert "closed before the reply" in str(e)
+    else:
+        raise AssertionError("respond_live should refuse a closed connection")
+
+
+def test_manager_reconnects_when_modalities_change_while_opening():
+    class Slow(FakeConnect):
+        async def __aenter__(self):
+            await asyncio.sleep(0.02)
+            return await super().__aenter__()
+
+    async def main():
+        opened = []
+
+        def connect(system_prompt, modalities):
+            opened.append(Slow(FakeLiveConnection([]), modalities))
+            return opened[-1]
+
+        sessions = LiveSessionManager(connect)
+        text = asyncio.ensure_future(sessions.get("s1", None, ["TEXT"]))
+        await asyncio.sleep(0)
+        audio = await sessions.get("s1", None, ["AUDIO"])
+        await text
+        await asyncio.sleep(0.05)
+        return opened, audio, await sessions.get("s1", None, ["AUDIO"])
+
+    opened, audio, again = run(main())
+    assert [cm.modalities for cm in opened] == [["TEXT"], ["AUDIO"]]
+    assert audio.modalities == ["AUDIO"] and again is audio
+    assert opened[0].exited and not opened[1].exited
@@ -0,0 +1,18 @@
+from metrics import Metrics
+
+
+def test_render_is_empty_with_metrics_off():
+    metrics = Metrics()
+    metrics.configure({"metrics_enabled": False})
+    metrics.add_collector(lambda: ["companion_admission_queue_depth 3"])
+    assert metrics.render() == ""
+
+
+def test_render_includes_collectors_with_metrics_on():
+    metrics = Metrics()
+    metrics.configure({"metrics_enabled": True})
+    metrics.add_collector(lambda: ["companion_admission_queue_depth 3"])
+    metrics.observe("turn", 0.01, "gemini")
+    text = metrics.render()
+    assert 'companion_stage_seconds_count{stage="turn",backend="gemini"} 1' in text
+    assert "companion_admission_queue_depth 3" in text
@@ -0,0 +1,99 @@
+import asyncio
+from typing import Any, Dict, List
+
+from conftest import run
+from session import Job, Session
+
+
+class Recorder:
+    def __init__(self):
+        self.frames: List[Dict[str, Any]] = []
+        self.ran: List[str] = []
+
+    async def send(self, frame: Dict[str, Any]) -> None:
+        self.frames.append(frame)
+
+    def job(self, message_id: str, seconds: float = 0.02) -> Job:
+        async def work() -> None:
+            await asyncio.sleep(seconds)
+            self.ran.append(message_id)
+
+        return Job(message_id, work)
+
+    def codes(self) -> List[Any]:
+        return [(f["type"], f.get("code"), f["message_id"]) for f in self.frames]
+
+
+async def drain(session: Session) -> None:
+    while session._worker is not None:
+        await asyncio.sleep(0.005)
+
+
+def test_queue_runs_jobs_in_order_and_refuses_past_max_queue():
+    rec = Recorder()
+
+    async def main():
+        session = Session("s1", rec.send, max_queue=2, busy_policy="queue")
+        for message_id in ("m1", "m2", "m3"):
+            assert await session.submit(rec.job(message_id))
+            await asyncio.sleep(0)
+        assert not await session.submit(rec.job("m4"))
+        await drain(session)
+
+    run(main())
+    assert rec.ran == ["m1", "m2", "m3"]
+    assert rec.codes() == [("error", "queue_full", "m4")]
+
+
+def test_cancelled_queued_jobs_free_their_place():
+    rec = Recorder()
+
+    async def main():
+        session = Session("s1", rec.send, max_queue=2, busy_policy="queue")
+        await session.submit(rec.job("m1"))
+        await asyncio.sleep(0)
+        for message_id in ("m2", "m3"):
+            await session.submit(rec.job(message_id))
+            assert await session.cancel(message_id)
+        assert await session.submit(rec.job("m4"))
+        assert await session.submit(rec.job("m5"))
+        await drain(session)
+
+    run(main())
+    assert rec.ran == ["m1", "m4", "m5"]
+    assert rec.codes() == [("cancelled", None, "m2"), ("cancelled", None, "m3")]
+
+
+def test_replace_cancels_the_running_and_queued_jobs():
+    rec = Recorder()
+
+    async def main():
+        session = Session("s1", rec.send, max_queue=1, busy_policy="replace")
+        await session.submit(rec.job("m1", seconds=1.0))
+        await asyncio.sleep(0)
+        await session.submit(rec.job("m2"))
+        assert await session.submit(rec.job("m3"))
+        await drain(session)
+        return session
+
+    session = run(main())
+    assert rec.ran == ["m3"]
+    assert sorted(rec.codes()) == [("cancelled", None, "m1"), ("cancelled", None, "m2")]
+    assert not session.queue and not session.busy
+
+
+def test_reject_refuses_while_busy():
+    rec = Recorder()
+
+    async def main():
+        session = Session("s1", rec.send, busy_policy="reject")
+        await session.submit(rec.job("m1"))
+        await asyncio.sleep(0)
+        assert not await session.submit(rec.job("m2"))
+        await drain(session)
+        assert await session.submit(rec.job("m3"))
+        await drain(session)
+
+    run(main())
+    assert rec.ran == ["m1", "m3"]
+    assert rec.codes() == [("error", "busy", "m2")]
@@ -0,0 +1,48 @@
+import asyncio
+
+from conftest import run
+from utils import coalesce_deltas
+
+
+def test_slow_consumer_holds_the_upstream_back():
+    produced = []
+    closed = []
+
+    async def upstream():
+        try:
+            for i in range(10_000):
+                produced.append(i)
+                yield "x" * 40
+        finally:
+            closed.append(True)
+
+    async def main():
+        deltas = coalesce_deltas(upstream(), max_pending=4)
+        await deltas.__anext__()
+        # a stalled socket: nothing read for a while
+        await asyncio.sleep(0.05)
+        read_ahead = len(produced)
+        await deltas.aclose()
+        return read_ahead
+
+    read_ahead = run(main())
+    assert read_ahead <= 1 + 4 + 1
+    assert closed == [True]
+
+
+def test_deltas_are_batched_and_errors_raised():
+    async def upstream():
+        for delta in ("a", "b", "c", "d"):
+            yield delta
+        raise RuntimeError("upstream broke")
+
+    async def main():
+        out = []
+        try:
+            async for text in coalesce_deltas(upstream(), min_chars=2, max_delay=1.0):
+                out.append(text)
+        except RuntimeError as e:
+            return out, str(e)
+        return out, None
+
+    assert run(main()) == (["a", "bc"], "upstream broke")
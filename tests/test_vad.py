@@ -0,0 +1,55 @@
+import numpy as np
+
+from vad import VadGate
+
+
+RATE = 16000
+
+
+def tone(ms: int, amplitude: int = 8000) -> bytes:
+    t = np.arange(RATE * ms // 1000) / RATE
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype("<i2").tobytes()
+
+
+def silence(ms: int) -> bytes:
+    return bytes(RATE * ms // 1000 * 2)
+
+
+def gate_chunks(gate: VadGate, pcm: bytes, chunk_bytes: int) -> bytes:
+    out = []
+    for i in range(0, len(pcm), chunk_bytes):
+        out += gate.feed(pcm[i:i + chunk_bytes])
+    out += gate.finish()
+    return b"".join(bytes(c) for c in out)
+
+
+def test_sub_frame_chunks_are_classified_as_speech():
+    pcm = silence(500) + tone(500) + silence(500)
+    # 10 ms chunks against 20 ms frames
+    sent = gate_chunks(VadGate(RATE, frame_ms=20, padding_ms=100), pcm, 320)
+    assert tone(500) in sent
+    assert len(sent) < len(pcm)
+
+
+def test_every_byte_is_sent_or_removed_whatever_the_chunk_size():
+    pcm = silence(300) + tone(400) + silence(60) + tone(200) + silence(400)
+    for chunk_bytes in (100, 320, 330, 1000, 4410):
+        gate = VadGate(RATE, padding_ms=100)
+        sent = gate_chunks(gate, pcm, chunk_bytes)
+        assert tone(400) + silence(60) + tone(200) in sent
+        assert len(sent) + gate.removed == len(pcm)
+
+
+def test_finish_sends_the_unfinished_frame_after_speech():
+    gate = VadGate(RATE, padding_ms=100)
+    speech = tone(100)
+    assert b"".join(bytes(c) for c in gate.feed(speech + speech[:200])) == speech
+    assert [bytes(c) for c in gate.finish()] == [speech[:200]]
+    assert gate.removed == 0
+
+
+def test_finish_discards_the_unfinished_frame_of_silence():
+    gate = VadGate(RATE)
+    assert gate.feed(silence(5)) == []
+    assert gate.finish() == []
+    assert gate.removed == len(silence(5))
@@ -1,6 +1,94 @@
+import asyncio
+from typing import AsyncIterator, List, Optional, Tuple
+
+
 async def call_llm(text: str) -> str:
     """
     LLM call here.
     Echo for now
     """
-    return f"You said: {text}"
\ No newline at end of file
+    return f"You said: {text}"
+
+
+async def coalesce_deltas(
+    deltas: AsyncIterator[str],
+    min_chars: int = 32,
+    max_delay: float = 0.05,
+    max_pending: int = 16,
+) -> AsyncIterator[str]:
+    """
+    Batch small text deltas so a chatty model doesn't cause one send per token.
+
+    - the first delta is passed through immediately (time-to-first-token)
+    - after that, text is buffered until it reaches min_chars
+      or has been waiting for max_delay seconds, whichever comes first
+    - at most max_pending deltas are read ahead of the caller, so a slow
+      consumer (a stalled socket) slows the upstream stream down too
+    """
+    loop = asyncio.get_running_loop()
+    # One task drains the upstream generator: it holds the backend semaphore,
+    # the admission slot and the SDK stream, which must be entered and left in
+    # the same task, and it is closed (aclose) as soon as we stop, not on GC.
+    queue: "asyncio.Queue[Tuple[Optional[str], Optional[BaseException]]]" = asyncio.Queue(max_pending)
+
+    async def produce() -> None:
+        it = deltas.__aiter__()
+        try:
+            async for delta in it:
+                await queue.put((delta, None))
+            await queue.put((None, None))
+        except Exception as e:
+            await queue.put((None, e))
+        finally:
+            aclose = getattr(it, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    producer = asyncio.create_task(produce())
+    buf: List[str] = []
+    size = 0
+    deadline: Optional[float] = None
+    first = True
+
+    try:
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                delta, error = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                # max_delay elapsed while the model was quiet: flush what we have
+                yield "".join(buf)
+                buf.clear()
+                size = 0
+                deadline = None
+                continue
+
+            if error is not None:
+                raise error
+            if delta is None:
+                break
+            if not delta:
+                continue
+
+            if first:
+                first = False
+                yield delta
+                continue
+
+            buf.append(delta)
+            size += len(delta)
+            if deadline is None:
+                deadline = loop.time() + max_delay
+
+            if size >= min_chars:
+                yield "".join(buf)
+                buf.clear()
+                size = 0
+                deadline = None
+
+        if buf:
+            yield "".join(buf)
+    finally:
+        # wait for the upstream generator to be closed before returning
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
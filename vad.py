@@ -0,0 +1,233 @@
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+import numpy as np
+
+from audio import AudioBuffer, BytesLike
+
+
+# ---------- VOICE ACTIVITY DETECTION ----------
+
+# Push-to-talk clips usually start and end with silence that we would otherwise
+# ship upstream. Frames are classified with a vectorized energy + zero-crossing
+# test over int16 PCM (no per-sample Python loop):
+#
+#   - voiced speech:   frame energy above energy_db
+#   - unvoiced speech: a bit quieter (energy_db - 10 dB) but with a high
+#                      zero-crossing rate (fricatives like "s", "f")
+#
+# Speech frames are padded by padding_ms on both sides so onsets and word
+# endings aren't clipped. Pauses longer than max_pause_ms (if set) are cut down
+# to that padding.
+
+UNVOICED_MARGIN_DB = 10.0
+UNVOICED_MIN_ZCR = 0.25
+
+
+def speech_frames(
+    pcm: BytesLike,
+    sample_rate: int,
+    channels: int = 1,
+    frame_ms: int = 20,
+    energy_db: float = -45.0,
+) -> np.ndarray:
+    """
+    Return one bool per frame_ms frame: True where the frame looks like speech.
+    """
+    frame_len = max(1, sample_rate * frame_ms // 1000) * channels
+    samples = np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2)
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool)
+
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+
+    # Energy in dBFS (float32 is plenty and halves the memory traffic)
+    as_float = frames.astype(np.float32)
+    rms = np.sqrt(np.einsum("ij,ij->i", as_float, as_float) / frame_len)
+    db = 20.0 * np.log10(rms / 32768.0 + 1e-10)
+
+    # Fraction of sign changes between consecutive samples
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame_len - 1 or 1)
+
+    voiced = db > energy_db
+    unvoiced = (db > energy_db - UNVOICED_MARGIN_DB) & (zcr > UNVOICED_MIN_ZCR)
+    return voiced | unvoiced
+
+
+def speech_ranges(
+    active: np.ndarray,
+    frame_bytes: int,
+    total_bytes: int,
+    padding_frames: int = 10,
+    max_pause_frames: Optional[int] = None,
+) -> List[Tuple[int, int]]:
+    """
+    Turn per-frame activity into byte ranges worth keeping.
+    Empty list means there is no speech at all.
+    """
+    if not active.any():
+        return []
+
+    # Pad speech on both sides (dilation via convolution)
+    if padding_frames:
+        kernel = np.ones(2 * padding_frames + 1, dtype=np.int32)
+        active = np.convolve(active.astype(np.int32), kernel, mode="same") > 0
+
+    # Run boundaries: starts where 0 -> 1, ends where 1 -> 0
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    if max_pause_frames is None:
+        # Trim only the leading / trailing silence
+        starts, ends = starts[:1], ends[-1:]
+    else:
+        # Merge runs separated by short pauses, keep long pauses as cuts
+        gaps = starts[1:] - ends[:-1]
+        keep = gaps > max_pause_frames
+        starts = np.concatenate((starts[:1], starts[1:][keep]))
+        ends = np.concatenate((ends[:-1][keep], ends[-1:]))
+
+    ranges = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        end_byte = total_bytes if end == len(active) else end * frame_bytes
+        ranges.append((start * frame_bytes, end_byte))
+    return ranges
+
+
+def trim_in_place(
+    buffer: AudioBuffer,
+    sample_rate: int,
+    channels: int = 1,
+    frame_ms: int = 20,
+    energy_db: float = -45.0,
+    padding_ms: int = 200,
+    max_pause_ms: Optional[int] = None,
+) -> int:
+    """
+    Drop silence from the utterance held in `buffer` by compacting the speech
+    ranges to the front of its storage (no new allocation). Returns the number
+    of bytes removed; the whole utterance is removed if it has no speech.
+    """
+    view = buffer.view()
+    frame_bytes = max(1, sample_rate * frame_ms // 1000) * channels * 2
+    active = speech_frames(view, sample_rate, channels, frame_ms, energy_db)
+    ranges = speech_ranges(
+        active,
+        frame_bytes,
+        len(view),
+        padding_frames=padding_ms // frame_ms,
+        max_pause_frames=None if max_pause_ms is None else max_pause_ms // frame_ms,
+    )
+
+    before = buffer.size
+    data = np.frombuffer(view, dtype=np.uint8)
+    write = 0
+    for start, end in ranges:
+        if start != write:
+            # left-moving copy within the same buffer; numpy handles the overlap
+            data[write:write + end - start] = data[start:end]
+        write += end - start
+
+    del data, view
+    buffer.size = write
+    return before - write
+
+
+class VadGate:
+    """
+    Streaming version of trim_in_place for audio piped into a live session:
+
+    - leading silence is dropped, apart from a padding_ms pre-roll
+    - the first padding_ms of silence after speech is forwarded (word endings)
+    - later silence is held back and only forwarded if speech resumes
+      (capped to a pre-roll when max_pause_ms is set)
+    - whatever is still held when the utterance ends is discarded
+
+    Only whole frame_ms frames are classified: the tail of a chunk that doesn't
+    fill a frame is kept and completes the next one, so clients sending chunks
+    shorter than a frame are gated like any other.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        channels: int = 1,
+        frame_ms: int = 20,
+        energy_db: float = -45.0,
+        padding_ms: int = 200,
+        max_pause_ms: Optional[int] = None,
+    ):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_ms = frame_ms
+        self.energy_db = energy_db
+        self.frame_bytes = max(1, sample_rate * frame_ms // 1000) * channels * 2
+        self.padding_bytes = sample_rate * padding_ms // 1000 * channels * 2
+        self.cap_pauses = max_pause_ms is not None
+        self.speech_started = False
+        self.removed = 0
+        self._silence = 0
+        self._held: Deque[BytesLike] = deque()
+        self._held_bytes = 0
+        # start of a frame that the next chunk completes
+        self._partial = b""
+
+    def feed(self, chunk: BytesLike) -> List[BytesLike]:
+        """
+        Classify one chunk and return the chunks that should go upstream now.
+        """
+        if self._partial:
+            chunk = self._partial + bytes(chunk)
+        whole = len(chunk) - len(chunk) % self.frame_bytes
+        if whole < len(chunk):
+            self._partial = bytes(memoryview(chunk)[whole:])
+            chunk = memoryview(chunk)[:whole]
+        else:
+            self._partial = b""
+        if not whole:
+            return []
+
+        active = speech_frames(chunk, self.sample_rate, self.channels, self.frame_ms, self.energy_db)
+        if active.any():
+            out = list(self._held)
+            out.append(chunk)
+            self._held.clear()
+            self._held_bytes = 0
+            self._silence = 0
+            self.speech_started = True
+            return out
+
+        if self.speech_started and self._silence < self.padding_bytes:
+            # hangover right after speech
+            self._silence += len(chunk)
+            return [chunk]
+
+        self._held.append(chunk)
+        self._held_bytes += len(chunk)
+
+        if not self.speech_started or self.cap_pauses:
+            # only keep a pre-roll in front of the next speech
+            while len(self._held) > 1 and self._held_bytes - len(self._held[0]) >= self.padding_bytes:
+                dropped = self._held.popleft()
+                self._held_bytes -= len(dropped)
+                self.removed += len(dropped)
+        return []
+
+    def finish(self) -> List[BytesLike]:
+        """
+        End of utterance: discard trailing silence. Returns the last chunk to send
+        (the unfinished frame, if it follows speech without a held pause), if any.
+        """
+        out: List[BytesLike] = []
+        if self._partial and self.speech_started and not self._held:
+            out.append(self._partial)
+        else:
+            self.removed += len(self._partial)
+        self._partial = b""
+        self.removed += self._held_bytes
+        self._held.clear()
+        self._held_bytes = 0
+        return out